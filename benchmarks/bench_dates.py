@@ -0,0 +1,47 @@
+"""
+Micro-benchmark of the date heading parser. Run from the repository root:
+python benchmarks/bench_dates.py
+"""
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import dates
+
+HEADINGS = ["Vandaag", "Gisteren", "maandag 12 juni", "zondag 11 juni", "zaterdag 10 juni", "vrijdag 9 juni",
+            "donderdag 8 juni", "woensdag 7 juni 2023", "dinsdag 6 juni", "1 december 2022"]
+
+
+def rate(stmt, number: int) -> float:
+    return number * len(HEADINGS) / timeit.timeit(stmt, number=number)
+
+
+def main():
+    now = datetime.datetime(2023, 6, 14, 12, 0)
+
+    def parse_all():
+        for heading in HEADINGS:
+            dates.parse_heading_date(heading, now=now)
+
+    def parse_all_cold():
+        dates._parse_heading.cache_clear()
+        parse_all()
+
+    start = timeit.default_timer()
+    import dateparser
+    print(f"dateparser import: {timeit.default_timer() - start:.3f}s")
+
+    def dateparser_all():
+        for heading in HEADINGS:
+            dateparser.parse(heading, languages=["nl"])
+
+    print(f"parse_heading_date (memoized): {rate(parse_all, 20000):>12,.0f} headings/s")
+    print(f"parse_heading_date (cold):     {rate(parse_all_cold, 2000):>12,.0f} headings/s")
+    print(f"dateparser.parse (nl):         {rate(dateparser_all, 20):>12,.0f} headings/s")
+
+
+if __name__ == "__main__":
+    main()
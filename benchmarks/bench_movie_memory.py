@@ -0,0 +1,62 @@
+"""
+Memory benchmark of 100k movie records as the former dicts and as slotted Movies. Run from the repository root:
+python benchmarks/bench_movie_memory.py
+"""
+import datetime
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import Movie, FILMVANDAAG_HOST
+
+NUM_RECORDS = 100_000
+GENRES = ["Actie", "Thriller", "Drama", "Komedie", "Horror", "Documentaire", "Familie", "Animatie"]
+SERVICES = ["netflix", "disney", "amazon", "pathe"]
+DATE = datetime.datetime(2023, 6, 14)
+
+
+def raw_fields(i: int) -> dict:
+    # strings are built per record, like the parser gets them from the html
+    return {"title": f"Movie title number {i}",
+            "year": str(1950 + i % 73),
+            "rating": 5 + (i % 50) / 10,
+            "num_votes": 1000 + i,
+            "genres": [f"{GENRES[i % 8]}", f"{GENRES[(i + 3) % 8]}"],
+            "director": f"Director {i % 2000}",
+            "path": f"/film/{100000 + i}-movie-title-number-{i}",
+            "service": f"{SERVICES[i % 4]}"}
+
+
+def as_dict(f: dict) -> dict:
+    return {"rating": f["rating"], "num_votes": f["num_votes"], "date": DATE, "release_year": f["year"],
+            "title": f["title"], "genres": f["genres"], "director": f["director"], "service": f["service"],
+            "url": f"{FILMVANDAAG_HOST}{f['path']}"}
+
+
+def as_movie(f: dict) -> Movie:
+    return Movie.create(title=f["title"], release_year=f["year"], rating=f["rating"], num_votes=f["num_votes"],
+                        genres=f["genres"], director=f["director"], path=f["path"], service=f["service"], date=DATE)
+
+
+def measure(build) -> int:
+    tracemalloc.start()
+    records = [build(raw_fields(i)) for i in range(NUM_RECORDS)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return size
+
+
+def main():
+    dict_size = measure(as_dict)
+    movie_size = measure(as_movie)
+    print(f"{NUM_RECORDS:,} records")
+    print(f"dict:  {dict_size / 2**20:8.1f} MiB ({dict_size / NUM_RECORDS:6.0f} B/record)")
+    print(f"Movie: {movie_size / 2**20:8.1f} MiB ({movie_size / NUM_RECORDS:6.0f} B/record)")
+    print(f"saved: {1 - movie_size / dict_size:8.1%}")
+
+
+if __name__ == "__main__":
+    main()
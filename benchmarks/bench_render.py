@@ -0,0 +1,92 @@
+"""
+Telegram API calls and rendering time per 20-movie page of show_more_movies. Run from the repository root:
+python benchmarks/bench_render.py
+"""
+import os
+import sys
+import timeit
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from telegram.utils.helpers import escape_markdown
+
+import bot
+import scraper
+from models import Movie
+
+PAGES = 10
+ROUNDS = 200
+
+
+def make_movies(n: int) -> list:
+    return [Movie.create(title=f"Movie (part {i}) - the *sequel*", release_year=str(1990 + i % 30),
+                         rating=5 + (i % 50) / 10, num_votes=10000 + i, genres=["Actie"], director=None,
+                         path=f"/film/{100000 + i}-movie-{i}") for i in range(n)]
+
+
+def escaped_line(movie) -> str:
+    # how show_more_movies rendered every line before the render cache
+    movie_line = f"[*{escape_markdown(movie.title, version=2)}*]({movie.url})"
+    movie_line += f" \\({movie.release_year}\\)"
+    movie_line += f" imdb *{escape_markdown(str(movie.rating), version=2)}*"
+    return movie_line
+
+
+class Cursor:
+    def __init__(self, movies):
+        self.movies = movies
+
+    def next_batch(self, fv_scraper, size):
+        batch, self.movies = self.movies[:size], self.movies[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+class Recorder:
+    """Stands in for the outbox and the Telegram objects, counts the API calls."""
+
+    def __init__(self):
+        self.calls = 0
+        self.message = types.SimpleNamespace(chat_id=1, reply_text=self.call)
+        self.query = types.SimpleNamespace(data="1900", from_user=types.SimpleNamespace(id=1), message=self.message,
+                                           answer=lambda **kwargs: None, edit_message_text=self.call,
+                                           edit_message_reply_markup=self.call)
+
+    def call(self, **kwargs):
+        pass
+
+    def submit(self, chat_id, func, *args, **kwargs):
+        self.calls += 1
+
+
+def api_calls_per_page(fv_bot) -> float:
+    recorder = Recorder()
+    fv_bot.outbox = recorder
+    context = types.SimpleNamespace(user_data={"movies_cursor": Cursor(make_movies(PAGES * bot.MOVIE_SEARCH_BATCH_SIZE
+                                                                                   + 1))})
+    update = types.SimpleNamespace(callback_query=recorder.query)
+    pages = 0
+    while fv_bot.show_more_movies(update, context) == bot.SHOW_MOVIES:
+        pages += 1
+    return recorder.calls / (pages + 1)
+
+
+def main():
+    fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:bench"}, scraper.FilmVandaagScraper({}))
+    page = make_movies(bot.MOVIE_SEARCH_BATCH_SIZE)
+    escaped = timeit.timeit(lambda: [escaped_line(m) for m in page], number=ROUNDS) / ROUNDS
+    bot.render_movie_line.cache_clear()
+    cold = timeit.timeit(lambda: [bot.movie_line(m) for m in page], number=1)
+    warm = timeit.timeit(lambda: [bot.movie_line(m) for m in page], number=ROUNDS) / ROUNDS
+    print(f"render per page, escape every line: {escaped * 1e6:8.1f} us")
+    print(f"render per page, cache cold:        {cold * 1e6:8.1f} us")
+    print(f"render per page, cache warm:        {warm * 1e6:8.1f} us")
+    print(f"API calls per page, before:         {(1 + 2 * (PAGES - 1)) / PAGES:8.2f}")  # a reply, then edit + reply
+    print(f"API calls per page, now:            {api_calls_per_page(fv_bot):8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Build time, memory and lookup latency of the title index at 50k titles. Run from the repository root:
+python benchmarks/bench_title_index.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from models import Movie
+from titleindex import TitleIndex
+
+NUM_TITLES = 50_000
+NUM_QUERIES = 2_000
+SERVICES = ["netflix", "disney", "amazon", "pathe"]
+COMMON_WORDS = ["the", "of", "a", "de", "het", "and", "en", "in", "van", "to", "my", "la"]
+# letter frequencies of English text, in percent
+LETTERS = {"e": 12.7, "t": 9.1, "a": 8.2, "o": 7.5, "i": 7.0, "n": 6.7, "s": 6.3, "h": 6.1, "r": 6.0, "d": 4.3,
+           "l": 4.0, "c": 2.8, "u": 2.8, "m": 2.4, "w": 2.4, "f": 2.2, "g": 2.0, "y": 2.0, "p": 1.9, "b": 1.5,
+           "v": 1.0, "k": 0.8, "j": 0.2, "x": 0.2, "q": 0.1, "z": 0.1}
+
+
+def make_words(rng: random.Random, n: int) -> list[str]:
+    # made up words with the letter frequencies of real ones
+    letters, weights = list(LETTERS), list(LETTERS.values())
+    return ["".join(rng.choices(letters, weights, k=rng.randint(3, 9))) for _ in range(n)]
+
+
+def make_movies(rng: random.Random) -> list[Movie]:
+    words, names = make_words(rng, 20_000), make_words(rng, 2_000)
+    movies = []
+    for i in range(NUM_TITLES):
+        title_words = [rng.choice(words) for _ in range(rng.randint(1, 4))]
+        if rng.random() < 0.4:
+            title_words.insert(0, rng.choice(COMMON_WORDS))
+        title = " ".join(title_words).title()
+        director = f"{rng.choice(names).title()} {rng.choice(names).title()}"
+        movies.append(Movie.create(title=title, release_year=str(1950 + i % 74), rating=5 + (i % 50) / 10,
+                                   num_votes=1000 + i, genres=[], director=director,
+                                   path=f"/film/{100000 + i}-movie-{i}", service=SERVICES[i % 4]))
+    return movies
+
+
+def typo(word: str, rng: random.Random) -> str:
+    i = rng.randrange(len(word))
+    return word[:i] + word[i + 1:] if len(word) > 4 else word
+
+
+def make_queries(movies: list[Movie], rng: random.Random) -> dict[str, list[str]]:
+    sample = rng.sample(movies, NUM_QUERIES)
+    return {"exact": [m.title for m in sample],
+            "prefix": [m.title[:max(3, len(m.title) // 2)] for m in sample],
+            "typo": [" ".join(typo(w, rng) for w in m.title.split()) for m in sample],
+            "director": [m.director for m in sample],
+            "title+year": [f"{m.title} {m.release_year}" for m in sample]}
+
+
+def main():
+    rng = random.Random(42)
+    movies = make_movies(rng)
+    start = time.perf_counter()
+    index = TitleIndex()
+    index.add(movies)
+    build_seconds = time.perf_counter() - start
+    tracemalloc.start()
+    traced = TitleIndex()  # built again, tracing slows the build down
+    traced.add(movies)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del traced
+    print(f"{NUM_TITLES:,} titles, {len(index._postings):,} trigrams")
+    print(f"build:  {build_seconds:.2f}s ({build_seconds / NUM_TITLES * 1e6:.1f} us/title)")
+    print(f"memory: {size / 2**20:.1f} MiB ({size / NUM_TITLES:.0f} B/title, the movies included)")
+
+    start = time.perf_counter()
+    for movie in rng.sample(movies, 1000):
+        index.add([movie], service="amazon")
+    print(f"update: {(time.perf_counter() - start) / 1000 * 1e6:.1f} us/title")
+
+    print(f"{'query':>10} {'p50':>8} {'p99':>8} {'found':>6}")
+    for kind, queries in make_queries(movies, rng).items():
+        latencies, found = [], 0
+        for query in queries:
+            start = time.perf_counter()
+            matches = index.search(query)
+            latencies.append(time.perf_counter() - start)
+            found += bool(matches)
+        latencies.sort()
+        print(f"{kind:>10} {statistics.median(latencies) * 1e3:>6.3f}ms "
+              f"{latencies[int(len(latencies) * 0.99)] * 1e3:>6.3f}ms {found / len(queries):>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Load test of the bot: simulated users click through /zoek and /nieuw conversations, a few "meer" pages each, against
+the local Telegram and filmvandaag stand-ins. Run from the repository root:
+python benchmarks/load_bot.py [--users 50] [--think 0.5] [--compare benchmarks/results/<earlier run>.json]
+The bot gets its updates through its webhook listener, like in webhook mode. Everything runs in this process, so the
+peak RSS includes the stand-ins and the simulated users. Results are written as JSON to benchmarks/results/.
+"""
+import argparse
+import collections
+import datetime
+import json
+import logging
+import os
+import platform
+import queue
+import random
+import resource
+import socket
+import sys
+import threading
+import time
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "tests"))
+
+import bot
+import scraper
+import standin
+import telegram_standin
+from run import RESULTS_DIR, compare
+
+TOKEN = "123456:load-test"
+WEBHOOK_PATH = "updates"
+HANDLERS = ["search_movies", "handle_input_genres", "handle_input_imdb_score", "handle_input_release_year",
+            "new_movies", "handle_input_services", "show_more_movies", "handle_waiting", "handle_timeout", "cancel"]
+
+# what the bot's answer to a step is
+QUESTION, PAGE, END, BUSY, TIMEOUT, ERROR = "question", "page", "end", "busy", "timeout", "error"
+
+
+def classify(call: telegram_standin.ApiCall):
+    """
+    :return: what the bot answered with the call, None for calls that are not an answer, like removing a keyboard
+    """
+    if call.method == "answerCallbackQuery":
+        return BUSY if call.params.get("text") else None
+    if "Duurt laaaaang" in call.text:
+        return TIMEOUT
+    if bot.ERROR_TEXT in call.text:
+        return ERROR
+    if "erg druk" in call.text:
+        return BUSY
+    if any(button["text"] == "meer" for button in call.buttons):
+        return PAGE
+    if bot.END_OF_RESULTS in call.text:
+        return END
+    if call.buttons:
+        return QUESTION
+    return None
+
+
+class LoadStats:
+
+    def __init__(self) -> None:
+        self.latencies = collections.defaultdict(list)  # step -> seconds until the bot answered
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"LoadStats({dict(self.counts)})"
+
+    def record(self, step: str, seconds: float) -> None:
+        with self._lock:
+            self.latencies[step].append(seconds)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] += 1
+
+
+class SimulatedUser:
+    """
+    A user in their private chat with the bot, answering every question after think seconds (jittered) and waiting at
+    most reply_timeout seconds for the bot's answer to a step.
+    """
+
+    def __init__(self, user_id: int, webhook_url: str, api: telegram_standin.TelegramStandIn, stats: LoadStats,
+                 rng: random.Random, args: argparse.Namespace) -> None:
+        self.user_id = user_id
+        self.webhook_url = webhook_url
+        self.calls = api.calls(user_id)
+        self.stats = stats
+        self.rng = rng
+        self.args = args
+        self.session = requests.Session()
+
+    def __repr__(self):
+        return f"SimulatedUser(user_id={self.user_id})"
+
+    def run(self) -> None:
+        for _ in range(self.args.conversations):
+            command = "zoek" if self.rng.random() < self.args.zoek_share else "nieuw"
+            while not self.calls.empty():  # late answers of an earlier conversation
+                self.calls.get()
+            self.stats.count(f"{command}_conversations")
+            outcome = self.zoek() if command == "zoek" else self.nieuw()
+            self.stats.count(outcome)
+            self.think()
+
+    def zoek(self) -> str:
+        answer, call = self.step("command", telegram_standin.command_update(self.user_id, "/zoek"), QUESTION)
+        for step in ("genre", "score"):
+            if answer != QUESTION:
+                return answer
+            answer, call = self.click(step, call, QUESTION)
+        return self.pages(call) if answer == QUESTION else answer
+
+    def nieuw(self) -> str:
+        answer, call = self.step("command", telegram_standin.command_update(self.user_id, "/nieuw"), QUESTION)
+        return self.pages(call) if answer == QUESTION else answer
+
+    def pages(self, question: telegram_standin.ApiCall) -> str:
+        """
+        Answer the last question, which shows the first page, then tap "meer" for the next pages.
+        :return: outcome of the conversation
+        """
+        answer, call = self.click("first_page", question, PAGE)
+        for _ in range(self.args.pages):
+            if answer != PAGE:
+                break
+            answer, call = self.click("more", call, PAGE)
+        if answer == END:
+            return "completed"
+        return self.abandon() if answer == PAGE else answer
+
+    def abandon(self) -> str:
+        """
+        Stop tapping "meer" and wait for the conversation to time out, a new command is ignored until then.
+        """
+        deadline = time.perf_counter() + self.args.conv_timeout + self.args.reply_timeout
+        while (remaining := deadline - time.perf_counter()) > 0:
+            try:
+                if classify(self.calls.get(timeout=remaining)) == TIMEOUT:
+                    return "abandoned"
+            except queue.Empty:
+                break
+        return "unanswered"
+
+    def click(self, step: str, message: telegram_standin.ApiCall, expected: str):
+        """
+        Tap a random button of the message, other than "Stop maar".
+        """
+        self.think()
+        data = self.rng.choice([b["callback_data"] for b in message.buttons if b["callback_data"] != bot.RESP_QUIT])
+        return self.step(step, telegram_standin.callback_update(self.user_id, message.message_id, data), expected)
+
+    def step(self, step: str, update: dict, expected: str):
+        """
+        Post the update and wait for the bot's answer. A busy answer is retried after thinking.
+        :return: (answer, ApiCall) or ("unanswered", None)
+        """
+        start = time.perf_counter()
+        deadline = start + self.args.reply_timeout
+        self.post(update)
+        while True:
+            try:
+                call = self.calls.get(timeout=max(0.0, deadline - time.perf_counter()))
+            except queue.Empty:
+                return "unanswered", None
+            answer = classify(call)
+            if answer == BUSY:
+                self.stats.count("busy")
+                self.think()
+                if "callback_query" in update:
+                    update = telegram_standin.callback_update(self.user_id, update["callback_query"]["message"]
+                                                              ["message_id"], update["callback_query"]["data"])
+                self.post(update)
+            elif answer == expected or (expected == PAGE and answer == END):
+                self.stats.record(step, call.received - start)
+                return answer, call
+            elif answer is not None:
+                return answer, call
+
+    def post(self, update: dict) -> None:
+        self.session.post(self.webhook_url, json=update, timeout=self.args.reply_timeout).raise_for_status()
+
+    def think(self) -> None:
+        time.sleep(self.rng.uniform(0.5, 1.5) * self.args.think)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_listener(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def percentiles(latencies: list[float]) -> dict:
+    latencies = sorted(latencies)
+    at = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1e3
+    return {"count": len(latencies), "p50_ms": at(0.5), "p95_ms": at(0.95), "p99_ms": at(0.99),
+            "max_ms": latencies[-1] * 1e3}
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kB on Linux
+
+
+def run_load(args: argparse.Namespace) -> dict:
+    fv_standin = standin.StandIn(latency=args.latency, search_pages=args.search_pages).start()
+    api = telegram_standin.TelegramStandIn(latency=args.api_latency).start()
+    port = free_port()
+    bot_config = {"TG_FV_BOT_TOKEN": TOKEN, "TG_API_URL": api.base_url, "FILMVANDAAG_HOST": fv_standin.url,
+                  "BOT_MODE": "webhook", "WEBHOOK_URL": f"http://127.0.0.1:{port}", "WEBHOOK_PATH": WEBHOOK_PATH,
+                  "WEBHOOK_LISTEN": "127.0.0.1", "WEBHOOK_PORT": port, "BOT_WORKERS": args.workers,
+                  "IMDB_VOTES_THRESHOLD": 0, "NEW_MOVIES_THRESHOLD_DAYS": 100000, "NEW_MOVIES_MIN_RATING": 0,
+                  "OUTBOUND_GLOBAL_RATE": args.global_rate}
+    bot.CONV_TIMEOUT = args.conv_timeout  # read when the conversation handlers are made
+    fv_bot = bot.FilmVandaagBot(bot_config, scraper.FilmVandaagScraper(bot_config))
+    stats = LoadStats()
+    try:
+        fv_bot.start()
+        wait_for_listener(port)
+        rss_before = peak_rss_mb()
+        rng = random.Random(args.seed)
+        users = [SimulatedUser(1000 + i, f"http://127.0.0.1:{port}/{WEBHOOK_PATH}", api, stats,
+                               random.Random(rng.random()), args) for i in range(args.users)]
+        threads = [threading.Thread(target=user.run, name=f"user-{user.user_id}", daemon=True) for user in users]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+            time.sleep(args.ramp / args.users)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        fv_bot.updater.stop()
+        fv_bot.outbox.close(timeout=5)
+        api.stop()
+        fv_standin.stop()
+
+    steps = [seconds for latencies in stats.latencies.values() for seconds in latencies]
+    conversations = args.users * args.conversations
+    return {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+            "seconds": elapsed,
+            "throughput": {"steps_per_sec": len(steps) / elapsed, "conversations_per_sec": conversations / elapsed},
+            # timeouts and unanswered steps happened while a user waited for the bot, abandoned conversations were left
+            # open by their user on purpose
+            "outcomes": {name: stats.counts[name]
+                         for name in ("completed", "abandoned", TIMEOUT, "unanswered", ERROR, BUSY,
+                                      "zoek_conversations", "nieuw_conversations")},
+            "latency": {"all": percentiles(steps) if steps else {},
+                        **{step: percentiles(latencies) for step, latencies in sorted(stats.latencies.items())}},
+            # estimated from the buckets of the bot's handler histogram
+            "handlers": {handler: {"count": bot.HANDLER_SECONDS.count(handler=handler),
+                                   **{f"p{round(q * 100)}_ms": bot.HANDLER_SECONDS.quantile(q, handler=handler) * 1e3
+                                      for q in (0.5, 0.95, 0.99)}}
+                         for handler in HANDLERS if bot.HANDLER_SECONDS.count(handler=handler)},
+            "api_calls": dict(api.requests),
+            "filmvandaag_requests": fv_standin.requests,
+            "rss_before_load_mb": rss_before,
+            "peak_rss_mb": peak_rss_mb()}
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Load test of the bot's conversations.")
+    argparser.add_argument("--users", type=int, default=20, help="Simulated users, each in their own chat.")
+    argparser.add_argument("--conversations", type=int, default=3, help="Conversations per user.")
+    argparser.add_argument("--pages", type=int, default=3, help='"meer" taps per conversation. A conversation '
+                                                                'with more results is left to time out.')
+    argparser.add_argument("--zoek-share", type=float, default=0.5, help="Share of /zoek conversations, the rest "
+                                                                         "is /nieuw.")
+    argparser.add_argument("--think", type=float, default=0.5, help="Mean seconds a user takes to answer.")
+    argparser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which the users start.")
+    argparser.add_argument("--reply-timeout", type=float, default=60.0, help="Seconds a user waits for an answer.")
+    argparser.add_argument("--conv-timeout", type=float, default=bot.CONV_TIMEOUT,
+                           help="Conversation timeout of the bot in seconds.")
+    argparser.add_argument("--workers", type=int, default=bot.BOT_WORKERS, help="Dispatcher workers of the bot.")
+    argparser.add_argument("--global-rate", type=float, default=25.0, help="Outbound messages per second.")
+    argparser.add_argument("--latency", type=float, default=0.05, help="Filmvandaag stand-in delay in seconds.")
+    argparser.add_argument("--api-latency", type=float, default=0.0, help="Telegram stand-in delay in seconds.")
+    argparser.add_argument("--search-pages", type=int, default=20)
+    argparser.add_argument("--seed", type=int, default=42)
+    argparser.add_argument("--output", help="Result file. Default: benchmarks/results/load-<timestamp>.json")
+    argparser.add_argument("--compare", help="Earlier result file to compare with.")
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    results = run_load(args)
+    print(json.dumps(results, indent=2))
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{results['timestamp'].replace(':', '')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
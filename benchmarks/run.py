@@ -0,0 +1,134 @@
+"""
+Offline scraper benchmarks against the local filmvandaag stand-in. Run from the repository root:
+python benchmarks/run.py [--latency 0.02] [--compare benchmarks/results/<earlier run>.json]
+Results are written as JSON to benchmarks/results/.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "tests"))
+
+import config
+import dates
+import parsing
+import scraper
+import standin
+
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+# no caching, every benchmark round fetches and parses again
+UNCACHED = {"NEW_MOVIES_CACHE_TTL": 0, "SEARCH_CACHE_TTL": 0}
+
+
+def bench_new_movies_pages(host: str, rounds: int) -> dict:
+    fv_scraper = scraper.FilmVandaagScraper(dict(UNCACHED, FILMVANDAAG_HOST=host))
+    services = config.streaming_services
+    start = time.perf_counter()
+    for _ in range(rounds):
+        movies = list(fv_scraper.scrape_new_movies(services, added_days_ago=100000, votes_threshold=0))
+    elapsed = time.perf_counter() - start
+    return {"pages_per_sec": rounds * len(services) / elapsed, "movies_per_page": len(movies) / len(services)}
+
+
+def bench_parse(rounds: int) -> dict:
+    pages = {service: standin.read_fixture(f"new_movies_{service}.html").decode()
+             for service in config.streaming_services}
+    results = {}
+    for backend in parsing.PARSER_BACKENDS:
+        for strained in (True, False):
+            parser = parsing.ListingParser(backend, strained)
+            num_movies = 0
+            start = time.perf_counter()
+            for _ in range(rounds):
+                for service, html in pages.items():
+                    # like FilmVandaagScraper._crawl_new_movies: the items, their dates and then the movies
+                    now = datetime.datetime.now()
+                    for heading, li in parser.new_movie_items(html):
+                        date = dates.parse_heading_date(heading, now=now)
+                        num_movies += parsing.parse_movie_item(li, service=service, date=date) is not None
+            elapsed = time.perf_counter() - start
+            results[f"{parser.backend}{'+strained' if strained else ''}"] = {"us_per_movie": elapsed / num_movies * 1e6}
+    return results
+
+
+def bench_dateparse(rounds: int) -> dict:
+    import dateparser
+    headings = ["Vandaag", "Gisteren", "maandag 12 juni", "zondag 11 juni 2023", "vrijdag 30 december"]
+    now = datetime.datetime(2023, 6, 14, 12, 0)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        dates._parse_heading.cache_clear()
+        for heading in headings:
+            dates.parse_heading_date(heading, now=now)
+    fast = (time.perf_counter() - start) / (rounds * len(headings))
+    start = time.perf_counter()
+    for heading in headings:
+        dateparser.parse(heading, languages=["nl"])
+    slow = (time.perf_counter() - start) / len(headings)
+    return {"us_per_heading": fast * 1e6, "dateparser_us_per_heading": slow * 1e6}
+
+
+def bench_search(host: str, search_pages: int, rounds: int) -> dict:
+    fv_scraper = scraper.FilmVandaagScraper(dict(UNCACHED, FILMVANDAAG_HOST=host))
+    num_movies = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for _movie in fv_scraper.search_movies(services=config.streaming_services, genres=["actie"],
+                                               imdb_score=(7, None), votes_threshold=0):
+            num_movies += 1
+    elapsed = time.perf_counter() - start
+    return {"movies_per_sec": num_movies / elapsed, "pages_per_sec": rounds * search_pages / elapsed}
+
+
+def compare(results: dict, previous: dict, prefix: str = "") -> None:
+    for key, value in results.items():
+        old = previous.get(key) if isinstance(previous, dict) else None
+        if isinstance(value, dict):
+            compare(value, old or {}, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            print(f"{prefix}{key:<40} {old:>14.2f} -> {value:>14.2f} ({value / old - 1:+.1%})")
+
+
+def main():
+    argparser = argparse.ArgumentParser(description="Offline FilmVandaag scraper benchmarks.")
+    argparser.add_argument("--latency", type=float, default=0.0, help="Stand-in response delay in seconds.")
+    argparser.add_argument("--rounds", type=int, default=20)
+    argparser.add_argument("--search-pages", type=int, default=20)
+    argparser.add_argument("--output", help="Result file. Default: benchmarks/results/<timestamp>.json")
+    argparser.add_argument("--compare", help="Earlier result file to compare with.")
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    server = standin.StandIn(latency=args.latency, search_pages=args.search_pages).start()
+    try:
+        results = {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                   "python": platform.python_version(),
+                   "latency": args.latency,
+                   "new_movies": bench_new_movies_pages(server.url, args.rounds),
+                   "parse": bench_parse(args.rounds),
+                   "dateparse": bench_dateparse(args.rounds * 100),
+                   "search": bench_search(server.url, args.search_pages, max(1, args.rounds // 5))}
+    finally:
+        server.stop()
+
+    print(json.dumps(results, indent=2))
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['timestamp'].replace(':', '')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
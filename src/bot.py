@@ -1,37 +1,188 @@
+import collections
+import contextlib
 import datetime
+import functools
 import logging
+import threading
+import typing
 
 from telegram import Update, InlineKeyboardMarkup, ReplyKeyboardRemove, \
-    ReplyKeyboardMarkup, ParseMode, Bot, TelegramError, InlineKeyboardButton
+    ReplyKeyboardMarkup, ParseMode, Bot, TelegramError, InlineKeyboardButton, InlineQueryResultArticle, \
+    InputTextMessageContent
+from telegram.constants import MAX_MESSAGE_LENGTH
 from telegram.utils.helpers import escape_markdown
 from telegram.ext import Updater, CommandHandler, CallbackContext, \
-    ConversationHandler, MessageHandler, Filters, Defaults, CallbackQueryHandler
+    ConversationHandler, MessageHandler, Filters, Defaults, CallbackQueryHandler, InlineQueryHandler
 
 import config
+import metrics
+import outbound
+import ranking
 import scraper
+import store
+import subscriptions
 
 log = logging.getLogger(__name__)
 
 POLL_INTERVAL = 2.0
+BOT_MODE = "polling"
+WEBHOOK_LISTEN = "0.0.0.0"
+WEBHOOK_PORT = 8443
 CONV_TIMEOUT = 30.0
 MOVIE_SEARCH_BATCH_SIZE = 20
+BOT_WORKERS = 8
+SCRAPE_CONCURRENCY = 4
+SCRAPE_PER_USER = 1
+SCRAPE_QUEUE = 16
+SUBSCRIPTION_NOTIFY_INTERVAL = 60.0
+RENDER_CACHE_SIZE = 4096
+FILM_MATCHES = 5
+INLINE_MATCHES = 10
+INLINE_CACHE_TIME = 300
+END_OF_RESULTS = "dat was het\\."
+STALE_NOTE = "(filmvandaag.nl is even niet bereikbaar, dit zijn de films van eerder)"
+ERROR_TEXT = "Er ging iets mis, probeer het later nog eens."
 
 
 STREAMINGSERVICE, GENRES, IMDB_SCORE, RELEASE_YEAR, SHOW_MOVIES = range(5)
+FOLLOW_SERVICE, FOLLOW_GENRES, FOLLOW_RATING = range(5, 8)
 RESP_TO_IMDB_SCORE, RESP_QUIT, RESP_MORE = [f"sc_{n}" for n in range(3)]
 
 
-def handle_bot_exception(u: object, context: CallbackContext) -> None:
-    raise context.error
+HANDLER_SECONDS = metrics.histogram("filmvandaag_bot_handler_seconds", "Time spent in a bot handler.")
+ACTIVE_CONVERSATIONS = metrics.gauge("filmvandaag_bot_active_conversations", "Conversations in progress.")
+
+
+def instrumented(handler):
+    """Observes the latency of every call of the handler in HANDLER_SECONDS."""
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        with HANDLER_SECONDS.time(handler=handler.__name__):
+            return handler(*args, **kwargs)
+    return wrapper
+
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_movie_line(url: str, title: str, release_year, rating: float, services: tuple) -> tuple[str, int]:
+    """
+    The MarkdownV2 line of a movie, cached per url and the shown fields, and its length as Telegram counts it:
+    after parsing the markup, so without the link url.
+    """
+    movie_line = f"[*{escape_markdown(title, version=2)}*]({url})"
+    movie_line += f" \\({release_year}\\)"
+    movie_line += f" imdb *{escape_markdown(str(rating), version=2)}*"
+    length = len(f"{title} ({release_year}) imdb {rating}")
+    if services:
+        services_text = ", ".join(services)
+        movie_line += f" op {escape_markdown(services_text, version=2)}"
+        length += len(services_text) + 4
+    return movie_line, length
+
+
+def movie_line(movie) -> tuple[str, int]:
+    return render_movie_line(movie.url, movie.title, movie.release_year, movie.rating,
+                             movie.services if len(movie.services) > 1 else ())
+
+
+def format_movie_line(movie) -> str:
+    return movie_line(movie)[0]
+
+
+def film_line(movie) -> str:
+    """The line of a looked up movie, with its services even if there is one."""
+    return render_movie_line(movie.url, movie.title, movie.release_year, movie.rating, movie.services)[0]
+
+
+def split_message(lines: list[str], max_length: int = MAX_MESSAGE_LENGTH) -> list[str]:
+    """
+    Join the lines into as few messages as fit in max_length.
+    """
+    messages, current = [], ""
+    for line in lines:
+        if current and len(current) + 1 + len(line) > max_length:
+            messages.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+
+class ScrapeBusy(Exception):
+    pass
+
+
+class ScrapeGate:
+    """
+    Limits the scrape work running on the dispatcher's worker threads: at most max_global scrapes at a time,
+    max_per_user per user and max_queue waiting for a slot. Work beyond that is refused with ScrapeBusy.
+    Work is reserved before it is handed to a worker thread, so work waiting for a worker counts as queued too.
+    """
+
+    def __init__(self, max_global: int, max_per_user: int, max_queue: int) -> None:
+        self.max_global = max_global
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self._slots = threading.BoundedSemaphore(max_global)
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._per_user = collections.Counter()
+
+    def __repr__(self):
+        return f"ScrapeGate(max_global={self.max_global}, max_per_user={self.max_per_user}, " \
+               f"max_queue={self.max_queue})"
+
+    def reserve(self, user_id: int) -> None:
+        """
+        Admit a scrape of user_id, to be run with slot(user_id).
+        :raise ScrapeBusy: if user_id or the gate has no room for it
+        """
+        with self._lock:
+            if self._per_user[user_id] >= self.max_per_user or self._admitted >= self.max_global + self.max_queue:
+                raise ScrapeBusy(f"Scrape refused for user {user_id}: {self._admitted} admitted.")
+            self._admitted += 1
+            self._per_user[user_id] += 1
+
+    @contextlib.contextmanager
+    def admit(self, user_id: int):
+        self.reserve(user_id)
+        with self.slot(user_id):
+            yield
+
+    @contextlib.contextmanager
+    def slot(self, user_id: int):
+        """Runs the reserved scrape of user_id once a slot is free, and ends its reservation after."""
+        try:
+            with self._slots:
+                yield
+        finally:
+            with self._lock:
+                self._admitted -= 1
+                self._per_user[user_id] -= 1
+                if not self._per_user[user_id]:
+                    del self._per_user[user_id]
 
 
 class FilmVandaagBot:
 
-    def __init__(self, config: dict, scraper: scraper.FilmVandaagScraper) -> None:
-        self.updater = Updater(token=config["TG_FV_BOT_TOKEN"])
-        self.updater.dispatcher.add_error_handler(handle_bot_exception)
+    def __init__(self, config: dict, scraper: scraper.FilmVandaagScraper, state_store=None,
+                 subscription_store=None) -> None:
+        # with a shared store, conversations and user_data live in the store, so any instance can handle an update
+        persistence = store.StorePersistence(state_store, conversation_timeout=CONV_TIMEOUT) \
+            if state_store is not None else None
+        self.updater = Updater(token=config["TG_FV_BOT_TOKEN"], base_url=config.get("TG_API_URL"),
+                               workers=config.get("BOT_WORKERS", BOT_WORKERS), persistence=persistence)
+        self.updater.dispatcher.add_error_handler(self.handle_bot_exception)
         self.scraper = scraper
-        self.search_movie_conv_handler = ConversationHandler(
+        # scraping runs async on the dispatcher's workers, the gate keeps it from taking all of them
+        self.scrape_gate = ScrapeGate(max_global=config.get("SCRAPE_CONCURRENCY", SCRAPE_CONCURRENCY),
+                                      max_per_user=config.get("SCRAPE_PER_USER", SCRAPE_PER_USER),
+                                      max_queue=config.get("SCRAPE_QUEUE", SCRAPE_QUEUE))
+        if self.updater.dispatcher.workers < self.scrape_gate.max_global:
+            log.warning(f"BOT_WORKERS {self.updater.dispatcher.workers} is below SCRAPE_CONCURRENCY "
+                        f"{self.scrape_gate.max_global}: at most {self.updater.dispatcher.workers} scrapes run at a time")
+        self.search_movie_conv_handler = store.SharedConversationHandler(
             entry_points=[CommandHandler(["zoek"], self.search_movies)],
             states={
                 GENRES: [
@@ -44,50 +195,130 @@ class FilmVandaagBot:
                 ],
                 RELEASE_YEAR: [
                     CallbackQueryHandler(self.cancel, pattern='^' + str(RESP_QUIT) + '$'),
-                    CallbackQueryHandler(self.handle_input_release_year)
+                    CallbackQueryHandler(self.admit_scrape(self.handle_input_release_year, RELEASE_YEAR))
                 ],
                 SHOW_MOVIES: [
                     CallbackQueryHandler(self.cancel, pattern='^' + str(RESP_QUIT) + '$'),
-                    CallbackQueryHandler(self.show_more_movies)
+                    CallbackQueryHandler(self.admit_scrape(self.show_more_movies, SHOW_MOVIES))
                 ],
                 ConversationHandler.TIMEOUT: [
                     CallbackQueryHandler(self.handle_timeout)
+                ],
+                ConversationHandler.WAITING: [
+                    CallbackQueryHandler(self.handle_waiting)
                 ]
 
             },
             fallbacks=[CommandHandler('cancel', self.cancel)],
-            conversation_timeout=CONV_TIMEOUT
+            conversation_timeout=CONV_TIMEOUT,
+            name="zoek", persistent=persistence is not None
         )
-        self.new_movie_conv_handler = ConversationHandler(
+        self.new_movie_conv_handler = store.SharedConversationHandler(
             entry_points=[CommandHandler(["nieuw"], self.new_movies)],
             states={
                 STREAMINGSERVICE: [
                     CallbackQueryHandler(self.cancel, pattern='^' + str(RESP_QUIT) + '$'),
-                    CallbackQueryHandler(self.handle_input_services)
+                    CallbackQueryHandler(self.admit_scrape(self.handle_input_services, STREAMINGSERVICE))
                 ],
                 SHOW_MOVIES: [
                     CallbackQueryHandler(self.cancel, pattern='^' + str(RESP_QUIT) + '$'),
-                    CallbackQueryHandler(self.show_more_movies)
+                    CallbackQueryHandler(self.admit_scrape(self.show_more_movies, SHOW_MOVIES))
                 ],
                 ConversationHandler.TIMEOUT: [
                     CallbackQueryHandler(self.handle_timeout)
+                ],
+                ConversationHandler.WAITING: [
+                    CallbackQueryHandler(self.handle_waiting)
                 ]
             },
             fallbacks=[CommandHandler('cancel', self.cancel)],
-            conversation_timeout=CONV_TIMEOUT
+            conversation_timeout=CONV_TIMEOUT,
+            name="nieuw", persistent=persistence is not None
+        )
+        self.follow_conv_handler = store.SharedConversationHandler(
+            entry_points=[CommandHandler(["volg"], self.follow)],
+            states={
+                FOLLOW_SERVICE: [
+                    CallbackQueryHandler(self.cancel, pattern='^' + str(RESP_QUIT) + '$'),
+                    CallbackQueryHandler(self.handle_follow_service)
+                ],
+                FOLLOW_GENRES: [
+                    CallbackQueryHandler(self.cancel, pattern='^' + str(RESP_QUIT) + '$'),
+                    CallbackQueryHandler(self.handle_follow_genres)
+                ],
+                FOLLOW_RATING: [
+                    CallbackQueryHandler(self.cancel, pattern='^' + str(RESP_QUIT) + '$'),
+                    CallbackQueryHandler(self.handle_follow_rating)
+                ],
+                ConversationHandler.TIMEOUT: [
+                    CallbackQueryHandler(self.handle_timeout)
+                ]
+            },
+            fallbacks=[CommandHandler('cancel', self.cancel)],
+            conversation_timeout=CONV_TIMEOUT,
+            name="volg", persistent=persistence is not None
         )
         self.config = config
+        # replies and notifications go out through the outbox, within Telegram's rate limits
+        self.outbox = outbound.MessageScheduler(
+            name="bot",
+            global_rate=config.get("OUTBOUND_GLOBAL_RATE", outbound.DEFAULT_GLOBAL_RATE),
+            chat_rate=config.get("OUTBOUND_CHAT_RATE", outbound.DEFAULT_CHAT_RATE),
+            chat_burst=config.get("OUTBOUND_CHAT_BURST", outbound.DEFAULT_CHAT_BURST))
+        # subscriptions of /volg, matched against the new movies found by the scraper every notify interval
+        self.subscriptions = subscriptions.SubscriptionIndex(subscription_store)
+        self._pending_new_movies = collections.deque()
+        self.scraper.add_new_movies_listener(self.queue_new_movies)
+        self.watch_subscribed_services()
         self.updater.dispatcher.add_handler(self.new_movie_conv_handler)
         self.updater.dispatcher.add_handler(self.search_movie_conv_handler)
+        self.updater.dispatcher.add_handler(self.follow_conv_handler)
+        # after add_handler, which replaces the conversations of persistent handlers
+        for conv_handler in (self.new_movie_conv_handler, self.search_movie_conv_handler, self.follow_conv_handler):
+            ACTIVE_CONVERSATIONS.set_function(functools.partial(len, conv_handler.conversations),
+                                              command=conv_handler.name)
+        self.updater.dispatcher.add_handler(CommandHandler(["ontvolg"], self.unfollow))
+        self.updater.dispatcher.add_handler(CommandHandler(["film"], self.find_film))
+        self.updater.dispatcher.add_handler(InlineQueryHandler(self.inline_find_film))
         log.info("FilmVandaagBot initialized.")
 
     def start(self):
-        self.updater.start_polling(poll_interval=POLL_INTERVAL)
-        log.info("FilmVandaagBot started polling")
+        self.outbox.start()
+        interval = self.config.get("SUBSCRIPTION_NOTIFY_INTERVAL", SUBSCRIPTION_NOTIFY_INTERVAL)
+        self.updater.job_queue.run_repeating(self.notify_subscribers, interval=interval, first=interval)
+        if self.config.get("BOT_MODE", BOT_MODE) == "webhook":
+            # Telegram posts the updates to WEBHOOK_URL, a load balancer in front of the instances' listeners
+            url_path = self.config.get("WEBHOOK_PATH") or self.config["TG_FV_BOT_TOKEN"]
+            self.updater.start_webhook(listen=self.config.get("WEBHOOK_LISTEN", WEBHOOK_LISTEN),
+                                       port=self.config.get("WEBHOOK_PORT", WEBHOOK_PORT),
+                                       url_path=url_path,
+                                       webhook_url=f"{self.config['WEBHOOK_URL'].rstrip('/')}/{url_path}")
+            log.info(f"FilmVandaagBot started listening for webhook updates on port "
+                     f"{self.config.get('WEBHOOK_PORT', WEBHOOK_PORT)}")
+        else:
+            self.updater.start_polling(poll_interval=POLL_INTERVAL)
+            log.info("FilmVandaagBot started polling")
+
+    def handle_bot_exception(self, update: object, context: CallbackContext) -> None:
+        """
+        Error handler of the dispatcher. Logs the error and tells the user something went wrong. The conversation
+        stays where it was, so the user can try again.
+        """
+        log.error(f"Handling update {update} failed: {context.error}", exc_info=context.error)
+        if not isinstance(update, Update) or update.effective_message is None:
+            return
+        if update.callback_query is not None:
+            try:
+                update.callback_query.answer()
+            except TelegramError as err:
+                log.debug(f"Answering the callback query failed: {err}")
+        self.outbox.submit(update.effective_message.chat_id, update.effective_message.reply_text, text=ERROR_TEXT)
 
+    @instrumented
     def search_movies(self, update: Update, context: CallbackContext) -> int:
         """Starts the conversation and asks user about streaming services"""
         log.info(f"Search_movies conversation started by user {update.message.from_user}.")
+        self.close_movies_cursor(context)
         context.user_data.clear()
         button_texts = config.genres + ["overig"]
         cancel_button = InlineKeyboardButton("Stop maar", callback_data=RESP_QUIT)
@@ -97,6 +328,7 @@ class FilmVandaagBot:
         update.message.reply_text("Oke, ik ga films zoeken. Welke genres?", reply_markup=reply_markup)
         return GENRES
 
+    @instrumented
     def handle_input_genres(self, update: Update, context: CallbackContext) -> int:
         context.user_data["selected_genres"] = []
         cancel_button = InlineKeyboardButton("Stop maar", callback_data=RESP_QUIT)
@@ -116,6 +348,7 @@ class FilmVandaagBot:
         )
         return IMDB_SCORE
 
+    @instrumented
     def handle_input_imdb_score(self, update: Update, context: CallbackContext) -> int:
         query = update.callback_query
         resp = query.data
@@ -137,6 +370,7 @@ class FilmVandaagBot:
         )
         return RELEASE_YEAR
 
+    @instrumented
     def handle_input_release_year(self, update: Update, context: CallbackContext) -> int:
         query = update.callback_query
         resp = query.data
@@ -144,12 +378,12 @@ class FilmVandaagBot:
         context.user_data["min_release_year"] = resp
         query.answer()
 
-        movies_generator = self.scraper.search_movies(services=config.streaming_services,
+        movies_cursor = self.scraper.search_cursor(services=config.streaming_services,
                                             genres=context.user_data["selected_genres"],
                                             imdb_score=(context.user_data["min_imdb_score"], None),
                                             release_year=(context.user_data["min_release_year"], None),
                                             votes_threshold=self.config["IMDB_VOTES_THRESHOLD"])
-        context.user_data["movies_generator"] = movies_generator
+        context.user_data["movies_cursor"] = movies_cursor
         context.user_data["search_url"] = self.scraper.get_search_movies_browser_url(services=config.streaming_services,
                                             genres=context.user_data["selected_genres"],
                                             imdb_score=(context.user_data["min_imdb_score"], None),
@@ -170,48 +404,99 @@ class FilmVandaagBot:
         return self.show_more_movies(update, context)
 
 
+    @instrumented
     def show_more_movies(self, update: Update, context: CallbackContext) -> int:
         query = update.callback_query
         resp = query.data
         log.info(f"callback show_more_movies with query data: {resp}")
 
 
-        movielines = []
-        thereismore = True
-        try:
-            for i in range(MOVIE_SEARCH_BATCH_SIZE):
-                movie = next(context.user_data["movies_generator"])
-                movie_line = f"[*{escape_markdown(movie['title'], version=2)}*]({movie['url']})"
-                movie_line += f" \({movie['release_year']}\)"
-                movie_line += f" imdb *{escape_markdown(str(movie['rating']), version=2)}*"
-                movielines.append(movie_line)
-        except StopIteration: # out of movies
-            thereismore = False
-        finally:
-            movies_text = "\n".join(movielines)
+        movies = context.user_data["movies_cursor"].next_batch(self.scraper, MOVIE_SEARCH_BATCH_SIZE)
         query.answer()
-        if "previous_movies_text" in context.user_data:
-            query.edit_message_text(
-                text=context.user_data["previous_movies_text"],
-                reply_markup=None,
-                parse_mode=ParseMode.MARKDOWN_V2,
-                disable_web_page_preview=True
-            )
+        thereismore = len(movies) == MOVIE_SEARCH_BATCH_SIZE  # else out of movies
+        lines = [movie_line(movie) for movie in movies]
+        if getattr(context.user_data.get("movies_cursor"), "stale", False):
+            lines.append((f"_{escape_markdown(STALE_NOTE, version=2)}_", len(STALE_NOTE)))
         if not thereismore:
-            query.message.reply_text(text=f"{movies_text}\n\ndat was het\.",
-                                     parse_mode=ParseMode.MARKDOWN_V2,
-                                     disable_web_page_preview=True)
-            return ConversationHandler.END
+            lines.append((f"\n{END_OF_RESULTS}" if lines else END_OF_RESULTS, len(END_OF_RESULTS) + 1))
+            self.close_movies_cursor(context)
+        self.send_movies_page(query, context, lines, thereismore)
+        return SHOW_MOVIES if thereismore else ConversationHandler.END
+
+    def send_movies_page(self, query, context: CallbackContext, lines: list[tuple[str, int]], more: bool) -> None:
+        """
+        Send a page of movie lines with one API call. Pages are added to the message with the "meer" button that
+        was tapped, which moves the button under the new page. A page that does not fit in that message anymore
+        starts a new one.
+        """
+        page_text = "\n".join(line for line, _ in lines)
+        page_length = sum(length for _, length in lines) + len(lines) - 1
+        keyboard_markup = InlineKeyboardMarkup([[InlineKeyboardButton("meer", callback_data=str(1900))]]) \
+            if more else None
+        movies_text = context.user_data.get("movies_text")
+        movies_text_length = context.user_data.get("movies_text_length", 0)
+        if movies_text is not None and movies_text_length + 1 + page_length <= MAX_MESSAGE_LENGTH:
+            context.user_data["movies_text"] = f"{movies_text}\n{page_text}"
+            context.user_data["movies_text_length"] = movies_text_length + 1 + page_length
+            send = query.edit_message_text
         else:
-            keyboard = [[InlineKeyboardButton("meer", callback_data=str(1900))]]
-            keyboard_markup = InlineKeyboardMarkup(keyboard)
-            context.user_data["previous_movies_text"] = movies_text
-            query.message.reply_text(text=movies_text,
-                                     reply_markup=keyboard_markup,
-                                     parse_mode=ParseMode.MARKDOWN_V2,
-                                     disable_web_page_preview=True)
-            return SHOW_MOVIES
+            if movies_text is not None:
+                # the tapped message is full, take its button away before the next page gets one
+                self.outbox.submit(query.message.chat_id, query.edit_message_reply_markup, reply_markup=None)
+            context.user_data["movies_text"] = page_text
+            context.user_data["movies_text_length"] = page_length
+            send = query.message.reply_text
+        self.outbox.submit(
+            query.message.chat_id, send,
+            text=context.user_data["movies_text"],
+            reply_markup=keyboard_markup,
+            parse_mode=ParseMode.MARKDOWN_V2,
+            disable_web_page_preview=True
+        )
+
+    def admit_scrape(self, callback: typing.Callable, state: int) -> typing.Callable:
+        """
+        :return: handler callback that admits the scrape of callback to the scrape gate on the dispatcher thread,
+        then runs it on a worker thread. The conversation waits for the Promise it returns. When the gate is full
+        the user hears so at once, instead of the update waiting for a worker first, and the conversation stays in
+        state, the state callback handles.
+        """
+        @functools.wraps(callback)
+        def handler(update: Update, context: CallbackContext):
+            user_id = update.callback_query.from_user.id
+            try:
+                self.scrape_gate.reserve(user_id)
+            except ScrapeBusy as err:
+                log.warning(str(err))
+                return self.reply_busy(update, state)
+
+            def scrape():
+                with self.scrape_gate.slot(user_id):
+                    return callback(update, context)
+            return context.dispatcher.run_async(scrape, update=update)
+        return handler
+
+    def reply_busy(self, update: Update, state: int) -> int:
+        """
+        Answer a tap refused by the scrape gate. The tapped message keeps its buttons, tapping again retries.
+        :return: state, the conversation stays in it
+        """
+        query = update.callback_query
+        # answered through the outbox, this runs on the dispatcher thread
+        self.outbox.submit(query.message.chat_id, query.answer, text="Het is even erg druk. Probeer het zo nog eens.")
+        return state
+
+    @instrumented
+    def handle_waiting(self, update: Update, context: CallbackContext) -> None:
+        update.callback_query.answer(text="Momentje, ik ben nog bezig...")
 
+    def close_movies_cursor(self, context: CallbackContext) -> None:
+        """Closes the movies cursor of the conversation, which cancels its pending prefetches."""
+        movies_cursor = context.user_data.pop("movies_cursor", None)
+        if movies_cursor is not None:
+            movies_cursor.close()
+
+    @instrumented
     def handle_timeout(self,  update: Update, context: CallbackContext) -> int:
         query = update.callback_query
         resp = query.data
@@ -221,9 +506,11 @@ class FilmVandaagBot:
         query.message.reply_text(text=f"Duurt laaaaang\.",
                                  parse_mode=ParseMode.MARKDOWN_V2
                                  )
+        self.close_movies_cursor(context)
         context.user_data.clear()
         return ConversationHandler.END
 
+    @instrumented
     def cancel(self, update: Update, context: CallbackContext) -> int:
         query = update.callback_query
         resp = query.data
@@ -234,9 +521,11 @@ class FilmVandaagBot:
         query.message.reply_text(text=f"Oke\, dan niet\.",
                                  parse_mode=ParseMode.MARKDOWN_V2
                                  )
+        self.close_movies_cursor(context)
         context.user_data.clear()
         return ConversationHandler.END
 
+    @instrumented
     def handle_input_services(self, update: Update, context: CallbackContext) -> int:
         query = update.callback_query
         resp = query.data
@@ -250,12 +539,12 @@ class FilmVandaagBot:
             reply_markup=None,
         )
         query.answer()
-        gen = self.scraper.scrape_new_movies(services,
+        movies_cursor = self.scraper.new_movies_cursor(services,
                                              added_days_ago=self.config["NEW_MOVIES_THRESHOLD_DAYS"],
                                              votes_threshold=self.config["IMDB_VOTES_THRESHOLD"],
                                              rating_threshold=self.config["NEW_MOVIES_MIN_RATING"]
                                              )
-        context.user_data["movies_generator"] = gen
+        context.user_data["movies_cursor"] = movies_cursor
         services_text = f"streamingdiensten: {', '.join(services)}"
         imdb_score_text = f"imdb\-score: *{escape_markdown(str(self.config['NEW_MOVIES_MIN_RATING']), version=2)}* " \
                           f"\(minimaal *{escape_markdown(str(self.config['IMDB_VOTES_THRESHOLD']), version=2)} stemmen*\)"
@@ -268,8 +557,10 @@ class FilmVandaagBot:
         )
         return self.show_more_movies(update, context)
 
+    @instrumented
     def new_movies(self, update: Update, context: CallbackContext) -> int:
         log.info(f"new_movies conversation started by user {update.message.from_user}.")
+        self.close_movies_cursor(context)
         context.user_data.clear()
         button_texts = config.streaming_services
         cancel_button = InlineKeyboardButton("Stop maar", callback_data=RESP_QUIT)
@@ -282,5 +573,148 @@ class FilmVandaagBot:
         return STREAMINGSERVICE
 
 
+    @instrumented
+    def follow(self, update: Update, context: CallbackContext) -> int:
+        log.info(f"follow conversation started by user {update.message.from_user}.")
+        self.close_movies_cursor(context)
+        context.user_data.clear()
+        cancel_button = InlineKeyboardButton("Stop maar", callback_data=RESP_QUIT)
+        keyboard = [[InlineKeyboardButton("allemaal", callback_data="any")]]
+        keyboard += [[InlineKeyboardButton(b, callback_data=str(b))] for b in config.streaming_services]
+        keyboard += [[cancel_button]]
+        update.message.reply_text("Oke, ik laat het weten als er nieuwe films zijn.\nWelke streamingdienst?",
+                                  reply_markup=InlineKeyboardMarkup(keyboard))
+        return FOLLOW_SERVICE
+
+    @instrumented
+    def handle_follow_service(self, update: Update, context: CallbackContext) -> int:
+        query = update.callback_query
+        resp = query.data
+        log.info(f"callback handle_follow_service with query data: {resp}")
+        query.answer()
+        context.user_data["follow_services"] = [] if resp == "any" else [resp]
+        cancel_button = InlineKeyboardButton("Stop maar", callback_data=RESP_QUIT)
+        keyboard = [[InlineKeyboardButton("allemaal", callback_data="any")]]
+        keyboard += [[InlineKeyboardButton(b, callback_data=str(b))] for b in config.genres]
+        keyboard += [[cancel_button]]
+        query.edit_message_text(text="Welke genres?", reply_markup=InlineKeyboardMarkup(keyboard))
+        return FOLLOW_GENRES
+
+    @instrumented
+    def handle_follow_genres(self, update: Update, context: CallbackContext) -> int:
+        query = update.callback_query
+        resp = query.data
+        log.info(f"callback handle_follow_genres with query data: {resp}")
+        query.answer()
+        context.user_data["follow_genres"] = [] if resp == "any" else [resp]
+        cancel_button = InlineKeyboardButton("Stop maar", callback_data=RESP_QUIT)
+        keyboard = [[InlineKeyboardButton("boeiend", callback_data=str(0))]]
+        keyboard.append([InlineKeyboardButton(f"{n}+", callback_data=str(n)) for n in [5, 6, 7, 8]])
+        keyboard.append([cancel_button])
+        query.edit_message_text(text="Wat moet de IMDB-score zijn?", reply_markup=InlineKeyboardMarkup(keyboard))
+        return FOLLOW_RATING
+
+    @instrumented
+    def handle_follow_rating(self, update: Update, context: CallbackContext) -> int:
+        query = update.callback_query
+        resp = query.data
+        log.info(f"callback handle_follow_rating with query data: {resp}")
+        query.answer()
+        subscription = subscriptions.Subscription(chat_id=query.message.chat_id,
+                                                  services=tuple(context.user_data["follow_services"]),
+                                                  genres=tuple(context.user_data["follow_genres"]),
+                                                  min_rating=float(resp),
+                                                  min_votes=self.config["IMDB_VOTES_THRESHOLD"])
+        self.subscriptions.add(subscription)
+        self.watch_subscribed_services()
+        log.info(f"Added {subscription}")
+        services_text = ", ".join(subscription.services) or "alle streamingdiensten"
+        genres_text = ", ".join(subscription.genres) or "alle genres"
+        query.edit_message_text(
+            text=f"Ik laat het weten als er nieuwe films zijn op *{escape_markdown(services_text, version=2)}*\.\n"
+                 f"Genres: *{escape_markdown(genres_text, version=2)}*\n"
+                 f"IMDB\-score: *{escape_markdown(resp, version=2)}\+*\n"
+                 f"Stoppen kan met /ontvolg\.",
+            reply_markup=None,
+            parse_mode=ParseMode.MARKDOWN_V2
+        )
+        context.user_data.clear()
+        return ConversationHandler.END
+
+    @instrumented
+    def unfollow(self, update: Update, context: CallbackContext) -> None:
+        self.subscriptions.refresh()
+        if self.subscriptions.remove(update.effective_chat.id):
+            self.watch_subscribed_services()
+            update.message.reply_text("Oke, ik stuur geen nieuwe films meer.")
+        else:
+            update.message.reply_text("Je volgt nog niks. Dat kan met /volg.")
+
+    def watch_subscribed_services(self) -> None:
+        """Keeps the scraper refreshing the subscribed services, so their new movies are found."""
+        services = self.subscriptions.services()
+        self.scraper.watched_services = set(config.streaming_services) if "" in services else services
+
+    def queue_new_movies(self, service: str, movies: list) -> None:
+        """New movies listener of the scraper. Called on the scraper's threads."""
+        self._pending_new_movies.extend(movies)
+
+    @instrumented
+    def notify_subscribers(self, context: CallbackContext) -> None:
+        """
+        Match the new movies queued since the last run against the subscriptions and send every chat one
+        message with its matches, best rated first.
+        """
+        self.subscriptions.refresh()  # for the subscriptions made on other instances
+        self.watch_subscribed_services()
+        movies = []
+        while self._pending_new_movies:
+            movies.append(self._pending_new_movies.popleft())
+        movies = self.subscriptions.claim(movies)
+        if not movies:
+            return
+        matches = self.subscriptions.match(movies)
+        log.info(f"{len(movies)} new movies matched the subscriptions of {len(matches)} chats.")
+        for chat_id, chat_movies in matches.items():
+            lines = ["Nieuw toegevoegd:"] + [format_movie_line(m)
+                                             for m in ranking.top_movies(chat_movies, len(chat_movies))]
+            for text in split_message(lines):
+                self.outbox.submit(chat_id, context.bot.send_message, chat_id=chat_id, text=text,
+                                   parse_mode=ParseMode.MARKDOWN_V2, disable_web_page_preview=True)
+
+    @instrumented
+    def find_film(self, update: Update, context: CallbackContext) -> None:
+        """/film <titel>: where the best matching movies can be streamed."""
+        query = " ".join(context.args or [])
+        if not query:
+            update.message.reply_text("Welke film? Bijvoorbeeld: /film the godfather")
+            return
+        matches = self.scraper.titles.search(query, limit=FILM_MATCHES)
+        log.info(f"/film {query}: {len(matches)} matches.")
+        if matches:
+            text = "\n".join(film_line(match.movie) for match in matches)
+        else:
+            text = f"Geen film gevonden voor *{escape_markdown(query, version=2)}*\."
+        self.outbox.submit(update.effective_chat.id, update.message.reply_text, text=text,
+                           parse_mode=ParseMode.MARKDOWN_V2, disable_web_page_preview=True)
+
+    @instrumented
+    def inline_find_film(self, update: Update, context: CallbackContext) -> None:
+        """Inline query @bot <titel>: the best matching movies, choosing one sends its line to the chat."""
+        inline_query = update.inline_query
+        if not inline_query.query.strip():
+            return
+        results = []
+        for match in self.scraper.titles.search(inline_query.query, limit=INLINE_MATCHES):
+            movie = match.movie
+            results.append(InlineQueryResultArticle(
+                id=movie.path.split("-")[0][-64:],  # /film/<id>, at most 64 bytes
+                title=f"{movie.title} ({movie.release_year})" if movie.release_year else movie.title,
+                description=f"imdb {movie.rating}" + (f" op {', '.join(movie.services)}" if movie.services else ""),
+                url=movie.url,
+                input_message_content=InputTextMessageContent(film_line(movie), parse_mode=ParseMode.MARKDOWN_V2,
+                                                              disable_web_page_preview=True)))
+        inline_query.answer(results, cache_time=INLINE_CACHE_TIME)
+
     def random_movies(self, update: Update, context: CallbackContext) -> None:
         context.bot.sendMessage(chat_id=update.effective_chat.id, text="Hier heb je een film:")
\ No newline at end of file
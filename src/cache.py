@@ -0,0 +1,169 @@
+import collections
+import concurrent.futures
+import logging
+import threading
+import time
+import typing
+
+log = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Thread safe LRU cache whose entries expire after ttl seconds. Concurrent misses on the same key are
+    deduplicated: the first caller runs the loader, the others wait for its result.
+    With a shared store, see store.py, entries are written through to it under name, and a local miss looks in
+    the store before loading, so instances sharing the store share the loaded values.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, clock: typing.Callable[[], float] = time.monotonic,
+                 store=None, name: str = "cache") -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.store = store
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = collections.OrderedDict()  # key -> (expires_at, value)
+        self._loading = {}  # key -> Future of the load in progress
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"TTLCache(maxsize={self.maxsize}, ttl={self.ttl}, size={len(self._entries)}, store={self.store})"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[0] > self.clock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._get_local(key)
+        if entry is None:
+            entry = self._load_shared(key)
+        with self._lock:
+            if entry is not None and entry[0] > self.clock():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return default
+
+    def get_stale(self, key, default=None):
+        """
+        Return the value stored for key even if it has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load_shared(key)
+        return default if entry is None else entry[1]
+
+    def _get_local(self, key) -> typing.Optional[tuple]:
+        """
+        Called with the lock held.
+        :return: the live entry of key in the local cache, (expires_at, value), or None
+        """
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= self.clock():
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._set(key, value)
+        self._save_shared(key, value)
+
+    def _set(self, key, value, expires_at: float = None) -> None:
+        self._entries[key] = (self.clock() + self.ttl if expires_at is None else expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            log.debug(f"Evicted {evicted} from cache.")
+
+    def _shared_key(self, key) -> str:
+        return f"{self.name}:{key!r}"
+
+    def _load_shared(self, key) -> typing.Optional[tuple]:
+        """
+        Read the entry of key from the store, and copy it into the local cache unless it has expired. Called
+        without the lock, a slow store only holds up the caller.
+        :return: the entry, (expires_at, value), or None
+        """
+        if self.store is None:
+            return None
+        try:
+            shared = self.store.get(self._shared_key(key))
+        except Exception as err:
+            log.error(f"Reading {key} from {self.store} failed: {err}")
+            return None
+        if shared is None:
+            return None
+        expires, value = shared  # expires in wall clock time, the store outlives this process
+        entry = (self.clock() + expires - time.time(), value)
+        if entry[0] > self.clock():
+            with self._lock:
+                self._set(key, value, entry[0])
+        return entry
+
+    def _save_shared(self, key, value) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.set(self._shared_key(key), (time.time() + self.ttl, value))
+        except Exception as err:
+            log.error(f"Writing {key} to {self.store} failed: {err}")
+
+    def get_or_load(self, key, loader: typing.Callable[[], typing.Any], force: bool = False):
+        """
+        Return the cached value for key. On a miss, or when force is set, loader() is called once to
+        produce it, however many threads ask for the key at the same time.
+        """
+        if not force:
+            with self._lock:
+                entry = self._get_local(key)
+            if entry is None:
+                entry = self._load_shared(key)
+            if entry is not None and entry[0] > self.clock():
+                with self._lock:
+                    self.hits += 1
+                return entry[1]
+        with self._lock:
+            entry = None if force else self._get_local(key)
+            if entry is not None:  # loaded meanwhile
+                self.hits += 1
+                return entry[1]
+            future = self._loading.get(key)
+            owner = future is None
+            if owner:
+                if not force:
+                    self.misses += 1
+                future = concurrent.futures.Future()
+                self._loading[key] = future
+        if not owner:
+            return future.result()
+        try:
+            value = loader()
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            with self._lock:
+                self._set(key, value)
+            self._save_shared(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                del self._loading[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,227 @@
+import dataclasses
+import logging
+import sqlite3
+import sys
+import threading
+import time
+import typing
+
+import models
+
+log = logging.getLogger(__name__)
+
+LOCAL_PAGE_SIZE = 50
+DEFAULT_CRAWL_INTERVAL = 24 * 3600.0
+DEFAULT_CRAWL_DELAY = 1.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS movies (
+    path TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    release_year INTEGER,
+    rating REAL NOT NULL,
+    num_votes INTEGER NOT NULL,
+    director TEXT,
+    crawled_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS movie_genres (
+    path TEXT NOT NULL REFERENCES movies(path) ON DELETE CASCADE,
+    genre TEXT NOT NULL COLLATE NOCASE,
+    position INTEGER NOT NULL,
+    PRIMARY KEY (path, genre)
+);
+CREATE TABLE IF NOT EXISTS movie_services (
+    path TEXT NOT NULL REFERENCES movies(path) ON DELETE CASCADE,
+    service TEXT NOT NULL,
+    crawled_at REAL NOT NULL,
+    PRIMARY KEY (path, service)
+);
+CREATE INDEX IF NOT EXISTS movies_rating ON movies(rating DESC, num_votes DESC);
+CREATE INDEX IF NOT EXISTS movies_num_votes ON movies(num_votes);
+CREATE INDEX IF NOT EXISTS movies_release_year ON movies(release_year);
+CREATE INDEX IF NOT EXISTS movie_genres_genre ON movie_genres(genre, path);
+CREATE INDEX IF NOT EXISTS movie_services_service ON movie_services(service, path);
+"""
+
+
+class MovieCatalog:
+    """
+    Local SQLite mirror of the filmvandaag catalog. Answers the searches of the bot with indexed queries,
+    sorted by IMDB score like /api/search.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        log.info(f"MovieCatalog initialized: {self}")
+
+    def __repr__(self):
+        return f"MovieCatalog(path={repr(self.path)})"
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+
+    def upsert(self, movies: typing.Iterable[models.Movie], service: str, crawled_at: float = None) -> None:
+        crawled_at = crawled_at or time.time()
+        with self._lock, self._conn:
+            for movie in movies:
+                self._conn.execute(
+                    "INSERT INTO movies(path, title, release_year, rating, num_votes, director, crawled_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET title = excluded.title, "
+                    "release_year = excluded.release_year, rating = excluded.rating, "
+                    "num_votes = excluded.num_votes, director = excluded.director, crawled_at = excluded.crawled_at",
+                    (movie.path, movie.title, movie.release_year, movie.rating, movie.num_votes, movie.director,
+                     crawled_at))
+                self._conn.execute("DELETE FROM movie_genres WHERE path = ?", (movie.path,))
+                self._conn.executemany("INSERT OR IGNORE INTO movie_genres(path, genre, position) VALUES (?, ?, ?)",
+                                       [(movie.path, genre, i) for i, genre in enumerate(movie.genres)])
+                self._conn.execute("INSERT INTO movie_services(path, service, crawled_at) VALUES (?, ?, ?) "
+                                   "ON CONFLICT(path, service) DO UPDATE SET crawled_at = excluded.crawled_at",
+                                   (movie.path, service, crawled_at))
+
+    def prune(self, service: str, crawled_before: float) -> int:
+        """
+        Forget that movies not seen in the last crawl of service are available on it.
+        :return: number of removed service entries
+        """
+        with self._lock, self._conn:
+            removed = self._conn.execute("DELETE FROM movie_services WHERE service = ? AND crawled_at < ?",
+                                         (service, crawled_before)).rowcount
+            self._conn.execute("DELETE FROM movies WHERE path NOT IN (SELECT path FROM movie_services)")
+        return removed
+
+    def search(self, services: list = None,
+               genres: list = None,
+               imdb_score: (float, float) = None,
+               release_year: (int, int) = None,
+               votes_threshold: int = 0,
+               limit: int = LOCAL_PAGE_SIZE,
+               offset: int = 0) -> list[models.Movie]:
+        """
+        Movies matching any of the genres on any of the services, best IMDB score first.
+        """
+        where, args = ["m.num_votes >= ?"], [votes_threshold]
+        if imdb_score:
+            where.append("m.rating BETWEEN ? AND ?")
+            args += [float(imdb_score[0]), float(imdb_score[1])]
+        if release_year:
+            where.append("m.release_year BETWEEN ? AND ?")
+            args += [int(release_year[0]), int(release_year[1])]
+        if genres:
+            where.append(f"m.path IN (SELECT path FROM movie_genres WHERE genre IN ({', '.join('?' * len(genres))}))")
+            args += list(genres)
+        if services:
+            where.append(f"m.path IN (SELECT path FROM movie_services "
+                         f"WHERE service IN ({', '.join('?' * len(services))}))")
+            args += list(services)
+        query = "SELECT m.path, m.title, m.release_year, m.rating, m.num_votes, m.director, " \
+                "(SELECT group_concat(genre, '/') FROM " \
+                "(SELECT genre FROM movie_genres g WHERE g.path = m.path ORDER BY position)) " \
+                f"FROM movies m WHERE {' AND '.join(where)} " \
+                "ORDER BY m.rating DESC, m.num_votes DESC, m.path LIMIT ? OFFSET ?"
+        with self._lock:
+            rows = self._conn.execute(query, args + [limit, offset]).fetchall()
+        return [models.Movie.create(path=path, title=title, release_year=year, rating=rating, num_votes=num_votes,
+                                    director=director, genres=genres.split("/") if genres else [])
+                for path, title, year, rating, num_votes, director, genres in rows]
+
+    def movies(self) -> typing.Generator[models.Movie, None, None]:
+        """
+        Generator function. Yields every movie in the catalog with its services.
+        :return: generator
+        """
+        query = "SELECT m.path, m.title, m.release_year, m.rating, m.num_votes, m.director, " \
+                "(SELECT group_concat(genre, '/') FROM " \
+                "(SELECT genre FROM movie_genres g WHERE g.path = m.path ORDER BY position)), " \
+                "(SELECT group_concat(service, '/') FROM movie_services s WHERE s.path = m.path) " \
+                "FROM movies m ORDER BY m.path"
+        with self._lock:
+            rows = self._conn.execute(query).fetchall()
+        for path, title, year, rating, num_votes, director, genres, services in rows:
+            movie = models.Movie.create(path=path, title=title, release_year=year, rating=rating,
+                                        num_votes=num_votes, director=director,
+                                        genres=genres.split("/") if genres else [])
+            yield dataclasses.replace(movie, services=tuple(sys.intern(s) for s in services.split("/"))
+                                      if services else ())
+
+    def search_page(self, params: dict, page: int, votes_threshold: int = 0) -> list[models.Movie]:
+        """
+        Answer an /api/search request (see FilmVandaagScraper.search_cursor) from the catalog.
+        """
+        return self.search(services=params.get("vod[]"),
+                           genres=params.get("genre[]"),
+                           imdb_score=params.get("imdb-score[]"),
+                           release_year=params.get("jaar[]"),
+                           votes_threshold=votes_threshold,
+                           limit=LOCAL_PAGE_SIZE,
+                           offset=page * LOCAL_PAGE_SIZE)
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class CatalogCrawler:
+    """
+    Mirrors the /api/search results of every service into the catalog, every interval seconds.
+    fetch_page(params, page) returns the movies of one result page, an empty list after the last page.
+    """
+
+    def __init__(self, catalog: MovieCatalog, fetch_page: typing.Callable[[dict, int], list],
+                 services: list[str], interval: float = DEFAULT_CRAWL_INTERVAL,
+                 delay: float = DEFAULT_CRAWL_DELAY) -> None:
+        self.catalog = catalog
+        self.fetch_page = fetch_page
+        self.services = services
+        self.interval = interval
+        self.delay = delay
+        self._stop = threading.Event()
+
+    def __repr__(self):
+        return f"CatalogCrawler(catalog={self.catalog}, services={self.services}, interval={self.interval})"
+
+    def crawl(self) -> int:
+        """
+        Crawl all services once.
+        :return: number of movies crawled
+        """
+        total = 0
+        for service in self.services:
+            started = time.time()
+            params = {"categorie": "films", "sorteer[]": "imdb-score", "genre-filter": "of", "vod[]": [service]}
+            page = 0
+            while not self._stop.is_set():
+                movies = self.fetch_page(params, page)
+                if not movies:
+                    break
+                self.catalog.upsert(movies, service, crawled_at=started)
+                total += len(movies)
+                page += 1
+                self._stop.wait(self.delay)
+            else:
+                return total  # stopped halfway, keep what the previous crawl knew
+            removed = self.catalog.prune(service, crawled_before=started)
+            log.info(f"Crawled {page} pages of {service}. {removed} movies no longer available.")
+        return total
+
+    def start(self) -> threading.Thread:
+        self._stop.clear()
+        thread = threading.Thread(target=self._loop, name="catalog-crawler", daemon=True)
+        thread.start()
+        log.info(f"Catalog crawler started: {self}")
+        return thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                log.info(f"Catalog crawl finished: {self.crawl()} movies.")
+            except Exception as err:
+                log.error(f"Catalog crawl failed: {err}")
+            self._stop.wait(self.interval)
@@ -0,0 +1,115 @@
+import dataclasses
+import itertools
+import logging
+
+import models
+
+log = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class SearchCursor:
+    """
+    Position in the results of a search: the /api/search params, the result page and the offset in that page.
+    Holds no connections or parse trees, so it can be pickled and resumed on any scraper.
+    Local cursors page through the local catalog instead of /api/search.
+    """
+    params: dict
+    votes_threshold: int
+    page: int = 0
+    offset: int = 0
+    local: bool = False
+    stale: bool = dataclasses.field(default=False, compare=False)  # the last batch came from an expired page
+    # the movies of the current page and the futures of read-ahead page fetches, not pickled
+    _page_movies: list = dataclasses.field(default=None, repr=False, compare=False)
+    _prefetches: dict = dataclasses.field(default_factory=dict, repr=False, compare=False)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_page_movies"] = None
+        state["_prefetches"] = {}
+        return state
+
+    def next_batch(self, scraper, size: int) -> list[models.Movie]:
+        """
+        Return the next (at most) size movies and advance the cursor past them.
+        """
+        movies = []
+        self.stale = False
+        while len(movies) < size:
+            if self._page_movies is None:
+                self._page_movies = scraper.search_page(self.params, self.page, self.votes_threshold, self.local)
+                if not self.local:
+                    self.stale = self.stale or scraper.search_page_stale(self.params, self.page)
+                if self._page_movies and not self.local:
+                    self._prefetch(scraper)
+            page_movies = self._page_movies
+            if not page_movies:
+                log.info(f"Results empty. No more results available on this page ({self.page}).")
+                break
+            while self.offset < len(page_movies) and len(movies) < size:
+                movie = page_movies[self.offset]
+                self.offset += 1
+                if movie.num_votes < self.votes_threshold:
+                    log.info(f"Number of votes {movie.num_votes} below threshold {self.votes_threshold}. Discarded.")
+                else:
+                    movies.append(movie)
+            if self.offset >= len(page_movies):
+                self.page += 1
+                self.offset = 0
+                self._page_movies = None
+        return movies
+
+    def _prefetch(self, scraper) -> None:
+        # read ahead while the user is looking at this page
+        for page in range(self.page + 1, self.page + 1 + scraper.prefetch_depth):
+            if page not in self._prefetches:
+                self._prefetches[page] = scraper.prefetch_search_page(self.params, page)
+
+    def close(self) -> None:
+        """
+        Cancel the read-ahead fetches that have not started yet.
+        """
+        for future in self._prefetches.values():
+            future.cancel()
+        self._prefetches.clear()
+
+
+@dataclasses.dataclass
+class NewMoviesCursor:
+    """
+    Position in the merged new-movies listing of some services, newest first or, if ranked, best rated first.
+    The listing itself comes from the scraper's cache, so resuming is cheap.
+    """
+    services: list
+    added_days_ago: int
+    votes_threshold: int
+    rating_threshold: int
+    offset: int = 0
+    ranked: bool = False
+    stale: bool = dataclasses.field(default=False, compare=False)  # the last batch came from an expired listing
+
+    def next_batch(self, scraper, size: int) -> list[models.Movie]:
+        """
+        Return the next (at most) size movies and advance the cursor past them.
+        """
+        if self.ranked:
+            # the top offset + size, of which the first offset movies were in earlier batches
+            batch = scraper.rank_new_movies(self.services, added_days_ago=self.added_days_ago,
+                                            k=self.offset + size,
+                                            votes_threshold=self.votes_threshold,
+                                            rating_threshold=self.rating_threshold)[self.offset:]
+            self.offset += len(batch)
+            self.stale = scraper.new_movies_stale(self.services)
+            return batch
+        movies = scraper.scrape_new_movies(self.services,
+                                           added_days_ago=self.added_days_ago,
+                                           votes_threshold=self.votes_threshold,
+                                           rating_threshold=self.rating_threshold)
+        batch = list(itertools.islice(movies, self.offset, self.offset + size))
+        self.offset += len(batch)
+        self.stale = scraper.new_movies_stale(self.services)
+        return batch
+
+    def close(self) -> None:
+        pass
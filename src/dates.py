@@ -0,0 +1,71 @@
+import datetime
+import functools
+import logging
+import re
+
+log = logging.getLogger(__name__)
+
+MONTHS = {"januari": 1, "jan": 1,
+          "februari": 2, "feb": 2,
+          "maart": 3, "mrt": 3, "mar": 3,
+          "april": 4, "apr": 4,
+          "mei": 5,
+          "juni": 6, "jun": 6,
+          "juli": 7, "jul": 7,
+          "augustus": 8, "aug": 8,
+          "september": 9, "sep": 9, "sept": 9,
+          "oktober": 10, "okt": 10,
+          "november": 11, "nov": 11,
+          "december": 12, "dec": 12}
+WEEKDAYS = ["maandag", "dinsdag", "woensdag", "donderdag", "vrijdag", "zaterdag", "zondag",
+            "ma", "di", "wo", "do", "vr", "za", "zo"]
+RELATIVE_DAYS = [("eergisteren", 2), ("gisteren", 1), ("vandaag", 0)]
+
+HEADING_RE = re.compile(r"^(?:(?:" + "|".join(WEEKDAYS) + r")\.?,?\s+)?"
+                        r"(?P<day>\d{1,2})\s+(?P<month>[a-z]+)\.?(?:\s+(?P<year>\d{4}))?$")
+
+
+def parse_heading_date(heading: str, now: datetime.datetime = None) -> datetime.datetime:
+    """
+    Parse a date heading of a filmvandaag listing, like "Vandaag", "gisteren" or "maandag 12 juni".
+    Relative headings get the current time of day, like dateparser gives them, dates get midnight.
+    A date without a year is taken to be the most recent such date.
+    :return: datetime
+    """
+    now = now or datetime.datetime.now()
+    date, relative = _parse_heading(heading.strip().lower(), now.date())
+    return datetime.datetime.combine(date, now.time() if relative else datetime.time.min)
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_heading(heading: str, today: datetime.date) -> (datetime.date, bool):
+    for word, days_ago in RELATIVE_DAYS:
+        if word in heading:
+            return today - datetime.timedelta(days=days_ago), True
+    m = HEADING_RE.match(heading)
+    if m and m.group("month") in MONTHS:
+        day, month = int(m.group("day")), MONTHS[m.group("month")]
+        year = int(m.group("year")) if m.group("year") else today.year
+        try:
+            date = datetime.date(year, month, day)
+            if not m.group("year") and date > today:
+                date = datetime.date(year - 1, month, day)
+            return date, False
+        except ValueError:  # e.g. 29 februari in the wrong year, let dateparser decide
+            pass
+    return _dateparser_fallback(heading), False
+
+
+@functools.cache
+def _dateparser():
+    import dateparser  # slow to import, only needed for unexpected headings
+    # only the Dutch language data is loaded, once, instead of on every dateparser.parse() call
+    return dateparser.DateDataParser(languages=["nl"], settings={"PREFER_DATES_FROM": "past"})
+
+
+def _dateparser_fallback(heading: str) -> datetime.date:
+    log.info(f"Unknown date heading format: {repr(heading)}. Falling back to dateparser.")
+    dt = _dateparser().get_date_data(heading).date_obj
+    if dt is None:
+        raise ValueError(f"Could not parse date heading: {repr(heading)}")
+    return dt.date()
@@ -0,0 +1,175 @@
+import collections
+import contextlib
+import dataclasses
+import logging
+import threading
+import time
+import typing
+
+log = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 2
+DEFAULT_MAX_PAGES = 50
+DEFAULT_LEASE_TIMEOUT = 30.0
+DEFAULT_CONNECT_RETRIES = 5
+DEFAULT_CONNECT_DELAY = 1.0
+
+
+class DriverUnavailable(Exception):
+    pass
+
+
+def get_chrome_driver(connstr: str, retries: int = DEFAULT_CONNECT_RETRIES,
+                      delay: float = DEFAULT_CONNECT_DELAY) -> "selenium.webdriver.remote.webdriver.WebDriver":
+    """
+    Get the remote chrome_driver
+    Build Chrome options. This configuration is required for chromedriver to function properly in a docker container.
+    Selenium is imported here, it is slow to import and not needed on the request path.
+    Retries with doubling delays and raises DriverUnavailable when no connection could be made.
+    :return: the driver
+    """
+    from selenium import webdriver
+    import selenium.webdriver.chrome.options
+    chrome_options = webdriver.chrome.options.Options()
+    chrome_options.add_argument("--headless")
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    for attempt in range(retries):
+        try:
+            log.info(f"Connecting to selenium Chrome instance @{connstr}...")
+            driver = webdriver.Remote(f"http://{connstr}/wd/hub", options=chrome_options)
+        except Exception as err:
+            log.error(f"Error connecting to Selenium driver: {err}")
+            if attempt + 1 < retries:
+                log.error(f"Retrying in {delay * 2 ** attempt} seconds..")
+                time.sleep(delay * 2 ** attempt)
+            continue
+        log.info("Connection established.")
+        return driver
+    raise DriverUnavailable(f"No connection to Selenium @{connstr} after {retries} attempts.")
+
+
+@dataclasses.dataclass(eq=False)
+class PooledDriver:
+    driver: typing.Any
+    pages: int = 0
+
+
+class DriverPool:
+    """
+    At most size browser drivers, created on demand by factory() and handed out with lease(). A driver is checked
+    to be alive before it is leased and after a lease that raised, and is replaced after max_pages leases.
+    """
+
+    def __init__(self, factory: typing.Callable[[], typing.Any], size: int = DEFAULT_POOL_SIZE,
+                 max_pages: int = DEFAULT_MAX_PAGES, lease_timeout: float = DEFAULT_LEASE_TIMEOUT) -> None:
+        self.factory = factory
+        self.size = size
+        self.max_pages = max_pages
+        self.lease_timeout = lease_timeout
+        self._idle = collections.deque()
+        self._count = 0  # idle plus leased drivers, and drivers being created
+        self._cond = threading.Condition()
+        self._closed = False
+        self.stats = collections.Counter()
+        log.info(f"DriverPool initialized: {self}")
+
+    def __repr__(self):
+        return f"DriverPool(size={self.size}, max_pages={self.max_pages}, lease_timeout={self.lease_timeout})"
+
+    @staticmethod
+    def is_alive(driver) -> bool:
+        try:
+            driver.current_url
+        except Exception as err:
+            log.warning(f"Driver is not responding: {err}")
+            return False
+        return True
+
+    @contextlib.contextmanager
+    def lease(self, timeout: float = None):
+        """
+        Context manager. Lease a driver for one page.
+        :return: the driver
+        """
+        pooled = self._acquire(self.lease_timeout if timeout is None else timeout)
+        ok = False
+        try:
+            yield pooled.driver
+            ok = True
+        finally:
+            pooled.pages += 1
+            self._release(pooled, check=not ok)
+
+    def _acquire(self, timeout: float) -> PooledDriver:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._cond:
+                while not self._idle and self._count >= self.size:
+                    if self._closed:
+                        raise DriverUnavailable("Driver pool is closed.")
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["timeouts"] += 1
+                        raise DriverUnavailable(f"No driver available within {timeout}s.")
+                    self._cond.wait(remaining)
+                if self._closed:
+                    raise DriverUnavailable("Driver pool is closed.")
+                pooled = self._idle.popleft() if self._idle else None
+                if pooled is None:
+                    self._count += 1  # reserve the slot while creating outside the lock
+            if pooled is None:
+                try:
+                    pooled = PooledDriver(self.factory())
+                except Exception:
+                    with self._cond:
+                        self._count -= 1
+                        self._cond.notify()
+                    raise
+                self.stats["created"] += 1
+                return pooled
+            if self.is_alive(pooled.driver):
+                return pooled
+            self.stats["dead"] += 1
+            self._discard(pooled)
+
+    def _release(self, pooled: PooledDriver, check: bool) -> None:
+        if pooled.pages >= self.max_pages:
+            self.stats["recycled"] += 1
+            self._discard(pooled)
+        elif check and not self.is_alive(pooled.driver):
+            self.stats["dead"] += 1
+            self._discard(pooled)
+        else:
+            with self._cond:
+                if self._closed:
+                    self._count -= 1
+                    self._quit(pooled)
+                else:
+                    self._idle.append(pooled)
+                self._cond.notify()
+
+    def _discard(self, pooled: PooledDriver) -> None:
+        self._quit(pooled)
+        with self._cond:
+            self._count -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _quit(pooled: PooledDriver) -> None:
+        try:
+            pooled.driver.quit()
+        except Exception as err:
+            log.warning(f"Quitting driver failed: {err}")
+
+    def close(self) -> None:
+        """
+        Quit the idle drivers, leased drivers are quit when they are returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), collections.deque()
+            self._count -= len(idle)
+            self._cond.notify_all()
+        for pooled in idle:
+            self._quit(pooled)
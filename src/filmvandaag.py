@@ -5,13 +5,27 @@ import logging
 import pprint
 import signal
 import argparse
+import subprocess
+import sys
 
 import telegram_alert
 
-import bot, scraper
+import bot, metrics, resilience, scraper, store
 
 config ={}
 
+STARTUP_BUDGET = 3.0
+# imports the program and builds the scraper and bot, i.e. everything before start_polling
+STARTUP_CHECK_CODE = """
+import time
+start = time.perf_counter()
+import filmvandaag
+imported = time.perf_counter()
+fv_scraper = filmvandaag.scraper.FilmVandaagScraper({})
+filmvandaag.bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:startup-check"}, fv_scraper)
+print(imported - start, time.perf_counter() - imported)
+"""
+
 
 def signal_handler(signum, frame):
     raise OSError(f"Signal received: {signum}")
@@ -26,32 +40,139 @@ def build_config() -> dict:
     :return:
     """
     config["TG_FV_BOT_TOKEN"] = os.environ["TG_FV_BOT_TOKEN"]
+    config["TG_API_URL"] = os.environ.get("TG_API_URL")
     config["TG_ALERT_CHANNEL"] = os.environ["TG_ALERT_CHANNEL"]
     config["TG_ALERT_BOT_TOKEN"] = os.environ["TG_ALERT_BOT_TOKEN"]
     config["TG_ALERT_INSTANCE_NAME"] = os.environ.get("TG_ALERT_INSTANCE_NAME", "unknown")
-    config["SELENIUM_CONNSTR"] = os.environ["SELENIUM_CONNSTR"]
+    config["SELENIUM_CONNSTR"] = os.environ.get("SELENIUM_CONNSTR")
+    config["DRIVER_POOL_SIZE"] = int(os.environ.get("DRIVER_POOL_SIZE", 2))
+    config["DRIVER_MAX_PAGES"] = int(os.environ.get("DRIVER_MAX_PAGES", 50))
+    config["DRIVER_LEASE_TIMEOUT"] = float(os.environ.get("DRIVER_LEASE_TIMEOUT", 30))
     config["NEW_MOVIES_MIN_RATING"] = int(os.environ.get("NEW_MOVIES_MIN_RATING", 5))
     config["NEW_MOVIES_THRESHOLD_DAYS"] = int(os.environ.get("NEW_MOVIES_THRESHOLD_DAYS", 7))
     config["IMDB_VOTES_THRESHOLD"] = int(os.environ.get("IMDB_VOTES_THRESHOLD", 10000))
+    config["SCRAPE_WORKERS"] = int(os.environ.get("SCRAPE_WORKERS", 4))
+    config["HTTP_POOL_SIZE"] = int(os.environ.get("HTTP_POOL_SIZE", 10))
+    config["HTTP_TIMEOUT"] = float(os.environ.get("HTTP_TIMEOUT", 10.0))
+    config["HTTP_RETRIES"] = int(os.environ.get("HTTP_RETRIES", 2))
+    config["HTTP_RETRY_BUDGET"] = float(os.environ.get("HTTP_RETRY_BUDGET", 15.0))
+    config["BREAKER_FAILURE_THRESHOLD"] = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))
+    config["BREAKER_RESET_TIMEOUT"] = float(os.environ.get("BREAKER_RESET_TIMEOUT", 30.0))
+    config["NEW_MOVIES_CACHE_TTL"] = float(os.environ.get("NEW_MOVIES_CACHE_TTL", 900))
+    config["NEW_MOVIES_CACHE_SIZE"] = int(os.environ.get("NEW_MOVIES_CACHE_SIZE", 16))
+    config["NEW_MOVIES_REFRESH_INTERVAL"] = float(os.environ.get("NEW_MOVIES_REFRESH_INTERVAL", 600))
+    config["NEW_MOVIES_HOT_SECONDS"] = float(os.environ.get("NEW_MOVIES_HOT_SECONDS", 3600))
+    config["NEW_MOVIES_RANKED"] = os.environ.get("NEW_MOVIES_RANKED", "1") == "1"
+    config["NEW_MOVIES_STREAMING"] = os.environ.get("NEW_MOVIES_STREAMING", "0") == "1"
+    config["SEARCH_CACHE_SIZE"] = int(os.environ.get("SEARCH_CACHE_SIZE", 512))
+    config["SEARCH_CACHE_TTL"] = float(os.environ.get("SEARCH_CACHE_TTL", 3600))
+    config["SEARCH_PREFETCH_PAGES"] = int(os.environ.get("SEARCH_PREFETCH_PAGES", 1))
+    config["PREFETCH_WORKERS"] = int(os.environ.get("PREFETCH_WORKERS", 4))
+    config["HTML_PARSER"] = os.environ.get("HTML_PARSER", "lxml")
+    config["HTML_STRAINED"] = os.environ.get("HTML_STRAINED", "1") == "1"
+    config["BOT_WORKERS"] = int(os.environ.get("BOT_WORKERS", 8))
+    config["SCRAPE_CONCURRENCY"] = int(os.environ.get("SCRAPE_CONCURRENCY", 4))
+    config["SCRAPE_PER_USER"] = int(os.environ.get("SCRAPE_PER_USER", 1))
+    config["SCRAPE_QUEUE"] = int(os.environ.get("SCRAPE_QUEUE", 16))
+    config["ALERT_COALESCE_WINDOW"] = float(os.environ.get("ALERT_COALESCE_WINDOW", 60))
+    config["OUTBOUND_GLOBAL_RATE"] = float(os.environ.get("OUTBOUND_GLOBAL_RATE", 25))
+    config["OUTBOUND_CHAT_RATE"] = float(os.environ.get("OUTBOUND_CHAT_RATE", 1))
+    config["OUTBOUND_CHAT_BURST"] = int(os.environ.get("OUTBOUND_CHAT_BURST", 3))
+    config["SUBSCRIPTION_NOTIFY_INTERVAL"] = float(os.environ.get("SUBSCRIPTION_NOTIFY_INTERVAL", 60))
+    config["SEARCH_MODE"] = os.environ.get("SEARCH_MODE", "live")
+    config["BOT_MODE"] = os.environ.get("BOT_MODE", "polling")
+    config["WEBHOOK_URL"] = os.environ.get("WEBHOOK_URL")
+    config["WEBHOOK_PATH"] = os.environ.get("WEBHOOK_PATH")
+    config["WEBHOOK_LISTEN"] = os.environ.get("WEBHOOK_LISTEN", "0.0.0.0")
+    config["WEBHOOK_PORT"] = int(os.environ.get("WEBHOOK_PORT", 8443))
+    config["STATE_STORE"] = os.environ.get("STATE_STORE")
+    # /volg subscriptions survive a restart: in the shared state store if there is one, else in a file of their own
+    shared = config["STATE_STORE"] if config["STATE_STORE"] != "memory" else None
+    config["SUBSCRIPTION_STORE"] = os.environ.get("SUBSCRIPTION_STORE", shared or "subscriptions.db")
+    config["CATALOG_PATH"] = os.environ.get("CATALOG_PATH")
+    config["CATALOG_CRAWL_INTERVAL"] = float(os.environ.get("CATALOG_CRAWL_INTERVAL", 24 * 3600))
+    config["CATALOG_CRAWL_DELAY"] = float(os.environ.get("CATALOG_CRAWL_DELAY", 1.0))
     return config
 
 
+def breaker_alerts(alert_bot: telegram_alert.TelegramAlertBot):
+    """
+    Listener for the circuit breakers of the scraper's endpoints. Alerts when an endpoint goes down and when it
+    is back, not on every failed request nor on every trial call while it is down.
+    """
+    def listener(breaker: resilience.CircuitBreaker, old: str, new: str) -> None:
+        if old == resilience.CLOSED and new == resilience.OPEN:
+            alert_bot.error(f"{breaker.name} is down after {breaker.failures} failed requests, "
+                            f"serving cached results.")
+        elif new == resilience.CLOSED:
+            alert_bot.info(f"{breaker.name} is back.")
+    return listener
+
+
+def check_startup(budget: float, top: int = 15) -> bool:
+    """
+    Start the program up to start_polling in a fresh interpreter with -X importtime and report the slowest
+    imports and the time taken.
+    :return: True if startup took at most budget seconds
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_CHECK_CODE],
+                          cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+    if proc.returncode:
+        print("\n".join(line for line in proc.stderr.splitlines() if not line.startswith("import time:")),
+              file=sys.stderr)
+        return False
+    imports = []
+    for line in proc.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            imports.append((int(cumulative) / 1e6, name.rstrip()))
+    import_seconds, build_seconds = (float(t) for t in proc.stdout.split())
+    print(f"{'cumulative':>10}  module")
+    for cumulative, name in sorted(imports, reverse=True)[:top]:
+        print(f"{cumulative * 1000:>8.1f}ms {name}")
+    total = import_seconds + build_seconds
+    print(f"Imports {import_seconds * 1000:.0f}ms, building scraper and bot {build_seconds * 1000:.0f}ms. "
+          f"Startup {total * 1000:.0f}ms, budget {budget * 1000:.0f}ms: {'OK' if total <= budget else 'TOO SLOW'}")
+    return total <= budget
+
+
 if __name__ == "__main__":
     argparser = argparse.ArgumentParser(description="FilmVandaag. Voor uw selectie naar keuze.")
     argparser.add_argument("-v", "--verbose", action="store_true", help="Enable verbose logging.")
+    argparser.add_argument("--metrics-port", type=int, default=int(os.environ.get("METRICS_PORT", 0)),
+                           help="Serve metrics on http://127.0.0.1:<port>/metrics. Default: $METRICS_PORT, 0 is off.")
+    argparser.add_argument("--profile", metavar="FILE",
+                           help="Dump the cProfile stats of the first new-movies scrape to FILE.")
+    argparser.add_argument("--check-startup", action="store_true",
+                           help="Report the import time per module and check the startup time budget, then exit.")
+    argparser.add_argument("--startup-budget", type=float, default=float(os.environ.get("STARTUP_BUDGET", STARTUP_BUDGET)),
+                           help=f"Startup time budget in seconds. Default: $STARTUP_BUDGET or {STARTUP_BUDGET}.")
     args = argparser.parse_args()
+    if args.check_startup:
+        sys.exit(0 if check_startup(args.startup_budget) else 1)
 
     loglevel = logging.DEBUG if args.verbose else logging.INFO
     logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
                      level=loglevel)
     build_config()
+    config["PROFILE_SCRAPE"] = args.profile
     logging.info("Program started with config:")
     logging.info(pprint.pformat(config))
     alert_bot = telegram_alert.TelegramAlertBot(config, "FilmVandaag")
     alert_bot.info("Program started.")
     try:
-        fv_scraper = scraper.FilmVandaagScraper(config)
-        fv_bot = bot.FilmVandaagBot(config, fv_scraper)
+        if args.metrics_port:
+            metrics.MetricsServer(args.metrics_port).start()
+        state_store = store.open_store(config["STATE_STORE"])
+        subscription_store = state_store if config["SUBSCRIPTION_STORE"] == config["STATE_STORE"] \
+            else store.open_store(config["SUBSCRIPTION_STORE"])
+        fv_scraper = scraper.FilmVandaagScraper(config, store=state_store)
+        fv_scraper.http.add_breaker_listener(breaker_alerts(alert_bot))
+        fv_scraper.start_refresher()
+        if fv_scraper.catalog is not None:
+            fv_scraper.start_catalog_crawler()
+        fv_bot = bot.FilmVandaagBot(config, fv_scraper, state_store=state_store,
+                                    subscription_store=subscription_store)
         fv_bot.start()
         while True:
             time.sleep(60)
@@ -61,4 +182,5 @@ if __name__ == "__main__":
         logging.error(f"A fatal exception occurred: {str(err)}")
         raise
     finally:
-        alert_bot.info("Program ended.")
\ No newline at end of file
+        alert_bot.info("Program ended.")
+        alert_bot.close()
\ No newline at end of file
@@ -0,0 +1,185 @@
+import collections
+import logging
+import threading
+import time
+import typing
+import urllib.parse
+
+import requests
+import requests.adapters
+import urllib3.util
+
+import metrics
+import resilience
+
+log = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_VALIDATORS = 256
+DEFAULT_CHUNK_SIZE = 16 * 1024
+DEFAULT_RETRIES = 2
+DEFAULT_RETRY_BUDGET = 15.0
+
+REQUEST_SECONDS = metrics.histogram("filmvandaag_http_request_seconds",
+                                    "Time until the response body of a GET was read, or its headers when streamed.")
+RETRIES = metrics.counter("filmvandaag_http_retries_total", "GET requests retried after a transient failure.")
+
+
+def is_transient(err: Exception) -> bool:
+    """
+    Whether a request that failed with err may succeed when retried: connection errors, timeouts, 5xx and 429.
+    """
+    if isinstance(err, requests.HTTPError):
+        return err.response is not None and (err.response.status_code >= 500 or err.response.status_code == 429)
+    return isinstance(err, (requests.ConnectionError, requests.Timeout))
+
+
+class HttpClient:
+    """
+    Pooled HTTP client. Keeps connections alive, asks for compressed responses and revalidates earlier responses
+    with If-None-Match/If-Modified-Since. The parsed result of a response is kept next to its validators so a
+    304 Not Modified is answered without parsing anything.
+    Transient failures are retried at most retries times with jittered exponential backoff, all attempts of a
+    request within retry_budget seconds. Every endpoint (host and path) has a circuit breaker, requests to an
+    endpoint whose breaker is open fail at once with resilience.CircuitOpen.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 max_validators: int = DEFAULT_MAX_VALIDATORS,
+                 retries: int = DEFAULT_RETRIES,
+                 retry_budget: float = DEFAULT_RETRY_BUDGET,
+                 failure_threshold: int = resilience.DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = resilience.DEFAULT_RESET_TIMEOUT,
+                 sleep: typing.Callable[[float], None] = time.sleep) -> None:
+        self.timeout = timeout
+        self.max_validators = max_validators
+        self.retries = retries
+        self.retry_budget = retry_budget
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.sleep = sleep
+        self.breakers = {}  # endpoint -> CircuitBreaker
+        self._breaker_listeners = []
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # gzip and deflate, plus br when a brotli package is installed
+        self.session.headers["Accept-Encoding"] = urllib3.util.make_headers(accept_encoding=True)["accept-encoding"]
+        self._validators = collections.OrderedDict()
+        self._lock = threading.Lock()
+        log.info(f"HttpClient initialized: {self}")
+
+    def __repr__(self):
+        return f"HttpClient(timeout={self.timeout}, max_validators={self.max_validators}, retries={self.retries}, " \
+               f"retry_budget={self.retry_budget}, accept_encoding={repr(self.session.headers['Accept-Encoding'])})"
+
+    def breaker(self, url: str) -> resilience.CircuitBreaker:
+        """
+        :return: the circuit breaker of the endpoint of url
+        """
+        parts = urllib.parse.urlsplit(url)
+        endpoint = f"{parts.netloc}{parts.path}"
+        with self._lock:
+            breaker = self.breakers.get(endpoint)
+            if breaker is None:
+                breaker = self.breakers[endpoint] = resilience.CircuitBreaker(
+                    endpoint, failure_threshold=self.failure_threshold, reset_timeout=self.reset_timeout)
+                for listener in self._breaker_listeners:
+                    breaker.add_listener(listener)
+            return breaker
+
+    def add_breaker_listener(self, listener: typing.Callable[[resilience.CircuitBreaker, str, str], None]) -> None:
+        """
+        Call listener(breaker, old_state, new_state) when the circuit breaker of an endpoint changes state.
+        """
+        with self._lock:
+            self._breaker_listeners.append(listener)
+            breakers = list(self.breakers.values())
+        for breaker in breakers:
+            breaker.add_listener(listener)
+
+    def _request(self, url: str, method: str, **kwargs) -> requests.Response:
+        """
+        GET the url through the breaker of its endpoint, retrying transient failures.
+        :return: the response, a 304 Not Modified or a successful one
+        """
+        breaker = self.breaker(url)
+        deadline = time.monotonic() + self.retry_budget
+        timeout = kwargs.pop("timeout", None) or self.timeout
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise resilience.CircuitOpen(f"Circuit breaker of {breaker.name} is open, "
+                                             f"retry in {breaker.retry_in():.0f}s.")
+            try:
+                with REQUEST_SECONDS.time(method=method):
+                    resp = self.session.get(url, timeout=max(0.1, min(timeout, deadline - time.monotonic())),
+                                            **kwargs)
+                if resp.status_code != 304:
+                    resp.raise_for_status()
+            except Exception as err:
+                if not is_transient(err):
+                    breaker.record_success()  # the endpoint answered
+                    raise
+                breaker.record_failure()
+                delay = resilience.jittered_backoff(attempt)
+                if attempt >= self.retries or time.monotonic() + delay >= deadline:
+                    raise
+                attempt += 1
+                RETRIES.inc(method=method)
+                log.warning(f"GET {url} failed: {err}. Retry {attempt} of {self.retries} in {delay:.2f}s.")
+                self.sleep(delay)
+                continue
+            breaker.record_success()
+            return resp
+
+    def get(self, url: str, params: dict = None, parse: typing.Callable = None, timeout: float = None):
+        """
+        GET the url and return parse(response), or the response itself if no parse function is given.
+        :return: the parsed response
+        """
+        key = requests.Request("GET", url, params=params).prepare().url
+        with self._lock:
+            cached = self._validators.get(key)
+        headers = {}
+        if cached:
+            etag, last_modified, _ = cached
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        resp = self._request(url, "get", params=params, headers=headers, timeout=timeout)
+        if resp.status_code == 304 and cached:
+            log.info(f"Not modified: {key}")
+            with self._lock:
+                self._validators.move_to_end(key)
+            return cached[2]
+        resp.raise_for_status()
+        result = parse(resp) if parse else resp
+        etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+        if parse and (etag or last_modified):
+            with self._lock:
+                self._validators[key] = (etag, last_modified, result)
+                self._validators.move_to_end(key)
+                while len(self._validators) > self.max_validators:
+                    self._validators.popitem(last=False)
+        return result
+
+    def stream(self, url: str, params: dict = None, timeout: float = None,
+               chunk_size: int = DEFAULT_CHUNK_SIZE) -> typing.Generator[str, None, None]:
+        """
+        Generator function. GET the url and yield the decoded body in chunks as it arrives. Closing the generator
+        closes the connection, so the rest of the body is never transferred.
+        :return: generator
+        """
+        resp = self._request(url, "stream", params=params, stream=True, timeout=timeout)
+        with resp:
+            resp.raise_for_status()
+            resp.encoding = resp.encoding or "utf-8"
+            yield from resp.iter_content(chunk_size=chunk_size, decode_unicode=True)
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,284 @@
+"""
+Counters, gauges and histograms of the running bot, served in the Prometheus text format by MetricsServer.
+"""
+import bisect
+import contextlib
+import functools
+import http.server
+import logging
+import threading
+import time
+import typing
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUANTILES = (0.5, 0.99)
+
+
+def _labels_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(name={repr(self.name)})"
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"] + self._samples()
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            return [f"{self.name}{_labels_text(k)} {v}" for k, v in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str) -> None:
+        super().__init__(name, help)
+        self._values = {}
+        self._functions = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def set_function(self, function: typing.Callable[[], float], **labels) -> None:
+        """
+        Read the value from function() whenever the metrics are collected.
+        """
+        with self._lock:
+            self._functions[tuple(sorted(labels.items()))] = function
+
+    def value(self, **labels) -> float:
+        key = tuple(sorted(labels.items()))
+        return self._functions[key]() if key in self._functions else self._values.get(key, 0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, function in functions.items():
+            try:
+                values[key] = function()
+            except Exception as err:
+                log.error(f"Reading gauge {self.name}{_labels_text(key)} failed: {err}")
+        return [f"{self.name}{_labels_text(k)} {v}" for k, v in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """
+    Cumulative bucket counts, sum and count per label set, like a Prometheus histogram. The p50 and p99 estimated
+    from the buckets are exported as the gauge <name>_quantile.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: typing.Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labels -> [bucket counts (+Inf last), sum]
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(sorted(labels.items())))
+        return sum(series[0]) if series else 0
+
+    def quantile(self, q: float, **labels) -> float:
+        """
+        Estimate the q-quantile by linear interpolation within its bucket, like histogram_quantile().
+        """
+        series = self._series.get(tuple(sorted(labels.items())))
+        if not series:
+            return float("nan")
+        with self._lock:
+            counts = list(series[0])
+        return self._quantile(q, counts)
+
+    def _quantile(self, q: float, counts: list[int]) -> float:
+        total = sum(counts)
+        if not total:
+            return float("nan")
+        rank = q * total
+        cumulative = 0
+        for i, n in enumerate(counts):
+            if cumulative + n >= rank and n:
+                if i == len(self.buckets):  # in the +Inf bucket
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / n
+            cumulative += n
+        return self.buckets[-1]
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            series = {k: list(v[0]) for k, v in self._series.items()}
+        lines += [f"# HELP {self.name}_quantile {self.help} (estimated quantiles)",
+                  f"# TYPE {self.name}_quantile gauge"]
+        for key, counts in sorted(series.items()):
+            for q in QUANTILES:
+                lines.append(f"{self.name}_quantile{_labels_text(key + (('quantile', q),))} "
+                             f"{self._quantile(q, counts)}")
+        return lines
+
+    def _samples(self) -> list[str]:
+        lines = []
+        with self._lock:
+            series = {k: (list(v[0]), v[1]) for k, v in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels_text(key + (('le', bound),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels_text(key)} {total}")
+            lines.append(f"{self.name}_count{_labels_text(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self) -> None:
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Registry(metrics={len(self._metrics)})"
+
+    def _get_or_create(self, cls, name: str, help: str, **kwargs) -> Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is a {type(metric).__name__}, not a {cls.__name__}.")
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get_or_create(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get_or_create(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: typing.Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def timed(hist: Histogram, **labels):
+    """
+    Decorator observing the duration of every call in hist.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with hist.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsServer:
+    """
+    Serves the metrics of registry on http://<host>:<port>/metrics from a daemon thread.
+    """
+
+    def __init__(self, port: int, host: str = "127.0.0.1", registry: Registry = REGISTRY) -> None:
+        self.registry = registry
+        self.server = http.server.ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def __repr__(self):
+        host, port = self.server.server_address[:2]
+        return f"MetricsServer(host={repr(host)}, port={port})"
+
+    @property
+    def port(self) -> int:
+        return self.server.server_port
+
+    def _handler_class(self):
+        registry = self.registry
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        return Handler
+
+    def start(self) -> threading.Thread:
+        self._thread = threading.Thread(target=self.server.serve_forever, name="metrics", daemon=True)
+        self._thread.start()
+        log.info(f"Metrics server started: {self}")
+        return self._thread
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
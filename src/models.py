@@ -0,0 +1,75 @@
+import dataclasses
+import datetime
+import sys
+import typing
+
+FILMVANDAAG_HOST = "https://www.filmvandaag.nl"
+
+MOVIE_KEYS = ("rating", "num_votes", "date", "release_year", "title", "genres", "director", "service", "services",
+              "url")
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class Movie:
+    """
+    A movie found on filmvandaag. Genre, director and service strings are interned and the url is stored
+    as a path relative to FILMVANDAAG_HOST. Movies found by a search have no service and date.
+    services lists every service the movie was found on, service is the first of them.
+    Supports movie["key"] lookups, so code written for the movie dicts keeps working.
+    """
+    title: str
+    release_year: typing.Optional[int]
+    rating: float
+    num_votes: int
+    genres: tuple[str, ...]
+    director: typing.Optional[str]
+    path: str
+    service: typing.Optional[str] = None
+    date: typing.Optional[datetime.datetime] = None
+    services: tuple[str, ...] = ()
+
+    @classmethod
+    def create(cls, title: str, release_year: typing.Optional[str], rating: float, num_votes: int,
+               genres: typing.Iterable[str], director: typing.Optional[str], path: str,
+               service: str = None, date: datetime.datetime = None) -> "Movie":
+        return cls(title=title,
+                   release_year=int(release_year) if release_year else None,
+                   rating=rating,
+                   num_votes=num_votes,
+                   genres=tuple(sys.intern(g) for g in genres),
+                   director=sys.intern(director) if director else director,
+                   path=path,
+                   service=sys.intern(service) if service else service,
+                   date=date,
+                   services=(sys.intern(service),) if service else ())
+
+    @property
+    def url(self) -> str:
+        return f"{FILMVANDAAG_HOST}{self.path}"
+
+    def __getitem__(self, key: str):
+        if key not in MOVIE_KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        return getattr(self, key) if key in MOVIE_KEYS else default
+
+    def keys(self) -> tuple[str, ...]:
+        return MOVIE_KEYS
+
+    def as_dict(self) -> dict:
+        """
+        The movie in the dict form the scraper used to yield.
+        """
+        movie = {"rating": self.rating,
+                 "num_votes": self.num_votes,
+                 "release_year": str(self.release_year),
+                 "title": self.title,
+                 "genres": list(self.genres),
+                 "director": self.director,
+                 "url": self.url}
+        if self.service is not None:
+            movie["date"] = self.date
+            movie["service"] = self.service
+        return movie
@@ -0,0 +1,247 @@
+import collections
+import dataclasses
+import logging
+import threading
+import time
+import typing
+
+from telegram.error import RetryAfter, TimedOut, NetworkError, TelegramError
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+# Telegram allows about 30 messages per second overall and 1 per second per chat, with short bursts
+DEFAULT_GLOBAL_RATE = 25.0
+DEFAULT_CHAT_RATE = 1.0
+DEFAULT_CHAT_BURST = 3
+DEFAULT_COALESCE_WINDOW = 60.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_MAX_QUEUE = 1000
+
+SEND_SECONDS = metrics.histogram("filmvandaag_outbound_send_seconds", "Latency of Telegram API calls.")
+QUEUED = metrics.gauge("filmvandaag_outbound_queued", "Telegram API calls waiting to be sent.")
+
+
+class TokenBucket:
+    """
+    rate tokens per second, at most capacity saved up.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: typing.Callable[[], float] = time.monotonic) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def __repr__(self):
+        return f"TokenBucket(rate={self.rate}, capacity={self.capacity})"
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self) -> float:
+        """
+        :return: seconds until a token is available, 0 if one is available now
+        """
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def take(self) -> None:
+        self._refill()
+        self._tokens -= 1
+
+
+@dataclasses.dataclass
+class Outgoing:
+    chat_id: typing.Any
+    func: typing.Callable
+    args: tuple
+    kwargs: dict
+    coalesce_key: typing.Any = None
+    attempts: int = 0
+
+
+class MessageScheduler:
+    """
+    Outbound queue for Telegram API calls. submit() returns at once, a sender thread makes the calls in order per
+    chat, within a global and a per-chat token bucket. RetryAfter holds back the chat for the requested time,
+    network errors are retried. Calls submitted with a coalesce_key are dropped while an earlier call with the
+    same key is queued or was sent less than coalesce_window seconds ago.
+    """
+
+    def __init__(self, name: str = "outbound",
+                 global_rate: float = DEFAULT_GLOBAL_RATE,
+                 chat_rate: float = DEFAULT_CHAT_RATE,
+                 chat_burst: int = DEFAULT_CHAT_BURST,
+                 coalesce_window: float = DEFAULT_COALESCE_WINDOW,
+                 max_retries: int = DEFAULT_MAX_RETRIES,
+                 max_queue: int = DEFAULT_MAX_QUEUE,
+                 clock: typing.Callable[[], float] = time.monotonic) -> None:
+        self.name = name
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.max_queue = max_queue
+        self.clock = clock
+        self._queues = collections.OrderedDict()  # chat_id -> deque of Outgoing, round robin over the chats
+        self._queued = 0
+        self._global_bucket = TokenBucket(global_rate, max(1.0, global_rate), clock)
+        self._chat_buckets = {}
+        self._held_until = {}  # chat_id -> clock time, after a RetryAfter
+        self._coalesced = {}  # coalesce_key -> clock time it was submitted, None while queued
+        self._cond = threading.Condition()
+        self._busy = False
+        self._stop = False
+        self._thread = None
+        self.stats = collections.Counter()
+        QUEUED.set_function(self.__len__, outbox=name)
+
+    def __repr__(self):
+        return f"MessageScheduler(name={repr(self.name)}, global_rate={self.global_rate}, " \
+               f"chat_rate={self.chat_rate}, chat_burst={self.chat_burst}, coalesce_window={self.coalesce_window})"
+
+    def __len__(self):
+        return self._queued
+
+    def submit(self, chat_id, func: typing.Callable, /, *args, coalesce_key=None, **kwargs) -> bool:
+        """
+        Queue the call func(*args, **kwargs), for example bot.send_message, as a message to chat_id. kwargs may
+        hold a chat_id too, for func.
+        :return: False if the call was coalesced with an earlier one or the queue is full
+        """
+        with self._cond:
+            if coalesce_key is not None:
+                submitted = self._coalesced.get(coalesce_key, -self.coalesce_window)
+                if submitted is None or self.clock() - submitted < self.coalesce_window:
+                    self.stats["coalesced"] += 1
+                    return False
+            if self._queued >= self.max_queue:
+                self.stats["dropped"] += 1
+                log.warning(f"Outbound queue full, dropped message to {chat_id}.")
+                return False
+            if coalesce_key is not None:
+                self._coalesced[coalesce_key] = None  # queued, until it is sent
+            self._queues.setdefault(chat_id, collections.deque()).append(
+                Outgoing(chat_id, func, args, kwargs, coalesce_key))
+            self._queued += 1
+            self._cond.notify()
+        return True
+
+    def start(self) -> threading.Thread:
+        self._stop = False
+        self._thread = threading.Thread(target=self._loop, name=f"outbound-{self.name}", daemon=True)
+        self._thread.start()
+        log.info(f"Outbound scheduler started: {self}")
+        return self._thread
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Send what is queued, for at most timeout seconds, and stop the sender thread.
+        """
+        self.flush(timeout)
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Wait until the queue is empty.
+        :return: False on timeout
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._queued and not self._busy, timeout)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        if chat_id not in self._chat_buckets:
+            self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, self.clock)
+        return self._chat_buckets[chat_id]
+
+    def _next(self) -> tuple[typing.Optional[Outgoing], float]:
+        """
+        Take the first call that may be made now, round robin over the chats.
+        :return: the call, or None and the seconds until one may be made
+        """
+        wait = self._global_bucket.wait_time()
+        if wait:
+            return None, wait
+        now = self.clock()
+        for chat_id in list(self._queues):
+            chat_wait = max(self._held_until.get(chat_id, now) - now, self._chat_bucket(chat_id).wait_time())
+            if chat_wait > 0:
+                wait = min(wait, chat_wait) if wait else chat_wait
+                continue
+            queue = self._queues.pop(chat_id)
+            outgoing = queue.popleft()
+            if queue:
+                self._queues[chat_id] = queue  # to the back of the round robin
+            self._queued -= 1
+            self._held_until.pop(chat_id, None)
+            self._global_bucket.take()
+            self._chat_bucket(chat_id).take()
+            return outgoing, 0.0
+        return None, wait
+
+    def _requeue(self, outgoing: Outgoing, delay: float) -> None:
+        self._held_until[outgoing.chat_id] = self.clock() + delay
+        self._queues.setdefault(outgoing.chat_id, collections.deque()).appendleft(outgoing)
+        self._queues.move_to_end(outgoing.chat_id, last=False)
+        self._queued += 1
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                while True:
+                    if self._stop:
+                        return
+                    outgoing, wait = self._next() if self._queued else (None, None)
+                    if outgoing is not None:
+                        break
+                    self._cond.wait(wait)
+                self._busy = True
+            self._send(outgoing)
+
+    def _send(self, outgoing: Outgoing) -> None:
+        outgoing.attempts += 1
+        try:
+            with SEND_SECONDS.time(outbox=self.name):
+                outgoing.func(*outgoing.args, **outgoing.kwargs)
+            self.stats["sent"] += 1
+        except RetryAfter as err:
+            log.warning(f"Telegram asks to wait {err.retry_after}s before sending to {outgoing.chat_id}.")
+            self.stats["retry_after"] += 1
+            with self._cond:
+                self._requeue(outgoing, err.retry_after)
+            return
+        except (TimedOut, NetworkError) as err:
+            if outgoing.attempts <= self.max_retries:
+                self.stats["retried"] += 1
+                with self._cond:
+                    self._requeue(outgoing, 2 ** (outgoing.attempts - 1))
+                return
+            self.stats["failed"] += 1
+            log.error(f"Sending to {outgoing.chat_id} failed after {outgoing.attempts} attempts: {err}")
+        except TelegramError as err:
+            self.stats["failed"] += 1
+            log.error(f"Sending to {outgoing.chat_id} failed: {err}")
+        except Exception as err:
+            self.stats["failed"] += 1
+            log.exception(f"Sending to {outgoing.chat_id} failed: {err}")
+        if outgoing.coalesce_key is not None:
+            with self._cond:
+                self._coalesced[outgoing.coalesce_key] = self.clock()
+                self._expire_coalesced()
+
+    def _expire_coalesced(self) -> None:
+        now = self.clock()
+        for key in [k for k, sent in self._coalesced.items() if sent is not None and now - sent >= self.coalesce_window]:
+            del self._coalesced[key]
@@ -0,0 +1,181 @@
+import functools
+import html as htmllib
+import logging
+import re
+import typing
+
+import models
+
+log = logging.getLogger(__name__)
+
+PARSER_BACKENDS = ["lxml", "html.parser"]
+DEFAULT_PARSER_BACKEND = "lxml"
+
+TITLE_RE = re.compile(r"^(?P<title>.+?)( \((?P<year>[0-9]{4})\))?$")
+
+# Only the date headings and the movie lists of a new-movies page are built into a tree when straining.
+NEW_MOVIES_STRAINER = "new_movies"
+SEARCH_RESULTS_STRAINER = "search_results"
+STRAINERS = {NEW_MOVIES_STRAINER: (["h3", "ul"], {"class": ["is-list-heading", "item-list"]}),
+             SEARCH_RESULTS_STRAINER: ("li", {"class": "is-movie"})}
+
+# Markers of a new-movies page that is read while it streams in.
+HEADING_RE = re.compile(r"<h3\b[^>]*\bis-list-heading\b[^>]*>(?P<heading>.*?)</h3\s*>", re.S | re.I)
+ITEM_LIST_RE = re.compile(r"<ul\b[^>]*\bitem-list\b[^>]*>", re.I)
+UL_TAG_RE = re.compile(r"<(?P<close>/?)ul\b[^>]*>", re.I)
+TAG_RE = re.compile(r"<[^>]*>")
+MAX_HEADING_LENGTH = 4096
+
+
+def _bs4():
+    import bs4  # takes a noticeable part of the startup time, so it is imported on the first parse
+    return bs4
+
+
+@functools.cache
+def _strainer(kind: str):
+    name, attrs = STRAINERS[kind]
+    return _bs4().SoupStrainer(name, attrs=attrs)
+
+
+def select_backend(backend: str) -> str:
+    """
+    Return backend if its parser library is installed, otherwise fall back to the builtin html.parser.
+    """
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown HTML parser backend: {backend}. Choose from {PARSER_BACKENDS}.")
+    bs4 = _bs4()
+    try:
+        bs4.BeautifulSoup("", backend)
+    except bs4.FeatureNotFound:
+        log.warning(f"HTML parser backend {backend} is not installed. Falling back to html.parser.")
+        return "html.parser"
+    return backend
+
+
+def iter_new_movie_blocks(chunks: typing.Iterable[str]) -> typing.Generator[tuple[str, str], None, None]:
+    """
+    Generator function. Reads a new-movies page chunk by chunk and yields every date heading with the html of
+    the ul.item-list under it, as soon as that list is complete.
+    :return: generator of (heading, list html)
+    """
+    buffer = ""
+    heading = None
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            if heading is None:
+                m = HEADING_RE.search(buffer)
+                if not m:
+                    # keep enough of the tail for a heading that is split over two chunks
+                    buffer = buffer[-MAX_HEADING_LENGTH:]
+                    break
+                heading = htmllib.unescape(TAG_RE.sub("", m.group("heading"))).strip()
+                buffer = buffer[m.end():]
+            m = ITEM_LIST_RE.search(buffer)
+            if not m:
+                break
+            depth, end = 0, None
+            for tag in UL_TAG_RE.finditer(buffer, m.start()):
+                depth += -1 if tag.group("close") else 1
+                if depth == 0:
+                    end = tag.end()
+                    break
+            if end is None:  # the list is not complete yet
+                break
+            yield heading, buffer[m.start():end]
+            heading = None
+            buffer = buffer[end:]
+
+
+def parse_movie_item(li, service: str = None, date=None) -> typing.Optional[models.Movie]:
+    """
+    Extract a movie from a li.is-movie element of a movie list. Items without an IMDB rating are skipped.
+    :return: Movie or None
+    """
+    rating_div = li.find("div", class_="rating")
+    if rating_div is None or rating_div.span is None:
+        return None
+    rating_el = rating_div.span
+    content_el = li.find("div", class_="item-content")
+    gdinfo = content_el.find("div").text.split("•")
+    if len(gdinfo) < 2:
+        director = None
+    else:
+        director = gdinfo[1].strip()
+    genres = [g.strip() for g in gdinfo[0].split("/")]
+    title_el = li.find("a", class_="title") or content_el.h4.a
+    m = TITLE_RE.match(str(title_el.text))
+    return models.Movie.create(rating=float(rating_el.text.strip()),
+                               num_votes=int(rating_el["title"].split()[0].replace(".", "")),
+                               release_year=m.group("year"),
+                               title=str(m.group("title")),
+                               genres=genres,
+                               director=director,
+                               path=title_el["href"],
+                               service=service,
+                               date=date)
+
+
+class ListingParser:
+    """
+    Parses new-movies pages and /api/search results into Movies.
+    The backend is a BeautifulSoup tree builder, strained parsing only builds the movie lists.
+    BeautifulSoup and the backend are loaded on the first parse.
+    """
+
+    def __init__(self, backend: str = DEFAULT_PARSER_BACKEND, strained: bool = True) -> None:
+        if backend not in PARSER_BACKENDS:
+            raise ValueError(f"Unknown HTML parser backend: {backend}. Choose from {PARSER_BACKENDS}.")
+        self.requested_backend = backend
+        self.strained = strained
+        log.info(f"ListingParser initialized: {self}")
+
+    def __repr__(self):
+        return f"ListingParser(backend={repr(self.requested_backend)}, strained={self.strained})"
+
+    @functools.cached_property
+    def backend(self) -> str:
+        return select_backend(self.requested_backend)
+
+    def _soup(self, markup: str, strainer: str):
+        return _bs4().BeautifulSoup(markup, self.backend, parse_only=_strainer(strainer) if self.strained else None)
+
+    def new_movie_items(self, html: str) -> list[tuple[str, typing.Any]]:
+        """
+        The items of a new-movies page, newest first, with the date heading they are listed under.
+        Building this list is cheap compared to extracting the movies from the items.
+        :return: list of (heading, li element)
+        """
+        soup = self._soup(html, NEW_MOVIES_STRAINER)
+        title_els = soup.find_all("h3", class_="is-list-heading")
+        list_els = soup.find_all("ul", class_="item-list")
+        return [(title_el.string, li) for title_el, list_el in zip(title_els, list_els)
+                for li in list_el.find_all("li", recursive=False)]
+
+    def iter_new_movie_items(self, chunks: typing.Iterable[str]
+                             ) -> typing.Generator[tuple[str, typing.Any], None, None]:
+        """
+        Generator function. Like new_movie_items, but for a page that is still streaming in. Every item list is
+        parsed as soon as it is complete.
+        :return: generator of (heading, li element)
+        """
+        for heading, list_html in iter_new_movie_blocks(chunks):
+            list_el = self._soup(list_html, NEW_MOVIES_STRAINER).find("ul")
+            for li in list_el.find_all("li", recursive=False):
+                yield heading, li
+
+    def parse_search_results(self, html: str) -> list[models.Movie]:
+        """
+        Parse the results html of an /api/search response.
+        :return: movies in the order of the results
+        """
+        soup = self._soup(html, SEARCH_RESULTS_STRAINER)
+        movies = []
+        for li in soup.find_all("li", class_="is-movie"):
+            log.debug(li)
+            movie = parse_movie_item(li)
+            if movie is not None:
+                log.info(f"Movie found: {movie}")
+                movies.append(movie)
+        return movies
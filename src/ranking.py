@@ -0,0 +1,44 @@
+import dataclasses
+import heapq
+import itertools
+import logging
+import typing
+
+import models
+
+log = logging.getLogger(__name__)
+
+
+def top_movies(movies: typing.Iterable[models.Movie], k: int) -> list[models.Movie]:
+    """
+    The k best rated movies, ties broken by number of votes and then by the order of the input.
+    A movie found on several services is returned once, with all those services.
+    Keeps a heap of at most k movies: O(n log k) time and O(k) memory for n movies.
+    :return: list of movies, best first
+    """
+    if k <= 0:
+        return []
+    heap = []  # min-heap of (rating, num_votes, -seq, path), the worst kept movie on top
+    kept = {}  # path -> [movie, services]
+    seq = itertools.count()
+    for movie in movies:
+        if movie.path in kept:
+            services = kept[movie.path][1]
+            services.extend(s for s in movie.services if s not in services)
+            continue
+        # a duplicate ranks just below the copy seen first, so it is only dropped here if that copy was dropped
+        entry = (movie.rating, movie.num_votes, -next(seq), movie.path)
+        if len(heap) < k:
+            heapq.heappush(heap, entry)
+        elif entry > heap[0]:
+            del kept[heapq.heapreplace(heap, entry)[3]]
+        else:
+            continue
+        kept[movie.path] = [movie, list(movie.services)]
+    ranked = []
+    for *_, path in sorted(heap, reverse=True):
+        movie, services = kept[path]
+        if len(services) > len(movie.services):
+            movie = dataclasses.replace(movie, services=tuple(services))
+        ranked.append(movie)
+    return ranked
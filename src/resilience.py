@@ -0,0 +1,127 @@
+import logging
+import random
+import threading
+import time
+import typing
+
+import metrics
+
+log = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30.0
+DEFAULT_BACKOFF = 0.5
+DEFAULT_MAX_BACKOFF = 4.0
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = metrics.gauge("filmvandaag_circuit_breaker_state",
+                              "State of the circuit breaker per endpoint: 0 closed, 1 half open, 2 open.")
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def jittered_backoff(attempt: int, base: float = DEFAULT_BACKOFF, cap: float = DEFAULT_MAX_BACKOFF,
+                     rng: typing.Callable[[float, float], float] = random.uniform) -> float:
+    """
+    "Full jitter" backoff: a random delay up to base * 2 ** attempt, at most cap. Clients that failed together
+    do not retry together.
+    :return: seconds to wait before retry attempt + 1
+    """
+    return rng(0, min(cap, base * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Stops calls to an endpoint that keeps failing. After failure_threshold failures in a row the breaker opens and
+    allow() refuses calls for reset_timeout seconds. Then one trial call is let through (half open): its success
+    closes the breaker, its failure opens it again. Listeners are called as listener(breaker, old_state, new_state)
+    on every state change.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT,
+                 clock: typing.Callable[[], float] = time.monotonic) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial = False  # a half open trial call is in flight
+        self._listeners = []
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(STATE_VALUES[CLOSED], endpoint=name)
+
+    def __repr__(self):
+        return f"CircuitBreaker(name={repr(self.name)}, state={self.state}, failures={self.failures})"
+
+    def add_listener(self, listener: typing.Callable[["CircuitBreaker", str, str], None]) -> None:
+        self._listeners.append(listener)
+
+    def allow(self) -> bool:
+        """
+        :return: whether a call may be made now. A call that is allowed must be followed by
+            record_success() or record_failure().
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN:
+                if self.clock() - self._opened_at < self.reset_timeout:
+                    return False
+                changed = self._transition(HALF_OPEN)
+            elif self._trial:
+                return False
+            else:
+                changed = None
+            self._trial = True
+        self._notify(changed)
+        return True
+
+    def retry_in(self) -> float:
+        """
+        :return: seconds until an open breaker lets a trial call through, 0 if calls are allowed
+        """
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self._opened_at + self.reset_timeout - self.clock())
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._trial = False
+            changed = self._transition(CLOSED)
+        self._notify(changed)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            changed = None
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self._opened_at = self.clock()
+                changed = self._transition(OPEN)
+        self._notify(changed)
+
+    def _transition(self, state: str) -> typing.Optional[tuple[str, str]]:
+        if state == self.state:
+            return None
+        old, self.state = self.state, state
+        BREAKER_STATE.set(STATE_VALUES[state], endpoint=self.name)
+        return old, state
+
+    def _notify(self, changed: typing.Optional[tuple[str, str]]) -> None:
+        if changed is None:
+            return
+        old, new = changed
+        log.warning(f"Circuit breaker {self.name}: {old} -> {new}.")
+        for listener in self._listeners:
+            try:
+                listener(self, old, new)
+            except Exception as err:
+                log.error(f"Circuit breaker listener {listener} failed: {err}")
@@ -1,18 +1,28 @@
 import logging
 import time
+import concurrent.futures
+import functools
+import heapq
+import threading
 import datetime
-import re
 import urllib.parse
 import typing
 
 import requests
 
-from selenium import webdriver
-from selenium.webdriver.chrome.webdriver import WebDriver
-from selenium.webdriver.common.by import By
-import selenium.webdriver.chrome.options
-import dateparser
-from bs4 import BeautifulSoup
+import cache
+import catalog
+import config
+import cursor
+import dates
+import drivers
+import httpclient
+import metrics
+import models
+import parsing
+import ranking
+import resilience
+import titleindex
 
 NEW_MOVIES_URLS = {"netflix": "https://www.filmvandaag.nl/video-on-demand/netflix/nieuwe-films",
                    "pathe": "https://www.filmvandaag.nl/video-on-demand/pathe-thuis/nieuw-op-pathe-thuis",
@@ -20,94 +30,410 @@ NEW_MOVIES_URLS = {"netflix": "https://www.filmvandaag.nl/video-on-demand/netfli
                    "disney": "https://www.filmvandaag.nl/video-on-demand/disney-plus/nieuwe-films"
                    }
 
-FILMVANDAAG_HOST = "https://www.filmvandaag.nl"
+FILMVANDAAG_HOST = models.FILMVANDAAG_HOST
 SEARCH_MOVIE_URL = f"{FILMVANDAAG_HOST}/api/search"
 HF_SEARCH_MOVIE_URL = f"{FILMVANDAAG_HOST}/zoek"
 
+DEFAULT_SCRAPE_WORKERS = 4
+DEFAULT_NEW_MOVIES_CACHE_SIZE = 16
+DEFAULT_NEW_MOVIES_CACHE_TTL = 900.0
+DEFAULT_NEW_MOVIES_REFRESH_INTERVAL = 600.0
+DEFAULT_NEW_MOVIES_HOT_SECONDS = 3600.0
+DEFAULT_NEW_MOVIES_THRESHOLD_DAYS = 7
+DEFAULT_NEW_MOVIES_RANKED = True
+DEFAULT_SEARCH_CACHE_SIZE = 512
+DEFAULT_SEARCH_CACHE_TTL = 3600.0
+DEFAULT_SEARCH_PREFETCH_PAGES = 1
+DEFAULT_PREFETCH_WORKERS = 4
+
 log = logging.getLogger(__name__)
 
+STAGE_SECONDS = metrics.histogram("filmvandaag_scrape_stage_seconds",
+                                  "Time spent per stage of scraping a new-movies or search page.")
+SCRAPED_MOVIES = metrics.counter("filmvandaag_scraped_movies_total", "Movies built from scraped pages.")
+DISCARDED_MOVIES = metrics.counter("filmvandaag_discarded_movies_total", "New movies discarded by the filters.")
+NEW_MOVIES_SKIPPED = metrics.counter("filmvandaag_new_movies_skipped_total",
+                                     "Listing items below the watermark of the previous crawl, not processed again.")
+STALE_SERVED = metrics.counter("filmvandaag_stale_served_total",
+                               "Expired listings or search pages served because reloading them failed.")
+
 
-def get_chrome_driver(connstr) -> WebDriver:
+def search_cache_key(params: dict) -> tuple:
     """
-    Get the remote chrome_driver
-    Build Chrome options. This configuration is required for chromedriver to function properly in a docker container.
-    :return:
+    Cache key of a /api/search request. Genres and services are sorted, so the order in which the user picked
+    them does not matter.
     """
-    chrome_options = webdriver.chrome.options.Options()
-    chrome_options.add_argument("--headless")
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-    for i in range(10):
-        try:
-            log.info(f"Connecting to selenium Chrome instance @{connstr}...")
-            driver = webdriver.Remote(f"http://{connstr}/wd/hub", options=chrome_options)
-        except Exception as err:
-            log.error(f"Error connecting to Selenium driver: {err}")
-            log.error("Retrying in 3 seconds..")
-            time.sleep(3)
-            continue
-        break
-    logging.info("Connection established.")
-    return driver
+    key = []
+    for name, value in sorted(params.items()):
+        if isinstance(value, (list, tuple)):
+            value = tuple(sorted(str(v) for v in value)) if name in ("genre[]", "vod[]") \
+                else tuple(str(v) for v in value)
+        else:
+            value = str(value)
+        key.append((name, value))
+    return tuple(key)
 
 
 class FilmVandaagScraper:
 
-    def __init__(self, config):
+    def __init__(self, config, store=None):
         self.config = config
+        self.host = config.get("FILMVANDAAG_HOST", FILMVANDAAG_HOST)
+        self.http = httpclient.HttpClient(
+            pool_size=config.get("HTTP_POOL_SIZE", httpclient.DEFAULT_POOL_SIZE),
+            timeout=config.get("HTTP_TIMEOUT", httpclient.DEFAULT_TIMEOUT),
+            retries=config.get("HTTP_RETRIES", httpclient.DEFAULT_RETRIES),
+            retry_budget=config.get("HTTP_RETRY_BUDGET", httpclient.DEFAULT_RETRY_BUDGET),
+            failure_threshold=config.get("BREAKER_FAILURE_THRESHOLD", resilience.DEFAULT_FAILURE_THRESHOLD),
+            reset_timeout=config.get("BREAKER_RESET_TIMEOUT", resilience.DEFAULT_RESET_TIMEOUT))
+        # parsed new-movies listings per service, shared by all conversations, and by all instances with a store
+        self._new_movies_cache = cache.TTLCache(
+            maxsize=config.get("NEW_MOVIES_CACHE_SIZE", DEFAULT_NEW_MOVIES_CACHE_SIZE),
+            ttl=config.get("NEW_MOVIES_CACHE_TTL", DEFAULT_NEW_MOVIES_CACHE_TTL),
+            store=store, name="new_movies")
+        self._new_movies_accessed = {}  # service -> monotonic time of the last request
+        self.new_movies_crawl_stats = {}  # service -> counts of crawls, new movies and skipped items
+        self.watched_services = set()  # services refreshed even when nobody requested them lately
+        self._new_movies_listeners = []
+        # parsed /api/search result pages, keyed by search_cache_key()
+        self._search_cache = cache.TTLCache(maxsize=config.get("SEARCH_CACHE_SIZE", DEFAULT_SEARCH_CACHE_SIZE),
+                                            ttl=config.get("SEARCH_CACHE_TTL", DEFAULT_SEARCH_CACHE_TTL),
+                                            store=store, name="search")
+        self._revalidating = set()  # (cache name, key) of the background reloads in progress
+        self._revalidating_lock = threading.Lock()
+        self._served_stale = set()  # (cache name, key) last served expired because reloading failed
+        self._refresher_stop = threading.Event()
+        self._prefetch_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=config.get("PREFETCH_WORKERS", DEFAULT_PREFETCH_WORKERS), thread_name_prefix="prefetch")
+        self.parser = parsing.ListingParser(backend=config.get("HTML_PARSER", parsing.DEFAULT_PARSER_BACKEND),
+                                            strained=config.get("HTML_STRAINED", True))
+        self.catalog = catalog.MovieCatalog(config["CATALOG_PATH"]) if config.get("CATALOG_PATH") else None
+        # every movie scraped, for looking up a title
+        self.titles = titleindex.TitleIndex()
+        # browsers for pages that only list their movies after rendering, None without SELENIUM_CONNSTR
+        self.drivers = drivers.DriverPool(
+            functools.partial(drivers.get_chrome_driver, config["SELENIUM_CONNSTR"]),
+            size=config.get("DRIVER_POOL_SIZE", drivers.DEFAULT_POOL_SIZE),
+            max_pages=config.get("DRIVER_MAX_PAGES", drivers.DEFAULT_MAX_PAGES),
+            lease_timeout=config.get("DRIVER_LEASE_TIMEOUT", drivers.DEFAULT_LEASE_TIMEOUT)
+        ) if config.get("SELENIUM_CONNSTR") else None
+        self.profile_path = config.get("PROFILE_SCRAPE")  # dump cProfile stats of the next scrape here
         log.info("FilmVandaagScraper instance initialized.")
 
+    def _site_url(self, url: str) -> str:
+        """
+        Point a filmvandaag url at FILMVANDAAG_HOST from the config, e.g. a local stand-in for benchmarks.
+        """
+        return self.host + url[len(FILMVANDAAG_HOST):]
+
+    def cache_stats(self) -> dict:
+        return {"new_movies": self._new_movies_cache.stats(), "search": self._search_cache.stats()}
+
+    def _get_or_stale(self, cache_: cache.TTLCache, key, loader: typing.Callable[[], typing.Any]):
+        """
+        The cached value of key, loaded on a miss. When loading fails the last value loaded is returned, even if
+        it has expired, and a reload is attempted in the background. Without a last value the error is raised.
+        """
+        try:
+            value = cache_.get_or_load(key, loader)
+        except Exception as err:
+            stale = cache_.get_stale(key)
+            if stale is None:
+                raise
+            log.warning(f"Loading {key} into the {cache_.name} cache failed, serving the expired value: {err}")
+            STALE_SERVED.inc(cache=cache_.name)
+            self._served_stale.add((cache_.name, key))
+            self._revalidate(cache_, key, loader)
+            return stale
+        self._served_stale.discard((cache_.name, key))
+        return value
+
+    def _revalidate(self, cache_: cache.TTLCache, key, loader: typing.Callable[[], typing.Any]) -> None:
+        with self._revalidating_lock:
+            if (cache_.name, key) in self._revalidating:
+                return
+            self._revalidating.add((cache_.name, key))
+
+        def reload():
+            try:
+                # fails fast while the circuit breaker of the endpoint is open
+                cache_.get_or_load(key, loader, force=True)
+                self._served_stale.discard((cache_.name, key))
+                log.info(f"Reloaded {key} into the {cache_.name} cache.")
+            except Exception as err:
+                log.warning(f"Reloading {key} into the {cache_.name} cache failed: {err}")
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard((cache_.name, key))
+
+        self._prefetch_pool.submit(reload)
+
+    def new_movies_stale(self, services: list[str]) -> bool:
+        """
+        Whether the listing of one of the services was last served expired, because reloading it failed.
+        """
+        return any((self._new_movies_cache.name, service) in self._served_stale for service in services)
+
+    def search_page_stale(self, params: dict, page: int) -> bool:
+        """
+        Whether the search result page was last served expired, because reloading it failed.
+        """
+        return (self._search_cache.name, search_cache_key(dict(params, page=page))) in self._served_stale
+
+    def start_refresher(self) -> threading.Thread:
+        """
+        Start a daemon thread that reloads the cached new-movies listings of recently requested services
+        every NEW_MOVIES_REFRESH_INTERVAL seconds, so conversations hardly ever wait for a scrape.
+        """
+        interval = self.config.get("NEW_MOVIES_REFRESH_INTERVAL", DEFAULT_NEW_MOVIES_REFRESH_INTERVAL)
+        self._refresher_stop.clear()
+        thread = threading.Thread(target=self._refresh_loop, args=(interval,), name="new-movies-refresher",
+                                  daemon=True)
+        thread.start()
+        log.info(f"New movies refresher started (interval {interval}s).")
+        return thread
+
+    def stop_refresher(self) -> None:
+        self._refresher_stop.set()
+
+    def _refresh_loop(self, interval: float) -> None:
+        while not self._refresher_stop.wait(interval):
+            self.refresh_new_movies()
+
+    def refresh_new_movies(self) -> None:
+        """
+        Reload the listings of the services that were requested within NEW_MOVIES_HOT_SECONDS and of the
+        watched services.
+        """
+        hot_seconds = self.config.get("NEW_MOVIES_HOT_SECONDS", DEFAULT_NEW_MOVIES_HOT_SECONDS)
+        now = time.monotonic()
+        services = {service for service, accessed in list(self._new_movies_accessed.items())
+                    if now - accessed <= hot_seconds}
+        for service in sorted(services | self.watched_services):
+            try:
+                self._new_movies_cache.get_or_load(service, functools.partial(self._fetch_new_movies, service),
+                                                   force=True)
+            except Exception as err:
+                log.error(f"Refreshing new movies of {service} failed: {err}")
+
+    def add_new_movies_listener(self, listener: typing.Callable[[str, list[models.Movie]], None]) -> None:
+        """
+        Call listener(service, movies) with the movies that a crawl of the cached listing of service found and the
+        previous crawl had not. The first crawl of a service has nothing to compare with and calls no listeners.
+        """
+        self._new_movies_listeners.append(listener)
+
     def scrape_new_movies(self, services: list[str],
                           added_days_ago: int,
                           votes_threshold: int = 10000,
                           rating_threshold: int = 0
-                          ) -> typing.Generator[dict, None, None]:
-        for service in services:
-            url = NEW_MOVIES_URLS[service]
+                          ) -> typing.Generator[models.Movie, None, None]:
+        """
+        Generator function. Yields the movies recently added to the given services, newest first.
+        The service pages are fetched and parsed concurrently by at most SCRAPE_WORKERS threads.
+        :return: generator
+        """
+        time_threshold = datetime.datetime.now() - datetime.timedelta(days=added_days_ago)
+        workers = max(1, min(self.config.get("SCRAPE_WORKERS", DEFAULT_SCRAPE_WORKERS), len(services)))
+        movie_lists = []
+        profile_path, self.profile_path = self.profile_path, None
+        with STAGE_SECONDS.time(stage="scrape"):
+            if profile_path:
+                # cProfile only sees the calling thread, so scrape the services one after the other here
+                movie_lists = self._profile(profile_path, lambda: [
+                    self._scrape_service_new_movies(service, time_threshold) for service in services])
+            else:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=workers,
+                                                           thread_name_prefix="scrape") as executor:
+                    futures = {executor.submit(self._scrape_service_new_movies, service, time_threshold): service
+                               for service in services}
+                    for future in concurrent.futures.as_completed(futures):
+                        movies = future.result()
+                        log.info(f"Scraped {len(movies)} movies from {futures[future]}.")
+                        movie_lists.append(movies)
+        # every list is ordered newest first, merging them keeps that order across services
+        for movie in heapq.merge(*movie_lists, key=lambda m: m.date, reverse=True):
+            if movie.num_votes < votes_threshold:
+                log.info(f"Number of votes {movie.num_votes} below threshold {votes_threshold}. Discarded.")
+                DISCARDED_MOVIES.inc(reason="votes")
+            elif movie.rating < rating_threshold:
+                log.info(f"Rating {movie.rating} below threshold {rating_threshold}. Discarded.")
+                DISCARDED_MOVIES.inc(reason="rating")
+            else:
+                yield movie
+
+    @staticmethod
+    def _profile(path: str, func: typing.Callable):
+        import cProfile
+        import io
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return func()
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(20)
+            log.info(f"Scrape profile written to {path}:\n{summary.getvalue()}")
+
+    def rank_new_movies(self, services: list[str],
+                        added_days_ago: int,
+                        k: int,
+                        votes_threshold: int = 10000,
+                        rating_threshold: int = 0) -> list[models.Movie]:
+        """
+        The k best rated movies recently added to the given services, best first. Movies added to several of
+        the services are listed once, with all of them in Movie.services.
+        :return: list of at most k movies
+        """
+        return ranking.top_movies(self.scrape_new_movies(services, added_days_ago=added_days_ago,
+                                                         votes_threshold=votes_threshold,
+                                                         rating_threshold=rating_threshold), k)
+
+    def _scrape_service_new_movies(self, service: str, time_threshold: datetime.datetime) -> list[models.Movie]:
+        self._new_movies_accessed[service] = time.monotonic()
+        if self.streaming and time_threshold < self._streaming_threshold():
+            # further back than the cached listing goes, which has no watermark for the older movies
+            listing = self._stream_new_movies(service, time_threshold, use_watermark=False)
+        else:
+            listing = self._get_or_stale(self._new_movies_cache, service,
+                                         functools.partial(self._fetch_new_movies, service))
+        movies = []
+        for movie in listing:
+            if movie.date < time_threshold:  # the next movies are added too long ago
+                log.info(f"Reached time threshold ({movie.date}. Stopped scraping.")
+                break
+            movies.append(movie)
+        return movies
+
+    @property
+    def streaming(self) -> bool:
+        return self.config.get("NEW_MOVIES_STREAMING", False)
+
+    def _streaming_threshold(self) -> datetime.datetime:
+        days = self.config.get("NEW_MOVIES_THRESHOLD_DAYS", DEFAULT_NEW_MOVIES_THRESHOLD_DAYS)
+        return datetime.datetime.now() - datetime.timedelta(days=days)
+
+    def _fetch_new_movies(self, service: str) -> list[models.Movie]:
+        previous = self._new_movies_cache.get_stale(service, [])
+        if self.streaming:
+            listing = self._stream_new_movies(service, self._streaming_threshold())
+        else:
+            url = self._site_url(NEW_MOVIES_URLS[service])
             log.info(f"Scraping movies from {url}...")
-            time_threshold = datetime.datetime.now() - datetime.timedelta(days=added_days_ago)
-            resp = requests.get(url)
-            resp.raise_for_status()
-            soup = BeautifulSoup(resp.text, "html.parser")
-            title_els = soup.find_all("h3", class_="is-list-heading")
-            list_els = soup.find_all("ul", class_="item-list")
-            for i in range(len(title_els)):
-                title = title_els[i].string
-                if "vandaag" in title.lower():
-                    dt = dateparser.parse("vandaag")
-                else:
-                    dt = dateparser.parse(title)
-                if dt < time_threshold:  # the next movies are added too long ago
-                    log.info(f"Reached time threshold ({dt}. Stopped scraping.")
-                    break
-                rating_els = list_els[i].select("div.rating span")
-                movie_title_els = list_els[i].select("div.item-content h4 a")
-                content_els = list_els[i].select("div.item-content")
-                sub_els = list_els[i].select("div.sub")
-                for j in range(len(rating_els)):
-                    gdinfo = content_els[j].find("div").text.split("•")
-                    if len(gdinfo) < 2:
-                        director = None
-                    else:
-                        director = gdinfo[1].strip()
-                    genres = [g.strip() for g in gdinfo[0].split("/")]
-                    title_el = movie_title_els[j]
-                    m = re.match(r"^(?P<title>.+?)( \((?P<year>[0-9]{4})\))?$", str(title_el.text))
-                    movie = {"rating": float(rating_els[j].text.strip()),
-                             "num_votes": int(rating_els[j]["title"].split()[0].replace(".", "")),
-                             "date": dt,
-                             "release_year": str(m.group("year")),
-                             "title": str(m.group("title")),
-                             "genres": genres,
-                             "director": director,
-                             "service": service,
-                             "url": f"{FILMVANDAAG_HOST}{title_el['href']}"}
-                    if movie["num_votes"] < votes_threshold:
-                        log.info(f"Number of votes {movie['num_votes']} below threshold {votes_threshold}. Discarded.")
-                    elif movie["rating"] < rating_threshold:
-                        log.info(f"Rating {movie['rating']} below threshold {rating_threshold}. Discarded.")
-                    else:
-                        yield movie
+            listing = self.http.get(url, parse=functools.partial(self._parse_new_movies_page, service=service))
+        self.titles.add(listing)
+        if previous:
+            # movies are added at the top, anything listed below the previous newest date is not new
+            newest, previous_paths = previous[0].date.date(), {m.path for m in previous}
+            self._notify_new_movies(service, [m for m in listing
+                                              if m.path not in previous_paths and m.date.date() >= newest])
+        return listing
+
+    def _parse_new_movies_page(self, resp: requests.Response, service: str) -> list[models.Movie]:
+        with STAGE_SECONDS.time(stage="html_parse"):
+            items = self.parser.new_movie_items(resp.text)
+        if not items and self.drivers is not None:
+            log.info(f"No movies in the html of {resp.url}. Rendering it in a browser.")
+            html = self.render_page(resp.url)
+            with STAGE_SECONDS.time(stage="html_parse"):
+                items = self.parser.new_movie_items(html)
+        return self._crawl_new_movies(items, service, num_items=len(items))
+
+    def render_page(self, url: str) -> str:
+        """
+        Load the url in a browser from the driver pool.
+        :return: the html after rendering
+        """
+        with STAGE_SECONDS.time(stage="render"), self.drivers.lease() as driver:
+            driver.get(url)
+            return driver.page_source
+
+    def _stream_new_movies(self, service: str, time_threshold: datetime.datetime,
+                           use_watermark: bool = True) -> list[models.Movie]:
+        """
+        Read the new-movies page of service while it downloads and stop downloading at the first date heading
+        older than time_threshold. Without use_watermark every item up to time_threshold is extracted.
+        """
+        url = self._site_url(NEW_MOVIES_URLS[service])
+        log.info(f"Streaming movies from {url}...")
+        chunks = self.http.stream(url)
+        try:
+            return self._crawl_new_movies(self.parser.iter_new_movie_items(chunks), service,
+                                          time_threshold=time_threshold, use_watermark=use_watermark)
+        finally:
+            chunks.close()  # closes the connection if the crawl stopped early
+
+    def _crawl_new_movies(self, items: typing.Iterable[tuple], service: str, num_items: int = None,
+                          time_threshold: datetime.datetime = None, use_watermark: bool = True) -> list[models.Movie]:
+        """
+        Incremental crawl of the (heading, li) items of a new-movies page. Only the items listed above the newest
+        movie of the previous crawl (the watermark) are extracted, the older ones are taken from the previous crawl,
+        as far as a crawl of the whole page would list them. Without use_watermark all items are extracted. The
+        crawl also stops at the first item older than time_threshold.
+        :param num_items: the number of items if items is the list of all items of the page
+        :return: the merged listing, newest first
+        """
+        previous = self._new_movies_cache.get_stale(service, []) if use_watermark else []
+        watermark = (previous[0].date.date(), previous[0].path) if previous else None
+        now = datetime.datetime.now()
+        new_movies = []
+        processed = 0
+        at_threshold = at_watermark = False
+        date_seconds = build_seconds = 0.0
+        for heading, li in items:
+            start = time.perf_counter()
+            date = dates.parse_heading_date(heading, now=now)
+            parsed = time.perf_counter()
+            date_seconds += parsed - start
+            if time_threshold and date < time_threshold:
+                log.info(f"Reached time threshold ({date}). Stopped crawling.")
+                at_threshold = True
+                break
+            processed += 1
+            movie = parsing.parse_movie_item(li, service=service, date=date)
+            build_seconds += time.perf_counter() - parsed
+            if movie is None:
+                continue
+            if (movie.date.date(), movie.path) == watermark:
+                at_watermark = True
+                break
+            new_movies.append(movie)
+        STAGE_SECONDS.observe(date_seconds, stage="date_parse")
+        STAGE_SECONDS.observe(build_seconds, stage="record_build")
+        SCRAPED_MOVIES.inc(len(new_movies), source="new_movies")
+        skipped = num_items - processed if num_items is not None and at_watermark else 0
+        stats = self.new_movies_crawl_stats.setdefault(service, {"crawls": 0, "new": 0, "skipped": 0, "aborted": 0})
+        stats["crawls"] += 1
+        stats["new"] += len(new_movies)
+        stats["skipped"] += skipped
+        NEW_MOVIES_SKIPPED.inc(skipped, service=service)
+        stats["aborted"] += num_items is None and (at_threshold or at_watermark)
+        log.info(f"Crawled {service}: {len(new_movies)} new movies, skipped {skipped} items below the watermark.")
+        if not at_watermark:
+            return new_movies
+        new_paths = {m.path for m in new_movies}
+        kept = [m for m in previous if m.path not in new_paths]
+        if num_items is not None:
+            # down to the oldest movie the page still lists, the ones below it dropped off the page
+            oldest = next(filter(None, (parsing.parse_movie_item(li) for _, li in reversed(items))))
+            paths = [m.path for m in kept]
+            if oldest.path in paths:
+                kept = kept[:paths.index(oldest.path) + 1]
+        elif time_threshold:
+            kept = [m for m in kept if m.date >= time_threshold]
+        return new_movies + kept
+
+    def _notify_new_movies(self, service: str, movies: list[models.Movie]) -> None:
+        if not movies:
+            return
+        for listener in self._new_movies_listeners:
+            try:
+                listener(service, movies)
+            except Exception as err:
+                log.error(f"New movies listener {listener} failed: {err}")
 
     def get_search_movies_browser_url(self, services: list = None,
                       genres: list = None,
@@ -136,62 +462,129 @@ class FilmVandaagScraper:
                       imdb_score: (float, float) = None,
                       release_year: (int, int) = None,
                       votes_threshold: int = 10000
-                      ) -> typing.Generator[dict, None, None]:
+                      ) -> typing.Generator[models.Movie, None, None]:
         """
         Generator function. Yields movies.
+        The next SEARCH_PREFETCH_PAGES result pages are fetched in the background while the current page is
+        consumed. Closing the generator cancels prefetches that have not started yet.
         :return: generator
         """
         log.info(f"search_movies()")
+        search_cursor = self.search_cursor(services, genres, imdb_score, release_year, votes_threshold)
+        try:
+            while movies := search_cursor.next_batch(self, 1):
+                yield movies[0]
+        finally:
+            # also runs when the consumer closes the generator
+            search_cursor.close()
+
+    def search_cursor(self, services: list = None,
+                      genres: list = None,
+                      imdb_score: (float, float) = None,
+                      release_year: (int, int) = None,
+                      votes_threshold: int = 10000
+                      ) -> cursor.SearchCursor:
+        """
+        Start a search. Take the results in batches with SearchCursor.next_batch().
+        :return: cursor at the first result
+        """
         params = {"categorie": "films", "sorteer[]": "imdb-score", "genre-filter": "of"}
 
         if services:
-            params["vod[]"] = services
+            params["vod[]"] = list(services)
         if imdb_score:
             if not imdb_score[1]:
                 imdb_score = imdb_score[0], 10
             params["imdb-score[]"] = [str(e) for e in imdb_score]
         if genres:
-            params["genre[]"] = genres
+            params["genre[]"] = list(genres)
         if release_year:
             if not release_year[1]:
                 release_year = release_year[0], datetime.datetime.today().year + 2
             params["jaar[]"] = [str(e) for e in release_year]
         log.info(f"Params: {params}")
+        return cursor.SearchCursor(params=params, votes_threshold=votes_threshold, local=self.use_catalog())
 
-        params["page"] = 0
-        while True:
-            log.info(f"fetching URL: {SEARCH_MOVIE_URL}")
-            resp = requests.get(SEARCH_MOVIE_URL, params=params)
-            resp.raise_for_status()
-            result = resp.json()
-            if not result["results"]:
-                log.info(f"Results empty. No more results available on this page ({params['page']}).")
-                break
-            result_html = result["results"]
-            soup = BeautifulSoup(result_html, 'html.parser')
-            list_items = soup.find_all("li", class_="is-movie")
-            for li in list_items:
-                log.debug(li)
-                gdinfo = li.find("div", class_="item-content").find("div").text.split("•")
-                if len(gdinfo) < 2:
-                    director = None
-                else:
-                    director = gdinfo[1].strip()
-                    genres = [g.strip() for g in gdinfo[0].split("/")]
-                rating_el = li.find("div", class_="rating").span
-                title_el = li.find("a", class_="title")
-                m = re.match(r"^(?P<title>.+?)( \((?P<year>[0-9]{4})\))?$", title_el.text)
-                movie = {"rating": float(rating_el.text.strip()),
-                         "num_votes": int(rating_el["title"].split()[0].replace(".", "")),
-                         "release_year": str(m.group("year")),
-                         "title": m.group("title"),
-                         "genres": genres,
-                         "director": director,
-                         "url": f"{FILMVANDAAG_HOST}{title_el['href']}"}
-                log.info(f"Movie found: {movie}")
-                if movie["num_votes"] < votes_threshold:
-                    log.info(f"Number of votes {movie['num_votes']} below threshold {votes_threshold}. Discarded.")
-                else:
-                    yield movie
-            params["page"] += 1
-        return True
+    def new_movies_cursor(self, services: list[str],
+                          added_days_ago: int,
+                          votes_threshold: int = 10000,
+                          rating_threshold: int = 0,
+                          ranked: bool = None
+                          ) -> cursor.NewMoviesCursor:
+        """
+        Start listing the new movies, best rated first if ranked (default: NEW_MOVIES_RANKED), else newest first.
+        Take them in batches with NewMoviesCursor.next_batch().
+        :return: cursor at the first movie
+        """
+        if ranked is None:
+            ranked = self.config.get("NEW_MOVIES_RANKED", DEFAULT_NEW_MOVIES_RANKED)
+        return cursor.NewMoviesCursor(services=list(services), added_days_ago=added_days_ago,
+                                      votes_threshold=votes_threshold, rating_threshold=rating_threshold,
+                                      ranked=ranked)
+
+    @property
+    def prefetch_depth(self) -> int:
+        return self.config.get("SEARCH_PREFETCH_PAGES", DEFAULT_SEARCH_PREFETCH_PAGES)
+
+    def use_catalog(self) -> bool:
+        """
+        Whether searches are answered from the local catalog: SEARCH_MODE is local and the catalog has been crawled.
+        """
+        return self.config.get("SEARCH_MODE", "live") == "local" and self.catalog is not None and len(self.catalog) > 0
+
+    def search_page(self, params: dict, page: int, votes_threshold: int = 0,
+                    local: bool = False, cached: bool = True) -> list[models.Movie]:
+        """
+        The movies on one /api/search result page. Only local catalog pages are filtered on votes_threshold.
+        """
+        if local:
+            return self.catalog.search_page(params, page, votes_threshold)
+        params = dict(params, page=page)
+        if not cached:
+            return self._fetch_search_page(params)
+        return self._get_or_stale(self._search_cache, search_cache_key(params),
+                                  functools.partial(self._fetch_search_page, params))
+
+    def start_catalog_crawler(self) -> threading.Thread:
+        """
+        Start a daemon thread that mirrors the catalog of all streaming services into the local catalog
+        every CATALOG_CRAWL_INTERVAL seconds.
+        """
+        self._prefetch_pool.submit(self.index_catalog)
+        crawler = catalog.CatalogCrawler(self.catalog, functools.partial(self.search_page, cached=False),
+                                         services=config.streaming_services,
+                                         interval=self.config.get("CATALOG_CRAWL_INTERVAL",
+                                                                  catalog.DEFAULT_CRAWL_INTERVAL),
+                                         delay=self.config.get("CATALOG_CRAWL_DELAY", catalog.DEFAULT_CRAWL_DELAY))
+        return crawler.start()
+
+    def index_catalog(self) -> int:
+        """
+        Add the movies of the local catalog to the title index.
+        :return: number of movies new to the index
+        """
+        added = self.titles.add(self.catalog.movies())
+        log.info(f"Indexed the catalog: {added} new titles, {self.titles}.")
+        return added
+
+    def prefetch_search_page(self, params: dict, page: int) -> concurrent.futures.Future:
+        return self._prefetch_pool.submit(self.search_page, params, page)
+
+    def _fetch_search_page(self, params: dict) -> list[models.Movie]:
+        url = self._site_url(SEARCH_MOVIE_URL)
+        log.info(f"fetching URL: {url}")
+        movies = self.http.get(url, params=params, parse=self._parse_search_results)
+        # the movies are on one of the services searched, /film can only tell which if there is one
+        services = params.get("vod[]") or []
+        if len(services) == 1:
+            self.titles.add(movies, service=services[0])
+        return movies
+
+    def _parse_search_results(self, resp: requests.Response) -> list[models.Movie]:
+        result = resp.json()
+        if not result["results"]:
+            return []
+        with STAGE_SECONDS.time(stage="search_parse"):
+            movies = self.parser.parse_search_results(result["results"])
+        SCRAPED_MOVIES.inc(len(movies), source="search")
+        return movies
@@ -0,0 +1,349 @@
+"""
+Key-value stores for the state that several bot instances share: conversations, user data and the scrape caches.
+"""
+import collections
+import collections.abc
+import json
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+import typing
+import uuid
+
+from telegram.ext import BasePersistence, CallbackContext, ConversationHandler, DispatcherHandlerStop
+from telegram.ext.utils.promise import Promise
+
+log = logging.getLogger(__name__)
+
+SQLITE_TIMEOUT = 10.0
+# a timeout job fires a moment before the deadline that was stored right after it was scheduled
+TIMEOUT_SLACK = 1.0
+
+
+class MemoryStore:
+    """
+    The store of a single instance, a dict. Values are pickled like in SQLiteStore, so callers never share objects.
+    """
+
+    def __init__(self) -> None:
+        self._values = {}
+        self._updated = {}  # key -> time it was set
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"MemoryStore(keys={len(self._values)})"
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            value = self._values.get(key)
+        return default if value is None else pickle.loads(value)
+
+    def set(self, key: str, value) -> None:
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._values[key] = value
+            self._updated[key] = time.time()
+
+    def add(self, key: str, value) -> bool:
+        """
+        Set key only if it is not set.
+        :return: True if it was set
+        """
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if key in self._values:
+                return False
+            self._values[key] = value
+            self._updated[key] = time.time()
+            return True
+
+    def compare_and_delete(self, key: str, expected) -> bool:
+        """
+        Delete key only if its value is still expected.
+        :return: True if it was deleted
+        """
+        expected = pickle.dumps(expected, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            if self._values.get(key) != expected:
+                return False
+            del self._values[key], self._updated[key]
+            return True
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+            self._updated.pop(key, None)
+
+    def delete_older_than(self, prefix: str, updated: float) -> int:
+        """
+        Delete the keys starting with prefix that were last set before updated, a time.time().
+        :return: the number of keys deleted
+        """
+        with self._lock:
+            old = [key for key, set_at in self._updated.items() if set_at < updated and key.startswith(prefix)]
+            for key in old:
+                del self._values[key], self._updated[key]
+            return len(old)
+
+    def keys(self, prefix: str = "") -> list[str]:
+        with self._lock:
+            return [key for key in self._values if key.startswith(prefix)]
+
+
+class SQLiteStore:
+    """
+    Store in a SQLite database, shared by the processes on one host. Every thread gets its own connection.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value BLOB NOT NULL, updated REAL)")
+        log.info(f"SQLiteStore initialized: {self}")
+
+    def __repr__(self):
+        return f"SQLiteStore(path={repr(self.path)})"
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key: str, default=None):
+        row = self._connection().execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO kv (key, value, updated) VALUES (?, ?, ?)", (key, value, time.time()))
+
+    def add(self, key: str, value) -> bool:
+        """
+        Set key only if it is not set, also when another process sets it at the same time.
+        :return: True if it was set
+        """
+        value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connection() as conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO kv (key, value, updated) VALUES (?, ?, ?)",
+                                  (key, value, time.time()))
+            return cursor.rowcount == 1
+
+    def compare_and_delete(self, key: str, expected) -> bool:
+        """
+        Delete key only if its value is still expected, also when another process sets it at the same time.
+        :return: True if it was deleted
+        """
+        expected = pickle.dumps(expected, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._connection() as conn:
+            cursor = conn.execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, expected))
+            return cursor.rowcount == 1
+
+    def delete(self, key: str) -> None:
+        with self._connection() as conn:
+            conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def delete_older_than(self, prefix: str, updated: float) -> int:
+        """
+        Delete the keys starting with prefix that were last set before updated, a time.time().
+        :return: the number of keys deleted
+        """
+        with self._connection() as conn:
+            cursor = conn.execute("DELETE FROM kv WHERE substr(key, 1, ?) = ? AND updated < ?",
+                                  (len(prefix), prefix, updated))
+            return cursor.rowcount
+
+    def keys(self, prefix: str = "") -> list[str]:
+        rows = self._connection().execute("SELECT key FROM kv WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+        return [row[0] for row in rows]
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def open_store(spec: typing.Optional[str]):
+    """
+    :return: a MemoryStore for "memory", a SQLiteStore on the path otherwise and None if spec is empty
+    """
+    if not spec:
+        return None
+    return MemoryStore() if spec == "memory" else SQLiteStore(spec)
+
+
+class ConversationMapping(collections.abc.MutableMapping):
+    """
+    The conversations dict of a ConversationHandler, kept in a store. While a run_async handler is running the
+    handler keeps (old state, Promise) for the conversation. Promises stay in this instance, the store gets the
+    old state.
+    With a timeout the store keeps (state, deadline), the deadline moving on with every step on any instance. A
+    conversation past its deadline reads as ended.
+    """
+
+    def __init__(self, store, name: str, timeout: float = None, clock: typing.Callable[[], float] = time.time) -> None:
+        self.store = store
+        self.prefix = f"conversation:{name}:"
+        self.timeout = timeout
+        self.clock = clock
+        self._running = {}  # key -> (old state, Promise)
+
+    def __repr__(self):
+        return f"ConversationMapping(prefix={repr(self.prefix)}, timeout={self.timeout}, running={len(self._running)})"
+
+    def _store_key(self, key: tuple) -> str:
+        return self.prefix + json.dumps(list(key))
+
+    def _entry(self, key: tuple) -> tuple:
+        """
+        :return: (state, deadline) of the conversation in the store, (None, None) if there is none
+        """
+        entry = self.store.get(self._store_key(key))
+        return entry if isinstance(entry, tuple) else (entry, None)  # a state stored without a deadline
+
+    def __getitem__(self, key):
+        if key in self._running:
+            return self._running[key]
+        state, deadline = self._entry(key)
+        if state is None or (deadline is not None and deadline < self.clock()):
+            raise KeyError(key)
+        return state
+
+    def __setitem__(self, key, state) -> None:
+        if isinstance(state, tuple) and len(state) == 2 and isinstance(state[1], Promise):
+            self._running[key] = state
+            state = state[0]
+        else:
+            self._running.pop(key, None)
+        if state is None:
+            self.store.delete(self._store_key(key))
+        else:
+            deadline = self.clock() + self.timeout if self.timeout else None
+            self.store.set(self._store_key(key), (state, deadline))
+
+    def __delitem__(self, key) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._running.pop(key, None)
+        self.store.delete(self._store_key(key))
+
+    def __iter__(self):
+        keys = {tuple(json.loads(k[len(self.prefix):])) for k in self.store.keys(self.prefix)}
+        return iter(keys | set(self._running))
+
+    def __len__(self):
+        return len(set(self.store.keys(self.prefix)) | {self._store_key(k) for k in self._running})
+
+    def end_if_expired(self, key) -> bool:
+        """
+        Remove the conversation if it is past its deadline, unless another instance moves it on meanwhile.
+        :return: True if it was removed, False if it was moved on or had ended already
+        """
+        entry = self.store.get(self._store_key(key))
+        state, deadline = entry if isinstance(entry, tuple) else (entry, None)
+        if state is None or (deadline is not None and deadline > self.clock() + TIMEOUT_SLACK):
+            return False
+        if not self.store.compare_and_delete(self._store_key(key), entry):
+            return False
+        self._running.pop(key, None)
+        return True
+
+
+class SharedConversationHandler(ConversationHandler):
+    """
+    ConversationHandler whose timeout jobs only end a conversation kept in a store when it is past the deadline in
+    the store. The job runs on the instance that handled the previous step, while another instance may have moved
+    the conversation on since.
+    """
+
+    def _trigger_timeout(self, context: CallbackContext, job=None) -> None:
+        if not isinstance(self.conversations, ConversationMapping):
+            super()._trigger_timeout(context, job)
+            return
+        if isinstance(context, CallbackContext):
+            job = context.job
+        timeout = job.context
+        with self._timeout_jobs_lock:
+            if self.timeout_jobs.get(timeout.conversation_key) is not job:
+                return  # cancelled in handle_update
+            del self.timeout_jobs[timeout.conversation_key]
+        if not self.conversations.end_if_expired(timeout.conversation_key):
+            log.debug(f"Conversation {timeout.conversation_key} of {self.name} moved on, no timeout")
+            return
+        for handler in self.states.get(self.TIMEOUT, []):
+            check = handler.check_update(timeout.update)
+            if check is not None and check is not False:
+                try:
+                    handler.handle_update(timeout.update, timeout.dispatcher, check, timeout.callback_context)
+                except DispatcherHandlerStop:
+                    log.warning(f"DispatcherHandlerStop in the TIMEOUT state of {self.name} is ignored")
+
+
+class StorePersistence(BasePersistence):
+    """
+    Persistence of the dispatcher's user_data and chat_data, and of the conversations of persistent
+    ConversationHandlers, in a store. user_data and chat_data are reloaded from the store before every update
+    when another instance changed them, so an update can be handled by any instance.
+    """
+
+    def __init__(self, store, conversation_timeout: float = None) -> None:
+        super().__init__(store_user_data=True, store_chat_data=True, store_bot_data=False)
+        self.store = store
+        self.conversation_timeout = conversation_timeout
+        self._versions = {}  # store key -> version last written or read by this instance
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"StorePersistence(store={self.store})"
+
+    def _load(self, key: str, data: dict) -> None:
+        version, stored = self.store.get(key, (None, None))
+        with self._lock:
+            if version is None or version == self._versions.get(key):
+                return
+            self._versions[key] = version
+        data.clear()
+        data.update(stored)
+
+    def _save(self, key: str, data: dict) -> None:
+        version = uuid.uuid4().hex
+        self.store.set(key, (version, data))
+        with self._lock:
+            self._versions[key] = version
+
+    def get_user_data(self) -> collections.defaultdict:
+        return collections.defaultdict(dict)  # loaded per user by refresh_user_data
+
+    def get_chat_data(self) -> collections.defaultdict:
+        return collections.defaultdict(dict)
+
+    def get_bot_data(self) -> dict:
+        return {}
+
+    def get_conversations(self, name: str) -> ConversationMapping:
+        return ConversationMapping(self.store, name, timeout=self.conversation_timeout)
+
+    def update_conversation(self, name: str, key: tuple, new_state) -> None:
+        pass  # ConversationMapping writes to the store itself
+
+    def update_user_data(self, user_id: int, data: dict) -> None:
+        self._save(f"user_data:{user_id}", data)
+
+    def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._save(f"chat_data:{chat_id}", data)
+
+    def update_bot_data(self, data: dict) -> None:
+        pass
+
+    def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        self._load(f"user_data:{user_id}", user_data)
+
+    def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        self._load(f"chat_data:{chat_id}", chat_data)
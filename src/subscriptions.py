@@ -0,0 +1,168 @@
+import collections
+import dataclasses
+import logging
+import threading
+import time
+import typing
+import uuid
+
+import models
+
+log = logging.getLogger(__name__)
+
+STORE_PREFIX = "subscription:"
+VERSION_KEY = "subscriptions:version"
+CLAIM_PREFIX = "alerted:"
+CLAIM_SECONDS = 30 * 24 * 3600  # a movie listed again after this long is new again
+
+
+@dataclasses.dataclass(frozen=True)
+class Subscription:
+    """
+    The new movies a chat wants to hear about. No services or no genres means any.
+    """
+    chat_id: int
+    services: tuple[str, ...] = ()
+    genres: tuple[str, ...] = ()
+    min_rating: float = 0
+    min_votes: int = 0
+
+    def accepts(self, movie: models.Movie) -> bool:
+        return movie.rating >= self.min_rating and movie.num_votes >= self.min_votes
+
+
+class SubscriptionIndex:
+    """
+    The subscriptions of all chats, one per chat, indexed on every (service, genre) pair they accept. Matching a
+    movie only looks at the subscriptions of its own pairs, each of which accepts its service and genre, not at
+    every subscription.
+    With a store the subscriptions are saved in it, so they survive a restart and are shared by the instances
+    using the store. refresh() picks up the changes other instances made.
+    """
+
+    def __init__(self, store=None) -> None:
+        self.store = store
+        self._subscriptions = {}  # chat_id -> Subscription
+        # (service, lowercase genre) -> chat_ids, "" for any service or any genre
+        self._by_service_genre = collections.defaultdict(set)
+        self._version = None  # of the subscriptions in the store this index was built from
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def __repr__(self):
+        return f"SubscriptionIndex(subscriptions={len(self)})"
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def get(self, chat_id: int) -> typing.Optional[Subscription]:
+        return self._subscriptions.get(chat_id)
+
+    def add(self, subscription: Subscription) -> None:
+        """
+        Add the subscription, replacing the earlier subscription of the chat.
+        """
+        with self._lock:
+            self._add(subscription)
+            if self.store is not None:
+                self.store.set(f"{STORE_PREFIX}{subscription.chat_id}", subscription)
+                self._changed()
+
+    def _add(self, subscription: Subscription) -> None:
+        self._remove(subscription.chat_id)
+        self._subscriptions[subscription.chat_id] = subscription
+        for key in self._keys(subscription):
+            self._by_service_genre[key].add(subscription.chat_id)
+
+    def remove(self, chat_id: int) -> bool:
+        """
+        :return: True if the chat had a subscription
+        """
+        with self._lock:
+            removed = self._remove(chat_id)
+            if removed and self.store is not None:
+                self.store.delete(f"{STORE_PREFIX}{chat_id}")
+                self._changed()
+            return removed
+
+    def _changed(self) -> None:
+        self._version = uuid.uuid4().hex
+        self.store.set(VERSION_KEY, self._version)
+
+    def refresh(self) -> None:
+        """
+        Rebuild the index from the store if the subscriptions in it changed since it was built.
+        """
+        if self.store is None:
+            return
+        with self._lock:
+            version = self.store.get(VERSION_KEY)
+            if version is not None and version == self._version:
+                return
+            self._subscriptions.clear()
+            self._by_service_genre.clear()
+            for key in self.store.keys(STORE_PREFIX):
+                subscription = self.store.get(key)
+                if subscription is not None:
+                    self._add(subscription)
+            self._version = version
+        log.info(f"Loaded {self} from {self.store}.")
+
+    def _remove(self, chat_id: int) -> bool:
+        subscription = self._subscriptions.pop(chat_id, None)
+        if subscription is None:
+            return False
+        for key in self._keys(subscription):
+            self._by_service_genre[key].discard(chat_id)
+            if not self._by_service_genre[key]:
+                del self._by_service_genre[key]
+        return True
+
+    @staticmethod
+    def _keys(subscription: Subscription) -> list[tuple[str, str]]:
+        return [(service, genre.lower()) for service in subscription.services or [""]
+                for genre in subscription.genres or [""]]
+
+    def __iter__(self) -> typing.Iterator[Subscription]:
+        with self._lock:
+            return iter(list(self._subscriptions.values()))
+
+    def claim(self, movies: typing.Iterable[models.Movie]) -> list[models.Movie]:
+        """
+        Claim the alerts of new movies. With a shared store several instances find the same new movies, only the
+        first to claim a movie on a service alerts its subscribers.
+        :return: the movies this instance claimed, all of them without a store
+        """
+        movies = list(movies)
+        if self.store is None or not movies:
+            return movies
+        now = time.time()
+        claimed = [m for m in movies if self.store.add(f"{CLAIM_PREFIX}{m.service}:{m.path}", now)]
+        if len(claimed) < len(movies):
+            log.info(f"{len(movies) - len(claimed)} new movies were claimed by another instance.")
+        self.store.delete_older_than(CLAIM_PREFIX, now - CLAIM_SECONDS)
+        return claimed
+
+    def services(self) -> set[str]:
+        """
+        :return: the services subscribed to, "" included if a chat subscribed to any service
+        """
+        with self._lock:
+            return {service for service, _ in self._by_service_genre}
+
+    def match(self, movies: typing.Iterable[models.Movie]) -> dict[int, list[models.Movie]]:
+        """
+        Match the movies against all subscriptions.
+        :return: chat_id -> the matching movies, a movie found on several services once
+        """
+        matches = collections.defaultdict(dict)
+        with self._lock:
+            for movie in movies:
+                genres = ("",) + tuple(genre.lower() for genre in movie.genres)
+                for service in ("",) + movie.services:
+                    for genre in genres:
+                        for chat_id in self._by_service_genre.get((service, genre), ()):
+                            if movie.path not in matches.get(chat_id, ()) and \
+                                    self._subscriptions[chat_id].accepts(movie):
+                                matches[chat_id][movie.path] = movie
+        return {chat_id: list(movies.values()) for chat_id, movies in matches.items()}
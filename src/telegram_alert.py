@@ -2,16 +2,27 @@ import logging
 
 import telegram
 
+import outbound
+
 log = logging.getLogger(__name__)
 
 
 class TelegramAlertBot:
+    """
+    Sends alerts to the alert channel on a background thread, see outbound.MessageScheduler. Identical alerts
+    within ALERT_COALESCE_WINDOW seconds are sent once.
+    """
+
     def __init__(self, config: dict, program_name: str) -> None:
         self.config = config
         self.chat_id = config["TG_ALERT_CHANNEL"]
         self.program_name = program_name
         self.instance_name = config["TG_ALERT_INSTANCE_NAME"]
         self.bot = telegram.Bot(config["TG_ALERT_BOT_TOKEN"])
+        self.outbox = outbound.MessageScheduler(
+            name="alerts",
+            coalesce_window=config.get("ALERT_COALESCE_WINDOW", outbound.DEFAULT_COALESCE_WINDOW))
+        self.outbox.start()
         log.info(f"TelegramAlertBot initialized: {self}")
 
     def __repr__(self):
@@ -30,11 +41,16 @@ class TelegramAlertBot:
         icon = "\U000026A0"
         self._send_message(f"{icon} {message}")
 
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Send the queued alerts, waiting at most timeout seconds.
+        """
+        self.outbox.close(timeout)
+
     def _send_message(self, message: str) -> None:
         idx = 0
         message = f"{self.program_name} ({self.instance_name}) | {message}"
         while idx < len(message):
             ttext = message[idx:idx + 4096]
-            params = {"text": ttext, "chat_id": self.chat_id, "parse_mode": "Markdown"}
-            self.bot.sendMessage(self.chat_id, ttext)
+            self.outbox.submit(self.chat_id, self.bot.sendMessage, self.chat_id, ttext, coalesce_key=(idx, message))
             idx += 4096
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+In-memory fuzzy lookup of movies by title, director and year, for "where can I stream X?".
+"""
+import array
+import collections
+import dataclasses
+import heapq
+import logging
+import math
+import re
+import sys
+import threading
+import typing
+import unicodedata
+
+import models
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MIN_SIMILARITY = 0.4
+DEFAULT_LIMIT = 5
+COVERAGE_WEIGHT = 0.7
+MAX_CANDIDATES = 256
+PREFIX_BONUS = 0.2
+YEAR_BONUS = 0.2
+DIRECTOR_WEIGHT = 0.9
+
+YEAR_RE = re.compile(r"\b(?:19|20)\d\d\b")
+NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+EMPTY_POSTING = array.array("I")
+
+
+def normalize(text: str) -> str:
+    """
+    Lowercase, without accents and punctuation: "Amélie (2001)" -> "amelie 2001".
+    """
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode()
+    return NON_WORD_RE.sub(" ", text.lower()).strip()
+
+
+def trigrams(text: str, prefix: bool = False) -> tuple[str, ...]:
+    """
+    The distinct trigrams of the words of normalized text, padded like pg_trgm: two spaces in front of a word and
+    one after it. With prefix set the last word gets no end padding, so "godf" matches "godfather".
+    """
+    words = text.split()
+    grams = {}
+    for i, word in enumerate(words):
+        padded = f"  {word}" if prefix and i == len(words) - 1 else f"  {word} "
+        for j in range(len(padded) - 2):
+            grams.setdefault(sys.intern(padded[j:j + 3]))
+    return tuple(grams)
+
+
+@dataclasses.dataclass(slots=True)
+class IndexEntry:
+    movie: models.Movie
+    title: str  # normalized
+    title_grams: tuple[str, ...]
+    director_grams: tuple[str, ...]
+
+
+@dataclasses.dataclass(frozen=True, slots=True)
+class TitleMatch:
+    movie: models.Movie
+    score: float
+
+
+def _similarity(query: set, grams: tuple[str, ...]) -> float:
+    """
+    Mostly the share of the query's trigrams found in grams, so a short query matches a long title, and some
+    of their Jaccard similarity, so the closer of two such titles goes first. At most that share.
+    """
+    if not grams:
+        return 0.0
+    common = len(query.intersection(grams))
+    return COVERAGE_WEIGHT * common / len(query) + (1 - COVERAGE_WEIGHT) * common / (len(query) + len(grams) - common)
+
+
+class TitleIndex:
+    """
+    Trigram index over the titles and directors of movies, updated with add() as movies are scraped. A movie is
+    known by its path: adding it again updates its rating and adds its services.
+    A lookup only scores the movies that share one of the rarest trigrams of the query: movies that share none of
+    them cannot reach min_similarity. The postings of those trigrams are taken rarest first, up to MAX_CANDIDATES
+    movies beyond the rarest posting, which bounds the lookup time for queries made of common trigrams.
+    """
+
+    def __init__(self, min_similarity: float = DEFAULT_MIN_SIMILARITY) -> None:
+        self.min_similarity = min_similarity
+        self._entries = []  # id -> IndexEntry, None once removed or replaced
+        self._ids = {}  # path -> id
+        self._postings = collections.defaultdict(lambda: array.array("I"))  # trigram -> ids
+        self._removed = 0
+        self._lock = threading.RLock()
+
+    def __repr__(self):
+        return f"TitleIndex(movies={len(self)}, trigrams={len(self._postings)})"
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, path: str):
+        return path in self._ids
+
+    def add(self, movies: typing.Iterable[models.Movie], service: str = None) -> int:
+        """
+        Add or update the movies, also listing them on service if it is given.
+        :return: number of movies new to the index
+        """
+        added = 0
+        with self._lock:
+            for movie in movies:
+                services = movie.services + ((service,) if service and service not in movie.services else ())
+                entry_id = self._ids.get(movie.path)
+                entry = self._entries[entry_id] if entry_id is not None else None
+                if entry is not None:
+                    old = entry.movie
+                    services = old.services + tuple(s for s in services if s not in old.services)
+                    if (old.title, old.director, old.release_year) == (movie.title, movie.director,
+                                                                       movie.release_year):
+                        entry.movie = dataclasses.replace(movie, services=services)
+                        continue
+                    self._remove(movie.path)
+                else:
+                    added += 1
+                self._insert(dataclasses.replace(movie, services=services))
+            self._compact_if_needed()
+        return added
+
+    def _insert(self, movie: models.Movie) -> None:
+        title = normalize(movie.title)
+        entry = IndexEntry(movie, title, trigrams(title), trigrams(normalize(movie.director or "")))
+        entry_id = len(self._entries)
+        self._entries.append(entry)
+        self._ids[movie.path] = entry_id
+        for gram in set(entry.title_grams + entry.director_grams):
+            self._postings[gram].append(entry_id)
+
+    def remove(self, path: str) -> bool:
+        """
+        :return: True if the movie was in the index
+        """
+        with self._lock:
+            removed = self._remove(path)
+            self._compact_if_needed()
+        return removed
+
+    def _remove(self, path: str) -> bool:
+        entry_id = self._ids.pop(path, None)
+        if entry_id is None:
+            return False
+        self._entries[entry_id] = None  # its postings are skipped until the next compaction
+        self._removed += 1
+        return True
+
+    def _compact_if_needed(self) -> None:
+        if self._removed <= max(1024, len(self._ids)):
+            return
+        entries = [e for e in self._entries if e is not None]
+        self._entries, self._ids, self._removed = [], {}, 0
+        self._postings.clear()
+        for entry in entries:
+            self._insert(entry.movie)
+        log.info(f"Compacted {self}.")
+
+    def search(self, query: str, limit: int = DEFAULT_LIMIT) -> list[TitleMatch]:
+        """
+        The movies best matching query, a (part of a) title or director, possibly with a year.
+        :return: at most limit matches, best first, equal scores by number of votes
+        """
+        text = normalize(query)
+        years = {int(y) for y in YEAR_RE.findall(text)}
+        text = YEAR_RE.sub(" ", text).strip() or text
+        grams = set(trigrams(text, prefix=True))
+        if not grams:
+            return []
+        with self._lock:
+            # a movie that reaches min_similarity shares at least `needed` trigrams with the query, so it is in
+            # one of the len(grams) - needed + 1 smallest postings
+            needed = max(1, math.ceil(self.min_similarity * len(grams)))
+            postings = sorted((self._postings.get(g, EMPTY_POSTING) for g in grams), key=len)
+            candidates = set()
+            for posting in postings[:len(grams) - needed + 1]:
+                if candidates and len(candidates) + len(posting) > MAX_CANDIDATES:
+                    break
+                candidates.update(posting)
+            scored = []
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry is None:
+                    continue
+                score = max(_similarity(grams, entry.title_grams),
+                            DIRECTOR_WEIGHT * _similarity(grams, entry.director_grams))
+                if entry.title.startswith(text):
+                    score += PREFIX_BONUS
+                if years:
+                    score += YEAR_BONUS if entry.movie.release_year in years else -YEAR_BONUS
+                if score >= self.min_similarity:
+                    scored.append((score, entry.movie.num_votes, entry_id))
+            best = heapq.nlargest(limit, scored)
+            return [TitleMatch(self._entries[entry_id].movie, round(score, 3)) for score, _, entry_id in best]
@@ -0,0 +1,121 @@
+"""
+Local stand-in for www.filmvandaag.nl that serves the fixtures in tests/fixtures.
+Point the scraper at it with config["FILMVANDAAG_HOST"] = standin.url.
+Run it on its own with: python tests/standin.py --port 8080 --latency 0.05
+"""
+import argparse
+import http.server
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+log = logging.getLogger(__name__)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+NEW_MOVIES_PATHS = {"/video-on-demand/netflix/nieuwe-films": "new_movies_netflix.html",
+                    "/video-on-demand/pathe-thuis/nieuw-op-pathe-thuis": "new_movies_pathe.html",
+                    "/video-on-demand/amazon-prime-video/nieuwe-films": "new_movies_amazon.html",
+                    "/video-on-demand/disney-plus/nieuwe-films": "new_movies_disney.html"}
+SEARCH_PATH = "/api/search"
+SEARCH_FIXTURE_PAGES = 2  # search_page_0.json and search_page_1.json hold results
+
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+
+class StandIn:
+    """
+    Threaded HTTP server serving the fixture pages. Every response is delayed by latency seconds.
+    The search api serves search_pages result pages, cycling through the search fixtures.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.0, search_pages: int = SEARCH_FIXTURE_PAGES) -> None:
+        self.latency = latency
+        self.search_pages = search_pages
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self.pages = {path: read_fixture(name) for path, name in NEW_MOVIES_PATHS.items()}
+        self.search_results = [read_fixture(f"search_page_{n}.json") for n in range(SEARCH_FIXTURE_PAGES)]
+        self.search_empty = json.dumps({"results": "", "total": 0}).encode()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def __repr__(self):
+        return f"StandIn(url={repr(self.url)}, latency={self.latency}, search_pages={self.search_pages})"
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                if url.path == SEARCH_PATH:
+                    page = int(urllib.parse.parse_qs(url.query).get("page", ["0"])[0])
+                    body = standin.search_body(page)
+                    content_type = "application/json"
+                elif url.path in standin.pages:
+                    body = standin.pages[url.path]
+                    content_type = "text/html; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                if standin.latency:
+                    time.sleep(standin.latency)
+                with standin._lock:
+                    standin.requests += 1
+                    standin.bytes_sent += len(body)
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        return Handler
+
+    def search_body(self, page: int) -> bytes:
+        if page >= self.search_pages:
+            return self.search_empty
+        return self.search_results[page % SEARCH_FIXTURE_PAGES]
+
+    def start(self) -> "StandIn":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="standin", daemon=True)
+        self._thread.start()
+        log.info(f"Stand-in started: {self}")
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(description="Local filmvandaag.nl stand-in serving the test fixtures.")
+    argparser.add_argument("--port", type=int, default=8080)
+    argparser.add_argument("--latency", type=float, default=0.0, help="Delay of every response in seconds.")
+    argparser.add_argument("--search-pages", type=int, default=SEARCH_FIXTURE_PAGES,
+                           help="Number of search result pages.")
+    args = argparser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    standin = StandIn(args.port, args.latency, args.search_pages).start()
+    print(f"Serving fixtures on {standin.url}")
+    try:
+        standin._thread.join()
+    except KeyboardInterrupt:
+        standin.stop()
@@ -0,0 +1,165 @@
+"""
+Local stand-in for the Telegram Bot API, for driving the bot without Telegram.
+Point the bot at it with config["TG_API_URL"] = telegram_standin.base_url. Every call the bot makes is answered
+like Telegram would and queued per chat, see calls(chat_id). Updates for the bot are made with command_update() and
+callback_update() and posted to its webhook.
+"""
+import collections
+import dataclasses
+import http.server
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "FilmVandaag", "username": "filmvandaag_test_bot"}
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+@dataclasses.dataclass
+class ApiCall:
+    method: str
+    params: dict
+    message_id: int = None  # of the message sent or edited
+    received: float = dataclasses.field(default_factory=time.perf_counter)
+
+    @property
+    def text(self) -> str:
+        return self.params.get("text") or ""
+
+    @property
+    def buttons(self) -> list[dict]:
+        """
+        :return: the inline keyboard buttons of the message, as {"text": ..., "callback_data": ...}
+        """
+        markup = self.params.get("reply_markup") or {}
+        return [button for row in markup.get("inline_keyboard", []) for button in row]
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+
+def _message(chat_id: int, message_id: int, text: str = "", sender: dict = None) -> dict:
+    return {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"},
+            "from": sender or BOT_USER, "text": text}
+
+
+def command_update(user_id: int, text: str) -> dict:
+    """
+    The update of user_id sending a command like "/zoek" in their private chat with the bot.
+    """
+    message = _message(user_id, next(_message_ids), text, sender=_user(user_id))
+    message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def callback_update(user_id: int, message_id: int, data: str) -> dict:
+    """
+    The update of user_id tapping the button with callback data of the bot's message message_id. The id of the
+    callback query starts with the user id, so its answer is queued for their chat.
+    """
+    update_id = next(_update_ids)
+    return {"update_id": update_id,
+            "callback_query": {"id": f"{user_id}:{update_id}", "from": _user(user_id), "chat_instance": str(user_id),
+                               "data": data, "message": _message(user_id, message_id)}}
+
+
+class TelegramStandIn:
+    """
+    Threaded HTTP server answering the Bot API methods the bot uses. Every response is delayed by latency seconds.
+    """
+
+    def __init__(self, port: int = 0, latency: float = 0.0) -> None:
+        self.latency = latency
+        self.requests = collections.Counter()  # method -> number of calls
+        self._chats = {}  # chat id -> queue of ApiCall
+        self._lock = threading.Lock()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    def __repr__(self):
+        return f"TelegramStandIn(url={repr(self.url)}, latency={self.latency}, calls={sum(self.requests.values())})"
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    @property
+    def base_url(self) -> str:
+        """The Bot API url without the token, as python-telegram-bot takes it."""
+        return f"{self.url}/bot"
+
+    def calls(self, chat_id: int) -> queue.Queue:
+        """
+        :return: queue of the ApiCall's the bot made in the chat, oldest first
+        """
+        with self._lock:
+            return self._chats.setdefault(chat_id, queue.Queue())
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                method = self.path.rsplit("/", 1)[-1]
+                length = int(self.headers.get("Content-Length") or 0)
+                params = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                if standin.latency:
+                    time.sleep(standin.latency)
+                body = json.dumps({"ok": True, "result": standin.handle(method, params)}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                log.debug(format % args)
+
+        return Handler
+
+    def handle(self, method: str, params: dict):
+        """
+        :return: the result of the API call
+        """
+        with self._lock:
+            self.requests[method] += 1
+        if isinstance(params.get("reply_markup"), str):
+            params["reply_markup"] = json.loads(params["reply_markup"])
+        if method == "getMe":
+            return BOT_USER
+        if method == "answerCallbackQuery":
+            chat_id = int(params["callback_query_id"].split(":")[0])
+            self.calls(chat_id).put(ApiCall(method, params))
+            return True
+        if "chat_id" not in params:
+            return True
+        chat_id = int(params["chat_id"])
+        message_id = int(params.get("message_id") or next(_message_ids))
+        self.calls(chat_id).put(ApiCall(method, params, message_id))
+        if method in ("sendMessage", "editMessageText", "editMessageReplyMarkup"):
+            message = _message(chat_id, message_id, params.get("text", ""))
+            if params.get("reply_markup"):
+                message["reply_markup"] = params["reply_markup"]
+            return message
+        return True
+
+    def start(self) -> "TelegramStandIn":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="telegram-standin", daemon=True)
+        self._thread.start()
+        log.info(f"Telegram stand-in started: {self}")
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,196 @@
+import threading
+import types
+
+import pytest
+
+import bot
+from bot import ScrapeGate, ScrapeBusy, split_message
+from models import Movie
+from scraper import FilmVandaagScraper
+
+
+def test_scrape_gate_limits_per_user():
+    gate = ScrapeGate(max_global=2, max_per_user=1, max_queue=0)
+    with gate.admit(1):
+        with pytest.raises(ScrapeBusy):
+            with gate.admit(1):
+                pass
+        with gate.admit(2):
+            pass
+    with gate.admit(1):
+        pass
+
+
+def test_scrape_gate_queues_then_refuses():
+    gate = ScrapeGate(max_global=1, max_per_user=1, max_queue=1)
+    release = threading.Event()
+    entered = threading.Event()
+    order = []
+
+    def worker(user_id):
+        with gate.admit(user_id):
+            order.append(user_id)
+            entered.set()
+            release.wait()
+
+    first = threading.Thread(target=worker, args=(1,))
+    first.start()
+    entered.wait()
+    queued = threading.Thread(target=worker, args=(2,))
+    queued.start()
+    while gate._admitted < 2:
+        pass
+    with pytest.raises(ScrapeBusy):
+        with gate.admit(3):
+            pass
+    release.set()
+    first.join()
+    queued.join()
+    assert order == [1, 2]
+    assert gate._admitted == 0 and not gate._per_user
+
+
+def test_full_gate_replies_busy_before_dispatching():
+    fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:test", "SCRAPE_CONCURRENCY": 1, "SCRAPE_QUEUE": 1},
+                                FilmVandaagScraper({}))
+    fv_bot.outbox = RecordingOutbox()
+    dispatched = []
+    context = types.SimpleNamespace(user_data={}, dispatcher=types.SimpleNamespace(
+        run_async=lambda func, update: dispatched.append(func)))
+    handler = fv_bot.admit_scrape(fv_bot.handle_input_release_year, bot.RELEASE_YEAR)
+
+    def tap(user_id):
+        message = types.SimpleNamespace(chat_id=user_id, reply_text=telegram_call("reply_text"))
+        query = types.SimpleNamespace(data="2020", from_user=types.SimpleNamespace(id=user_id), message=message,
+                                      answer=telegram_call("answer"))
+        return handler(types.SimpleNamespace(callback_query=query), context)
+
+    tap(1), tap(2)  # one scraping, one queued, both waiting for a worker
+    assert len(dispatched) == 2 and not fv_bot.outbox.calls
+    # refused before there is a cursor: the year question stays, tapping the year again retries
+    assert tap(3) == bot.RELEASE_YEAR and len(dispatched) == 2 and not context.user_data
+    assert fv_bot.outbox.calls == [("answer", {"text": "Het is even erg druk. Probeer het zo nog eens."})]
+    for user_id in (1, 2):  # their scrapes ran
+        with fv_bot.scrape_gate.slot(user_id):
+            pass
+    tap(3)
+    assert len(dispatched) == 3
+
+
+def test_split_message_fits_max_length():
+    lines = [f"line {n}" * 10 for n in range(50)]
+    messages = split_message(lines, max_length=200)
+    assert all(len(m) <= 200 for m in messages)
+    assert "\n".join(messages).split("\n") == lines
+
+
+class ListCursor:
+    def __init__(self, movies):
+        self.movies = movies
+
+    def next_batch(self, scraper, size):
+        batch, self.movies = self.movies[:size], self.movies[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+class RecordingOutbox:
+    def __init__(self):
+        self.calls = []
+
+    def submit(self, chat_id, func, *args, **kwargs):
+        self.calls.append((func.__name__, kwargs))
+
+
+def telegram_call(name):
+    def call(**kwargs):
+        pass
+    call.__name__ = name
+    return call
+
+
+def make_movies(n, title="Movie"):
+    return [Movie.create(title=f"{title} {i}", release_year="2020", rating=7.5, num_votes=20000, genres=[],
+                         director=None, path=f"/film/{i}-movie") for i in range(n)]
+
+
+def show_pages(movies):
+    fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:test"}, FilmVandaagScraper({}))
+    fv_bot.outbox = RecordingOutbox()
+    message = types.SimpleNamespace(chat_id=1, reply_text=telegram_call("reply_text"))
+    query = types.SimpleNamespace(data="1900", from_user=types.SimpleNamespace(id=1), message=message,
+                                  answer=lambda **kwargs: None, edit_message_text=telegram_call("edit_message_text"),
+                                  edit_message_reply_markup=telegram_call("edit_message_reply_markup"))
+    context = types.SimpleNamespace(user_data={"movies_cursor": ListCursor(movies)})
+    states = []
+    while not states or states[-1] == bot.SHOW_MOVIES:
+        states.append(fv_bot.show_more_movies(types.SimpleNamespace(callback_query=query), context))
+    return fv_bot.outbox.calls, states
+
+
+def test_each_page_is_one_api_call():
+    calls, states = show_pages(make_movies(50))
+    assert states == [bot.SHOW_MOVIES, bot.SHOW_MOVIES, bot.ConversationHandler.END]
+    assert [name for name, _ in calls] == ["reply_text", "edit_message_text", "edit_message_text"]
+    first, last = calls[0][1]["text"], calls[-1][1]["text"]
+    assert last.startswith(first + "\n")
+    assert last.endswith("dat was het\\.")
+    assert calls[1][1]["reply_markup"] is not None and calls[2][1]["reply_markup"] is None
+
+
+def test_full_message_continues_in_a_new_one():
+    calls, _ = show_pages(make_movies(200, title="A long movie title" * 5))
+    names = [name for name, _ in calls]
+    assert "edit_message_reply_markup" in names
+    assert names.count("reply_text") > 1
+    assert all(len(kwargs["text"]) for name, kwargs in calls if name != "edit_message_reply_markup")
+
+
+def test_movie_lines_rendered_once():
+    bot.render_movie_line.cache_clear()
+    movie = make_movies(1, title="Dr. Strange (*)")[0]
+    line, length = bot.movie_line(movie)
+    assert line == "[*Dr\\. Strange \\(\\*\\) 0*](https://www.filmvandaag.nl/film/0-movie) \\(2020\\) imdb *7\\.5*"
+    assert length == len("Dr. Strange (*) 0 (2020) imdb 7.5")
+    bot.movie_line(movie)
+    assert bot.render_movie_line.cache_info().hits == 1
+
+
+def test_stale_page_is_marked():
+    movies = make_movies(3)
+    cursor = ListCursor(movies)
+    cursor.stale = True
+    fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:test"}, FilmVandaagScraper({}))
+    fv_bot.outbox = RecordingOutbox()
+    message = types.SimpleNamespace(chat_id=1, reply_text=telegram_call("reply_text"))
+    query = types.SimpleNamespace(data="1900", from_user=types.SimpleNamespace(id=1), message=message,
+                                  answer=lambda **kwargs: None)
+    fv_bot.show_more_movies(types.SimpleNamespace(callback_query=query),
+                            types.SimpleNamespace(user_data={"movies_cursor": cursor}))
+    assert "niet bereikbaar" in fv_bot.outbox.calls[0][1]["text"]
+
+
+def test_handler_errors_get_a_friendly_reply():
+    fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:test"}, FilmVandaagScraper({}))
+    fv_bot.outbox = RecordingOutbox()
+    update = bot.Update.de_json({"update_id": 1, "message": {
+        "message_id": 1, "date": 0, "text": "/nieuw", "chat": {"id": 5, "type": "private"}}}, fv_bot.updater.bot)
+    fv_bot.handle_bot_exception(update, types.SimpleNamespace(error=ConnectionError("filmvandaag is down")))
+    assert fv_bot.outbox.calls == [("reply_text", {"text": bot.ERROR_TEXT})]
+    fv_bot.handle_bot_exception(None, types.SimpleNamespace(error=ConnectionError("polling failed")))
+    assert len(fv_bot.outbox.calls) == 1
+
+
+def test_film_lists_matches_with_their_services():
+    fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:test"}, FilmVandaagScraper({}))
+    fv_bot.outbox = RecordingOutbox()
+    fv_bot.scraper.titles.add(make_movies(3, title="Dune"), service="netflix")
+    update = types.SimpleNamespace(effective_chat=types.SimpleNamespace(id=1),
+                                   message=types.SimpleNamespace(reply_text=telegram_call("reply_text")))
+    fv_bot.find_film(update, types.SimpleNamespace(args=["dune", "1"]))
+    text = fv_bot.outbox.calls[0][1]["text"]
+    assert text.splitlines()[0].startswith("[*Dune 1*]") and text.splitlines()[0].endswith(" op netflix")
+    fv_bot.find_film(update, types.SimpleNamespace(args=["xqzw"]))
+    assert fv_bot.outbox.calls[1][1]["text"] == "Geen film gevonden voor *xqzw*\\."
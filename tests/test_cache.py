@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from cache import TTLCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    c = TTLCache(maxsize=4, ttl=10, clock=clock)
+    c.set("a", 1)
+    assert c.get("a") == 1
+    clock.now = 11
+    assert c.get("a") is None
+    assert c.get_stale("a") == 1
+    assert c.stats()["hits"] == 1 and c.stats()["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")
+    c.set("c", 3)
+    assert "b" not in c
+    assert "a" in c and "c" in c
+    assert c.evictions == 1
+
+
+def test_concurrent_misses_load_once():
+    c = TTLCache(maxsize=4, ttl=60)
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.2)
+        return "listing"
+
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(c.get_or_load("netflix", loader))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["listing"] * 8
+    assert len(calls) == 1
+
+
+def test_failed_load_is_not_cached():
+    c = TTLCache(maxsize=4, ttl=60)
+
+    def failing():
+        raise ValueError("down")
+
+    with pytest.raises(ValueError):
+        c.get_or_load("netflix", failing)
+    assert c.get_or_load("netflix", lambda: "listing") == "listing"
+
+
+def test_force_reloads_fresh_entry():
+    c = TTLCache(maxsize=4, ttl=60)
+    c.set("a", 1)
+    assert c.get_or_load("a", lambda: 2) == 1
+    assert c.get_or_load("a", lambda: 2, force=True) == 2
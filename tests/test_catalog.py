@@ -0,0 +1,66 @@
+import pytest
+
+import config
+from catalog import MovieCatalog, CatalogCrawler
+from models import Movie
+from scraper import FilmVandaagScraper
+from standin import StandIn
+
+
+def movie(path, rating, num_votes, genres, year=2010):
+    return Movie.create(title=path.title(), release_year=str(year), rating=rating, num_votes=num_votes,
+                        genres=genres, director=None, path=f"/film/{path}")
+
+
+@pytest.fixture
+def catalog():
+    catalog = MovieCatalog(":memory:")
+    catalog.upsert([movie("a", 8.5, 50000, ["Actie"]), movie("b", 7.2, 900000, ["Horror", "Actie"], 2021),
+                    movie("c", 9.1, 500, ["Documentaire"])], "netflix", crawled_at=100)
+    catalog.upsert([movie("b", 7.2, 900000, ["Horror", "Actie"], 2021), movie("d", 6.0, 20000, ["Komedie"])],
+                   "disney", crawled_at=100)
+    yield catalog
+    catalog.close()
+
+
+def test_search_filters_and_sorts(catalog):
+    paths = lambda movies: [m.path for m in movies]
+    assert paths(catalog.search()) == ["/film/c", "/film/a", "/film/b", "/film/d"]
+    assert paths(catalog.search(genres=["actie"], votes_threshold=10000)) == ["/film/a", "/film/b"]
+    assert paths(catalog.search(services=["disney"], imdb_score=("7", "10"))) == ["/film/b"]
+    assert paths(catalog.search(release_year=(2015, 2025))) == ["/film/b"]
+    assert catalog.search(genres=["horror"])[0].genres == ("Horror", "Actie")
+
+
+def test_prune_removes_movies_gone_from_service(catalog):
+    catalog.upsert([movie("a", 8.5, 50000, ["Actie"])], "netflix", crawled_at=200)
+    assert catalog.prune("netflix", crawled_before=200) == 2
+    assert [m.path for m in catalog.search(services=["netflix"])] == ["/film/a"]
+    assert [m.path for m in catalog.search()] == ["/film/a", "/film/b", "/film/d"]
+
+
+def test_crawl_from_standin_and_search_locally():
+    standin = StandIn().start()
+    try:
+        scraper = FilmVandaagScraper({"FILMVANDAAG_HOST": standin.url, "CATALOG_PATH": ":memory:",
+                                      "SEARCH_MODE": "local"})
+        assert not scraper.use_catalog()
+        crawler = CatalogCrawler(scraper.catalog, lambda params, page: scraper.search_page(params, page, cached=False),
+                                 services=config.streaming_services, delay=0)
+        assert crawler.crawl() == 5 * len(config.streaming_services)
+        requests_after_crawl = standin.requests
+        assert scraper.use_catalog()
+        search_cursor = scraper.search_cursor(services=["netflix"], genres=["actie", "documentaire"],
+                                              imdb_score=(8, None), votes_threshold=10000)
+        assert [m.title for m in search_cursor.next_batch(scraper, 10)] == ["The Deep End", "Oceans Apart",
+                                                                             "Night Train"]
+        assert standin.requests == requests_after_crawl
+    finally:
+        standin.stop()
+
+
+def test_movies_lists_every_movie_with_its_services(catalog):
+    movies = {m.path: m for m in catalog.movies()}
+    assert sorted(movies) == ["/film/a", "/film/b", "/film/c", "/film/d"]
+    assert sorted(movies["/film/b"].services) == ["disney", "netflix"]
+    assert movies["/film/b"].genres == ("Horror", "Actie")
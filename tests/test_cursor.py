@@ -0,0 +1,49 @@
+import pickle
+
+from scraper import FilmVandaagScraper
+from test_scraper_concurrent import fake_get
+from test_scraper_search_cache import fake_search_session
+
+
+def titles(movies):
+    return [m.title for m in movies]
+
+
+def test_search_cursor_resumes_after_pickling(monkeypatch):
+    calls = []
+    scraper = FilmVandaagScraper({"SEARCH_PREFETCH_PAGES": 0})
+    monkeypatch.setattr(scraper.http.session, "get", fake_search_session(calls))
+    search_cursor = scraper.search_cursor(services=["netflix"], genres=["actie"], votes_threshold=10000)
+    assert titles(search_cursor.next_batch(scraper, 2)) == ["The Deep End", "Silent Halls"]
+
+    restored = pickle.loads(pickle.dumps(search_cursor))
+    assert (restored.page, restored.offset) == (0, 2)
+    other_scraper = FilmVandaagScraper({"SEARCH_PREFETCH_PAGES": 0})
+    monkeypatch.setattr(other_scraper.http.session, "get", fake_search_session(calls))
+    assert titles(restored.next_batch(other_scraper, 2)) == ["Oceans Apart", "Night Train"]
+    assert titles(restored.next_batch(other_scraper, 2)) == []
+
+
+def test_new_movies_cursor_pages_through_listing(monkeypatch):
+    scraper = FilmVandaagScraper({})
+    monkeypatch.setattr(scraper.http.session, "get", fake_get())
+    new_cursor = scraper.new_movies_cursor(["netflix", "disney"], added_days_ago=100000, votes_threshold=0,
+                                           ranked=False)
+    everything = list(scraper.scrape_new_movies(["netflix", "disney"], added_days_ago=100000, votes_threshold=0))
+    batches = [new_cursor.next_batch(scraper, 3) for _ in range(3)]
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert sum(batches, []) == everything
+
+    restored = pickle.loads(pickle.dumps(new_cursor))
+    assert restored.next_batch(scraper, 3) == []
+
+
+def test_ranked_new_movies_cursor_pages_through_ranking(monkeypatch):
+    scraper = FilmVandaagScraper({})
+    monkeypatch.setattr(scraper.http.session, "get", fake_get())
+    new_cursor = scraper.new_movies_cursor(["netflix", "disney"], added_days_ago=100000, votes_threshold=0)
+    assert new_cursor.ranked
+    ranking = scraper.rank_new_movies(["netflix", "disney"], added_days_ago=100000, k=100, votes_threshold=0)
+    batches = [new_cursor.next_batch(scraper, 3) for _ in range(3)]
+    assert sum(batches, []) == ranking
+    assert [m.rating for m in ranking] == sorted((m.rating for m in ranking), reverse=True)
@@ -0,0 +1,30 @@
+import datetime
+
+import pytest
+
+from dates import parse_heading_date
+
+NOW = datetime.datetime(2023, 6, 14, 15, 30)
+
+
+@pytest.mark.parametrize("heading, expected", [
+    ("Vandaag", datetime.datetime(2023, 6, 14, 15, 30)),
+    ("gisteren", datetime.datetime(2023, 6, 13, 15, 30)),
+    ("Eergisteren", datetime.datetime(2023, 6, 12, 15, 30)),
+    ("maandag 12 juni", datetime.datetime(2023, 6, 12)),
+    ("zaterdag 3 juni 2023", datetime.datetime(2023, 6, 3)),
+    ("12 jun", datetime.datetime(2023, 6, 12)),
+    ("vrijdag 30 december", datetime.datetime(2022, 12, 30)),
+    ("  Dinsdag 1 november 2022 ", datetime.datetime(2022, 11, 1)),
+])
+def test_known_heading_formats(heading, expected):
+    assert parse_heading_date(heading, now=NOW) == expected
+
+
+def test_unknown_format_falls_back_to_dateparser():
+    assert parse_heading_date("2023-06-01", now=NOW) == datetime.datetime(2023, 6, 1)
+
+
+def test_unparseable_heading_raises():
+    with pytest.raises(ValueError):
+        parse_heading_date("binnenkort", now=NOW)
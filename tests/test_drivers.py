@@ -0,0 +1,134 @@
+import os
+import threading
+
+import pytest
+
+from drivers import DriverPool, DriverUnavailable, get_chrome_driver
+from scraper import FilmVandaagScraper
+from test_scraper_concurrent import FakeResponse, FIXTURES_DIR
+
+
+class FakeDriver:
+    def __init__(self, page_source=""):
+        self.page_source = page_source
+        self.alive = True
+        self.quit_called = False
+        self.loaded = []
+
+    @property
+    def current_url(self):
+        if not self.alive:
+            raise ConnectionError("session gone")
+        return self.loaded[-1] if self.loaded else "about:blank"
+
+    def get(self, url):
+        self.loaded.append(url)
+
+    def quit(self):
+        self.quit_called = True
+
+
+def test_lease_reuses_and_recycles_after_max_pages():
+    created = []
+    pool = DriverPool(lambda: created.append(FakeDriver()) or created[-1], size=1, max_pages=2)
+    with pool.lease() as a:
+        pass
+    with pool.lease() as b:
+        pass
+    assert a is b and a.quit_called
+    with pool.lease() as c:
+        assert c is not a
+    assert pool.stats["created"] == 2 and pool.stats["recycled"] == 1
+
+
+def test_dead_driver_replaced():
+    created = []
+    pool = DriverPool(lambda: created.append(FakeDriver()) or created[-1], size=1)
+    with pool.lease() as a:
+        pass
+    a.alive = False
+    with pool.lease() as b:
+        assert b is not a
+    assert a.quit_called
+    with pytest.raises(ValueError):
+        with pool.lease() as c:
+            c.alive = False
+            raise ValueError("page broke the driver")
+    assert c.quit_called
+    assert pool.stats["dead"] == 2
+
+
+def test_lease_waits_for_a_free_driver_then_times_out():
+    pool = DriverPool(FakeDriver, size=1)
+    leased = threading.Event()
+    release = threading.Event()
+
+    def hold():
+        with pool.lease():
+            leased.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=hold)
+    thread.start()
+    leased.wait(5)
+    with pytest.raises(DriverUnavailable):
+        with pool.lease(timeout=0.05):
+            pass
+    threading.Timer(0.05, release.set).start()
+    with pool.lease(timeout=5):
+        pass
+    thread.join()
+    pool.close()
+    with pytest.raises(DriverUnavailable):
+        with pool.lease():
+            pass
+
+
+def test_failed_create_frees_the_slot():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise DriverUnavailable("no selenium")
+        return FakeDriver()
+
+    pool = DriverPool(factory, size=1)
+    with pytest.raises(DriverUnavailable):
+        with pool.lease():
+            pass
+    with pool.lease(timeout=0.1):
+        pass
+
+
+def test_no_connection_raises():
+    with pytest.raises(DriverUnavailable):
+        get_chrome_driver("127.0.0.1:1", retries=2, delay=0.01)
+
+
+def test_render_fallback_for_pages_without_movies(monkeypatch):
+    with open(os.path.join(FIXTURES_DIR, "new_movies_netflix.html"), encoding="utf-8") as f:
+        rendered = f.read()
+    response = FakeResponse("<html><body><div id='app'></div></body></html>")
+    response.url = "https://www.filmvandaag.nl/video-on-demand/netflix/nieuwe-films"
+    scraper = FilmVandaagScraper({})
+    monkeypatch.setattr(scraper.http.session, "get", lambda url, *args, **kwargs: response)
+    driver = FakeDriver(page_source=rendered)
+    scraper.drivers = DriverPool(lambda: driver)
+    movies = list(scraper.scrape_new_movies(["netflix"], added_days_ago=100000, votes_threshold=0))
+    assert len(movies) == 5
+    assert driver.loaded == [response.url]
+
+
+@pytest.mark.skipif(not os.getenv("SELENIUM_CONNSTR"), reason="needs the selenium-chrome service of "
+                                                                "docker-compose.yaml, set SELENIUM_CONNSTR")
+def test_render_with_selenium():
+    pool = DriverPool(lambda: get_chrome_driver(os.environ["SELENIUM_CONNSTR"]), size=1, max_pages=2)
+    try:
+        for _ in range(3):
+            with pool.lease() as driver:
+                driver.get("data:text/html,<ul class='item-list'><script>document.write('<li>x</li>')</script></ul>")
+                assert "<li>x</li>" in driver.page_source
+    finally:
+        pool.close()
+    assert pool.stats["recycled"] == 1
@@ -0,0 +1,116 @@
+import http.server
+import threading
+
+import pytest
+import requests
+
+from httpclient import HttpClient
+from resilience import CircuitOpen
+
+
+class ConditionalHandler(http.server.BaseHTTPRequestHandler):
+    body = b"<html><body>listing</body></html>"
+    etag = '"v1"'
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.headers)
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    ConditionalHandler.requests_seen = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ConditionalHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_not_modified_skips_parsing(server):
+    client = HttpClient()
+    parsed = []
+
+    def parse(resp):
+        parsed.append(resp.text)
+        return resp.text.upper()
+
+    first = client.get(f"{server}/listing", params={"page": 0}, parse=parse)
+    second = client.get(f"{server}/listing", params={"page": 0}, parse=parse)
+    assert first == second == "<HTML><BODY>LISTING</BODY></HTML>"
+    assert len(parsed) == 1
+    assert "If-None-Match" not in ConditionalHandler.requests_seen[0]
+    assert ConditionalHandler.requests_seen[1]["If-None-Match"] == '"v1"'
+    assert "gzip" in ConditionalHandler.requests_seen[0]["Accept-Encoding"]
+
+
+def test_validators_are_bounded(server):
+    client = HttpClient(max_validators=2)
+    for page in range(3):
+        client.get(f"{server}/listing", params={"page": page}, parse=lambda resp: resp.text)
+    assert len(client._validators) == 2
+    client.get(f"{server}/listing", params={"page": 0}, parse=lambda resp: resp.text)
+    assert "If-None-Match" not in ConditionalHandler.requests_seen[-1]
+
+
+class FlakyHandler(http.server.BaseHTTPRequestHandler):
+    statuses = []  # the status of every next response, 200 when empty
+    requests_seen = 0
+
+    def do_GET(self):
+        FlakyHandler.requests_seen += 1
+        self.send_response(self.statuses.pop(0) if self.statuses else 200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def flaky_server():
+    FlakyHandler.statuses, FlakyHandler.requests_seen = [], 0
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_transient_errors_are_retried_with_backoff(flaky_server):
+    delays = []
+    client = HttpClient(retries=2, sleep=delays.append)
+    FlakyHandler.statuses = [503, 502]
+    assert client.get(f"{flaky_server}/api", parse=lambda resp: resp.text) == "ok"
+    assert FlakyHandler.requests_seen == 3 and len(delays) == 2
+    FlakyHandler.statuses = [404]
+    with pytest.raises(requests.HTTPError):
+        client.get(f"{flaky_server}/api")
+    assert FlakyHandler.requests_seen == 4  # not retried
+
+
+def test_open_breaker_fails_fast(flaky_server):
+    client = HttpClient(retries=1, failure_threshold=2, sleep=lambda delay: None)
+    transitions = []
+    client.add_breaker_listener(lambda breaker, old, new: transitions.append((breaker.name, new)))
+    FlakyHandler.statuses = [500] * 2
+    with pytest.raises(requests.HTTPError):
+        client.get(f"{flaky_server}/api")
+    with pytest.raises(CircuitOpen):
+        client.get(f"{flaky_server}/api", params={"page": 1})
+    assert FlakyHandler.requests_seen == 2
+    assert client.get(f"{flaky_server}/other").status_code == 200  # other endpoints are not affected
+    assert transitions == [(f"{flaky_server[len('http://'):]}/api", "open")]
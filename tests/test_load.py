@@ -0,0 +1,63 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import requests
+
+import bot
+from scraper import FilmVandaagScraper
+from standin import StandIn
+from telegram_standin import TelegramStandIn, command_update, callback_update
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_bot_answers_webhook_updates_through_telegram_standin():
+    fv_standin, api, port = StandIn().start(), TelegramStandIn().start(), free_port()
+    config = {"TG_FV_BOT_TOKEN": "123456:test", "TG_API_URL": api.base_url, "FILMVANDAAG_HOST": fv_standin.url,
+              "BOT_MODE": "webhook", "WEBHOOK_URL": f"http://127.0.0.1:{port}", "WEBHOOK_PATH": "updates",
+              "WEBHOOK_LISTEN": "127.0.0.1", "WEBHOOK_PORT": port, "IMDB_VOTES_THRESHOLD": 0,
+              "NEW_MOVIES_THRESHOLD_DAYS": 100000, "NEW_MOVIES_MIN_RATING": 0}
+    fv_bot = bot.FilmVandaagBot(config, FilmVandaagScraper(config))
+    webhook = f"http://127.0.0.1:{port}/updates"
+    try:
+        fv_bot.start()
+        requests.post(webhook, json=command_update(7, "/nieuw"), timeout=5).raise_for_status()
+        question = api.calls(7).get(timeout=5)
+        assert question.method == "sendMessage" and "Welke streamingdienst?" in question.text
+        assert [b["callback_data"] for b in question.buttons][:2] == ["any", "netflix"]
+        requests.post(webhook, json=callback_update(7, question.message_id, "netflix"), timeout=5)
+        calls = [api.calls(7).get(timeout=5)]
+        while calls[-1].method != "sendMessage":
+            calls.append(api.calls(7).get(timeout=5))
+        assert calls[0].method == "editMessageText" and calls[0].message_id == question.message_id
+        assert "answerCallbackQuery" in [call.method for call in calls]
+        page = calls[-1]
+        assert page.text.startswith("[") and page.message_id != question.message_id
+    finally:
+        fv_bot.updater.stop()
+        fv_bot.outbox.close(timeout=1)
+        api.stop()
+        fv_standin.stop()
+    assert api.requests["setWebhook"] == 1
+
+
+def test_load_harness_writes_results(tmp_path):
+    output = tmp_path / "load.json"
+    proc = subprocess.run([sys.executable, "benchmarks/load_bot.py", "--users", "2", "--conversations", "1",
+                           "--pages", "1", "--think", "0", "--ramp", "0", "--conv-timeout", "1", "--latency", "0",
+                           "--output", str(output)], cwd=ROOT_DIR, capture_output=True, text=True, timeout=120)
+    assert proc.returncode == 0, proc.stderr
+    results = json.loads(output.read_text())
+    outcomes = results["outcomes"]
+    assert outcomes["completed"] + outcomes["abandoned"] == 2
+    assert results["latency"]["all"]["count"] >= 4 and results["peak_rss_mb"] > 0
+    assert results["api_calls"]["sendMessage"] >= 2
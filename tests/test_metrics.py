@@ -0,0 +1,63 @@
+import math
+import urllib.request
+
+import pytest
+
+import config
+import metrics
+from scraper import FilmVandaagScraper, STAGE_SECONDS
+from standin import StandIn
+
+
+def test_histogram_quantiles():
+    hist = metrics.Histogram("test_seconds", "Test.", buckets=(1, 2, 3, 4))
+    assert math.isnan(hist.quantile(0.5))
+    for value in [0.5] * 50 + [1.5] * 49 + [3.5]:
+        hist.observe(value)
+    assert hist.count() == 100
+    assert hist.quantile(0.5) == pytest.approx(1.0)
+    assert 1 < hist.quantile(0.99) <= 2
+    hist.observe(100)
+    assert hist.quantile(1.0) == 4
+
+
+def test_render_prometheus_text():
+    registry = metrics.Registry()
+    registry.counter("test_total", "Things.").inc(2, kind="a")
+    registry.gauge("test_active", "Active things.").set_function(lambda: 3)
+    registry.histogram("test_seconds", "Time.", buckets=(0.1, 1)).observe(0.5, stage="x")
+    text = registry.render()
+    assert 'test_total{kind="a"} 2' in text
+    assert "test_active 3" in text
+    assert 'test_seconds_bucket{stage="x",le="0.1"} 0' in text
+    assert 'test_seconds_bucket{stage="x",le="+Inf"} 1' in text
+    assert 'test_seconds_count{stage="x"} 1' in text
+    assert 'test_seconds_quantile{stage="x",quantile="0.5"}' in text
+    with pytest.raises(ValueError):
+        registry.gauge("test_total", "Not a gauge.")
+
+
+def test_metrics_server():
+    registry = metrics.Registry()
+    registry.counter("test_total", "Things.").inc()
+    server = metrics.MetricsServer(0, registry=registry)
+    server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as resp:
+            assert "test_total 1" in resp.read().decode()
+    finally:
+        server.stop()
+
+
+def test_scrape_stages_observed_and_profiled(tmp_path):
+    standin = StandIn().start()
+    try:
+        before = {stage: STAGE_SECONDS.count(stage=stage) for stage in ("html_parse", "date_parse", "record_build")}
+        scraper = FilmVandaagScraper({"FILMVANDAAG_HOST": standin.url, "PROFILE_SCRAPE": str(tmp_path / "scrape.prof")})
+        list(scraper.scrape_new_movies(config.streaming_services, added_days_ago=100000, votes_threshold=0))
+    finally:
+        standin.stop()
+    for stage, count in before.items():
+        assert STAGE_SECONDS.count(stage=stage) == count + len(config.streaming_services)
+    assert (tmp_path / "scrape.prof").exists()
+    assert scraper.profile_path is None
@@ -0,0 +1,44 @@
+import datetime
+import pickle
+
+import pytest
+
+from models import Movie
+
+
+def make_movie(**kwargs):
+    fields = dict(title="Edge of Orbit", release_year="2018", rating=7.9, num_votes=312998,
+                  genres=["Sciencefiction", "Actie"], director="James Holt", path="/film/288001-edge-of-orbit",
+                  service="netflix", date=datetime.datetime(2023, 6, 13))
+    fields.update(kwargs)
+    return Movie.create(**fields)
+
+
+def test_dict_style_access():
+    movie = make_movie()
+    assert movie["title"] == "Edge of Orbit"
+    assert movie["release_year"] == 2018
+    assert movie["url"] == "https://www.filmvandaag.nl/film/288001-edge-of-orbit"
+    assert movie.get("path") is None
+    with pytest.raises(KeyError):
+        movie["path"]
+    assert dict(movie)["genres"] == ("Sciencefiction", "Actie")
+
+
+def test_strings_are_interned():
+    a, b = make_movie(), make_movie(title="Other")
+    assert a.genres[0] is b.genres[0]
+    assert a.director is b.director
+    assert a.service is b.service
+
+
+def test_search_movie_as_legacy_dict():
+    movie = make_movie(service=None, date=None, release_year=None)
+    assert movie.as_dict() == {"rating": 7.9, "num_votes": 312998, "release_year": "None", "title": "Edge of Orbit",
+                               "genres": ["Sciencefiction", "Actie"], "director": "James Holt",
+                               "url": "https://www.filmvandaag.nl/film/288001-edge-of-orbit"}
+
+
+def test_pickle_roundtrip():
+    movie = make_movie()
+    assert pickle.loads(pickle.dumps(movie)) == movie
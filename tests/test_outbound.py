@@ -0,0 +1,125 @@
+import time
+
+import telegram
+from telegram.error import RetryAfter, TimedOut
+
+from outbound import MessageScheduler, TokenBucket
+from telegram_alert import TelegramAlertBot
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time() == 0.5
+    clock.now = 0.25
+    assert bucket.wait_time() == 0.25
+    clock.now = 10
+    assert bucket.wait_time() == 0
+    bucket.take()
+    bucket.take()
+    assert bucket.wait_time() > 0
+
+
+def scheduler(**kwargs):
+    outbox = MessageScheduler(**kwargs)
+    outbox.start()
+    return outbox
+
+
+def test_submit_does_not_wait_for_the_call():
+    outbox = scheduler()
+    start = time.monotonic()
+    outbox.submit(1, time.sleep, 0.3)
+    assert time.monotonic() - start < 0.1
+    assert outbox.flush(2)
+    outbox.close()
+
+
+def test_chat_rate_limit_keeps_order():
+    outbox = scheduler(chat_rate=20, chat_burst=1)
+    sent = []
+    for n in range(5):
+        outbox.submit("a", lambda n=n: sent.append((n, time.monotonic())))
+    outbox.submit("b", lambda: sent.append(("b", time.monotonic())))
+    assert outbox.flush(2)
+    outbox.close()
+    a_sent = [t for n, t in sent if n != "b"]
+    assert [n for n, _ in sent if n != "b"] == [0, 1, 2, 3, 4]
+    assert a_sent[-1] - a_sent[0] >= 4 / 20 * 0.9
+    # chat b does not wait for chat a
+    assert [n for n, _ in sent].index("b") < 4
+
+
+def test_retry_after_holds_back_chat():
+    outbox = scheduler()
+    calls = []
+
+    def send(text):
+        calls.append((text, time.monotonic()))
+        if len(calls) == 1:
+            raise RetryAfter(0.2)
+
+    start = time.monotonic()
+    outbox.submit(1, send, "first")
+    outbox.submit(1, send, "second")
+    assert outbox.flush(2)
+    outbox.close()
+    assert [text for text, _ in calls] == ["first", "first", "second"]
+    assert calls[1][1] - start >= 0.2
+    assert outbox.stats["retry_after"] == 1
+
+
+def test_network_errors_retried():
+    outbox = scheduler(max_retries=1)
+    calls = []
+
+    def send():
+        calls.append(1)
+        raise TimedOut()
+
+    outbox.submit(1, send)
+    assert outbox.flush(3)
+    outbox.close()
+    assert len(calls) == 2
+    assert outbox.stats["failed"] == 1
+
+
+def test_identical_alerts_coalesced(monkeypatch):
+    sent = []
+    monkeypatch.setattr(telegram.Bot, "sendMessage", lambda self, chat_id, text: sent.append(text))
+    alert_bot = TelegramAlertBot({"TG_ALERT_CHANNEL": "@alerts", "TG_ALERT_INSTANCE_NAME": "test",
+                                  "TG_ALERT_BOT_TOKEN": "123:abc"}, "FilmVandaag")
+    for _ in range(3):
+        alert_bot.error("Scraping failed")
+    alert_bot.warning("Something else")
+    alert_bot.close()
+    assert sent == ["FilmVandaag (test) | ❗ Scraping failed", "FilmVandaag (test) | ⚠ Something else"]
+    assert alert_bot.outbox.stats["coalesced"] == 2
+
+
+def test_dropped_call_does_not_coalesce_later_ones():
+    outbox = MessageScheduler(max_queue=1)  # not started, the queue stays full
+    assert outbox.submit(1, print)
+    assert not outbox.submit(2, print, coalesce_key="site down")
+    assert outbox.stats["dropped"] == 1
+    outbox.max_queue = 2
+    assert outbox.submit(2, print, coalesce_key="site down")
+
+
+def test_call_gets_its_own_chat_id():
+    outbox = scheduler()
+    sent = []
+    assert outbox.submit(5, lambda chat_id, text: sent.append((chat_id, text)), chat_id=5, text="hoi")
+    assert outbox.flush(2)
+    outbox.close()
+    assert sent == [(5, "hoi")]
@@ -0,0 +1,110 @@
+import json
+import os
+import re
+
+import pytest
+from bs4 import BeautifulSoup
+
+from parsing import ListingParser, PARSER_BACKENDS, parse_movie_item
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+PARSERS = [ListingParser(backend, strained) for backend in PARSER_BACKENDS for strained in (True, False)]
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def reference_new_movies(html, service):
+    """The original full-tree html.parser extraction of scrape_new_movies."""
+    soup = BeautifulSoup(html, "html.parser")
+    title_els = soup.find_all("h3", class_="is-list-heading")
+    list_els = soup.find_all("ul", class_="item-list")
+    movies = []
+    for i in range(len(title_els)):
+        dt = title_els[i].string
+        rating_els = list_els[i].select("div.rating span")
+        movie_title_els = list_els[i].select("div.item-content h4 a")
+        content_els = list_els[i].select("div.item-content")
+        for j in range(len(rating_els)):
+            gdinfo = content_els[j].find("div").text.split("•")
+            director = None if len(gdinfo) < 2 else gdinfo[1].strip()
+            genres = [g.strip() for g in gdinfo[0].split("/")]
+            title_el = movie_title_els[j]
+            m = re.match(r"^(?P<title>.+?)( \((?P<year>[0-9]{4})\))?$", str(title_el.text))
+            movies.append({"rating": float(rating_els[j].text.strip()),
+                           "num_votes": int(rating_els[j]["title"].split()[0].replace(".", "")),
+                           "date": dt,
+                           "release_year": str(m.group("year")),
+                           "title": str(m.group("title")),
+                           "genres": genres,
+                           "director": director,
+                           "service": service,
+                           "url": f"https://www.filmvandaag.nl{title_el['href']}"})
+    return movies
+
+
+def reference_search_results(html):
+    """The original html.parser extraction of search_movies."""
+    movies = []
+    for li in BeautifulSoup(html, "html.parser").find_all("li", class_="is-movie"):
+        gdinfo = li.find("div", class_="item-content").find("div").text.split("•")
+        director = None if len(gdinfo) < 2 else gdinfo[1].strip()
+        genres = [g.strip() for g in gdinfo[0].split("/")]
+        rating_el = li.find("div", class_="rating").span
+        title_el = li.find("a", class_="title")
+        m = re.match(r"^(?P<title>.+?)( \((?P<year>[0-9]{4})\))?$", title_el.text)
+        movies.append({"rating": float(rating_el.text.strip()),
+                       "num_votes": int(rating_el["title"].split()[0].replace(".", "")),
+                       "release_year": str(m.group("year")),
+                       "title": m.group("title"),
+                       "genres": genres,
+                       "director": director,
+                       "url": f"https://www.filmvandaag.nl{title_el['href']}"})
+    return movies
+
+
+def parse_new_movies(parser, html, service):
+    """The movies of a new-movies page as the scraper builds them, dated with their heading."""
+    movies = (parse_movie_item(li, service=service, date=heading) for heading, li in parser.new_movie_items(html))
+    return [movie for movie in movies if movie is not None]
+
+
+@pytest.mark.parametrize("parser", PARSERS, ids=repr)
+@pytest.mark.parametrize("service", ["netflix", "disney"])
+def test_new_movies_match_reference(parser, service):
+    html = read_fixture(f"new_movies_{service}.html")
+    movies = parse_new_movies(parser, html, service)
+    assert [m.as_dict() for m in movies] == reference_new_movies(html, service)
+    assert len(movies) > 0
+
+
+@pytest.mark.parametrize("parser", PARSERS, ids=repr)
+@pytest.mark.parametrize("page", [0, 1])
+def test_search_results_match_reference(parser, page):
+    html = json.loads(read_fixture(f"search_page_{page}.json"))["results"]
+    movies = parser.parse_search_results(html)
+    assert [m.as_dict() for m in movies] == reference_search_results(html)
+    assert len(movies) > 0
+
+
+def test_movie_without_director():
+    html = read_fixture("new_movies_netflix.html")
+    movies = parse_new_movies(ListingParser(), html, "netflix")
+    kleine_helden = next(m for m in movies if m["title"] == "Kleine Helden")
+    assert kleine_helden.as_dict() == {"rating": 6.2, "num_votes": 2104, "date": "Vandaag",
+                                       "release_year": "2019",
+                                       "title": "Kleine Helden", "genres": ["Familie", "Komedie"],
+                                       "director": None, "service": "netflix",
+                                       "url": "https://www.filmvandaag.nl/film/299871-kleine-helden"}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 13, 512, 1 << 20])
+def test_streamed_items_match_page_items(chunk_size):
+    html = read_fixture("new_movies_amazon.html")
+    parser = ListingParser()
+    chunks = [html[i:i + chunk_size] for i in range(0, len(html), chunk_size)]
+    streamed = [(heading, li.decode()) for heading, li in parser.iter_new_movie_items(chunks)]
+    assert streamed == [(heading, li.decode()) for heading, li in parser.new_movie_items(html)]
+    assert len(streamed) == 168
@@ -0,0 +1,51 @@
+import random
+
+import config
+from models import Movie
+from ranking import top_movies
+from scraper import FilmVandaagScraper
+from standin import StandIn
+
+
+def make_movie(path, rating, num_votes=1000, service="netflix"):
+    return Movie.create(title=path, release_year="2020", rating=rating, num_votes=num_votes, genres=[],
+                        director=None, path=path, service=service)
+
+
+def test_top_movies_by_rating_then_votes():
+    movies = [make_movie("a", 7.0, 10), make_movie("b", 8.0), make_movie("c", 7.0, 20), make_movie("d", 6.0)]
+    assert [m.path for m in top_movies(movies, 3)] == ["b", "c", "a"]
+    assert [m.path for m in top_movies(movies, 10)] == ["b", "c", "a", "d"]
+    assert top_movies(movies, 0) == []
+
+
+def test_top_movies_matches_full_sort():
+    rnd = random.Random(4)
+    movies = [make_movie(f"/film/{n}", rnd.randint(10, 90) / 10, rnd.randint(0, 5)) for n in range(2000)]
+    expected = sorted(movies, key=lambda m: (m.rating, m.num_votes), reverse=True)
+    for k in (1, 20, 2000):
+        assert top_movies(movies, k) == expected[:k]
+
+
+def test_duplicates_merged_into_one_movie():
+    movies = [make_movie("a", 7.0), make_movie("b", 6.0), make_movie("a", 7.0, service="disney"),
+              make_movie("c", 5.0, service="pathe"), make_movie("c", 5.0, service="amazon")]
+    ranked = top_movies(movies, 2)
+    assert [(m.path, m.services) for m in ranked] == [("a", ("netflix", "disney")), ("b", ("netflix",))]
+    assert ranked[0].service == "netflix"
+    # a dropped movie stays dropped when it turns up on another service
+    assert [m.path for m in top_movies(movies[:4] + [make_movie("b", 6.0, service="amazon")], 1)] == ["a"]
+
+
+def test_rank_new_movies_of_all_services():
+    standin = StandIn().start()
+    try:
+        scraper = FilmVandaagScraper({"FILMVANDAAG_HOST": standin.url})
+        ranked = scraper.rank_new_movies(config.streaming_services, added_days_ago=100000, k=1000,
+                                         votes_threshold=0)
+    finally:
+        standin.stop()
+    assert len(ranked) == 234
+    assert len({m.path for m in ranked}) == 234
+    assert [m for m in ranked if len(m.services) > 1][0].path == "/film/301234-the-long-night"
+    assert all((a.rating, a.num_votes) >= (b.rating, b.num_votes) for a, b in zip(ranked, ranked[1:]))
@@ -0,0 +1,88 @@
+import pytest
+import requests
+
+import resilience
+from resilience import CircuitBreaker, jittered_backoff, CLOSED, HALF_OPEN, OPEN
+from scraper import FilmVandaagScraper, NEW_MOVIES_URLS
+from test_scraper_concurrent import FakeResponse
+from test_scraper_incremental import netflix_page
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker("site/api", failure_threshold=3, reset_timeout=30, clock=clock)
+    transitions = []
+    breaker.add_listener(lambda b, old, new: transitions.append((old, new)))
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.retry_in() == 30
+    clock.now = 30
+    assert breaker.allow()  # the trial call
+    assert breaker.state == HALF_OPEN and not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN and not breaker.allow()
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+    assert transitions == [(CLOSED, OPEN), (OPEN, HALF_OPEN), (HALF_OPEN, OPEN), (OPEN, HALF_OPEN),
+                           (HALF_OPEN, CLOSED)]
+    assert resilience.BREAKER_STATE.value(endpoint="site/api") == 0
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("site/api", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_failing_listener_does_not_break_the_breaker():
+    breaker = CircuitBreaker("site/api", failure_threshold=1)
+    breaker.add_listener(lambda b, old, new: 1 / 0)
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+@pytest.mark.parametrize("attempt", range(6))
+def test_backoff_is_jittered_and_capped(attempt):
+    assert jittered_backoff(attempt, base=0.5, cap=4, rng=lambda low, high: high) == min(4, 0.5 * 2 ** attempt)
+    assert 0 <= jittered_backoff(attempt, base=0.5, cap=4) <= 4
+
+
+def test_scraper_serves_stale_listing_when_site_is_down(monkeypatch):
+    scraper = FilmVandaagScraper({"NEW_MOVIES_CACHE_TTL": 0, "HTTP_RETRIES": 0})
+    down = {"now": False}
+
+    def get(url, *args, **kwargs):
+        if down["now"]:
+            raise requests.ConnectionError("site is down")
+        return FakeResponse(netflix_page())
+
+    monkeypatch.setattr(scraper.http.session, "get", get)
+    fresh = scraper.new_movies_cursor(["netflix"], added_days_ago=100000, votes_threshold=0)
+    movies = fresh.next_batch(scraper, 20)
+    assert movies and not fresh.stale
+    down["now"] = True
+    stale = scraper.new_movies_cursor(["netflix"], added_days_ago=100000, votes_threshold=0)
+    assert stale.next_batch(scraper, 20) == movies and stale.stale
+    scraper._prefetch_pool.shutdown(wait=True)  # the background reload
+    assert not scraper._revalidating
+    assert scraper.http.breaker(NEW_MOVIES_URLS["netflix"]).failures == 2  # the request and the reload
+    down["now"] = False
+    assert scraper.new_movies_cursor(["netflix"], added_days_ago=100000, votes_threshold=0).next_batch(scraper, 20)
+    assert not scraper.new_movies_stale(["netflix"])
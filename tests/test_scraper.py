@@ -2,8 +2,8 @@ import os
 import pprint
 import logging
 
-from src.scraper import FilmVandaagScraper
-import src.config
+from scraper import FilmVandaagScraper
+import config as fv_config
 
 logging.basicConfig(level=logging.INFO)
 
@@ -11,6 +11,6 @@ config = {
     "SELENIUM_CONNSTR": os.getenv("SELENIUM_CONNSTR")
 }
 scraper = FilmVandaagScraper(config)
-for m in scraper.scrape_new_movies(src.config.streaming_services, added_days_ago=3):
+for m in scraper.scrape_new_movies(fv_config.streaming_services, added_days_ago=3):
     print(m)
 
@@ -0,0 +1,89 @@
+import os
+import time
+import threading
+
+from scraper import FilmVandaagScraper, NEW_MOVIES_URLS
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+FIXTURE_PAGES = {NEW_MOVIES_URLS["netflix"]: "new_movies_netflix.html",
+                 NEW_MOVIES_URLS["disney"]: "new_movies_disney.html"}
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, text):
+        self.text = text
+
+    def raise_for_status(self):
+        pass
+
+
+def fake_get(delay=0.0, active=None):
+    lock = threading.Lock()
+
+    def get(url, *args, **kwargs):
+        if active is not None:
+            with lock:
+                active["now"] += 1
+                active["max"] = max(active["max"], active["now"])
+        time.sleep(delay)
+        if active is not None:
+            with lock:
+                active["now"] -= 1
+        with open(os.path.join(FIXTURES_DIR, FIXTURE_PAGES[url]), encoding="utf-8") as f:
+            return FakeResponse(f.read())
+    return get
+
+
+def test_scrape_new_movies_merges_services_by_date(monkeypatch):
+    scraper = FilmVandaagScraper({})
+    monkeypatch.setattr(scraper.http.session, "get", fake_get())
+    movies = list(scraper.scrape_new_movies(["netflix", "disney"], added_days_ago=100000, votes_threshold=0))
+    assert len(movies) == 7
+    assert [m["date"] for m in movies] == sorted((m["date"] for m in movies), reverse=True)
+    assert {m["service"] for m in movies} == {"netflix", "disney"}
+
+
+def test_scrape_new_movies_applies_thresholds(monkeypatch):
+    scraper = FilmVandaagScraper({})
+    monkeypatch.setattr(scraper.http.session, "get", fake_get())
+    movies = list(scraper.scrape_new_movies(["netflix", "disney"], added_days_ago=3,
+                                            votes_threshold=10000, rating_threshold=7))
+    assert [m["title"] for m in movies][-1] == "Edge of Orbit"
+    assert {m["title"] for m in movies} == {"The Long Night", "Star Harbor", "Edge of Orbit"}
+
+
+def test_scrape_new_movies_fetches_concurrently(monkeypatch):
+    active = {"now": 0, "max": 0}
+    scraper = FilmVandaagScraper({"SCRAPE_WORKERS": 2})
+    monkeypatch.setattr(scraper.http.session, "get", fake_get(delay=0.2, active=active))
+    list(scraper.scrape_new_movies(["netflix", "disney"], added_days_ago=100000, votes_threshold=0))
+    assert active["max"] == 2
+
+    active = {"now": 0, "max": 0}
+    scraper = FilmVandaagScraper({"SCRAPE_WORKERS": 1})
+    monkeypatch.setattr(scraper.http.session, "get", fake_get(delay=0.05, active=active))
+    list(scraper.scrape_new_movies(["netflix", "disney"], added_days_ago=100000, votes_threshold=0))
+    assert active["max"] == 1
+
+
+def test_scrape_new_movies_reuses_cached_listing(monkeypatch):
+    active = {"now": 0, "max": 0, "calls": 0}
+    scraper = FilmVandaagScraper({})
+    get = fake_get()
+
+    def counting_get(url, *args, **kwargs):
+        active["calls"] += 1
+        return get(url, *args, **kwargs)
+
+    monkeypatch.setattr(scraper.http.session, "get", counting_get)
+    first = list(scraper.scrape_new_movies(["netflix", "disney"], added_days_ago=100000, votes_threshold=0))
+    second = list(scraper.scrape_new_movies(["netflix"], added_days_ago=3, votes_threshold=10000))
+    assert active["calls"] == 2
+    assert len(first) == 7
+    assert [m["title"] for m in second] == ["The Long Night", "Edge of Orbit"]
+
+    scraper.refresh_new_movies()
+    assert active["calls"] == 4
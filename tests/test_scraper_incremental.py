@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from scraper import FilmVandaagScraper, NEW_MOVIES_URLS, NEW_MOVIES_SKIPPED
+from test_scraper_concurrent import FakeResponse, FIXTURES_DIR
+
+NEW_ITEM = """<li class="is-movie">
+<div class="item-content">
+<h4><a class="title" href="/film/309999-fresh-arrival">Fresh Arrival (2023)</a></h4>
+<div>Drama • Noor de Wit</div>
+</div>
+<div class="rating"><span title="15.000 stemmen">7.7</span></div>
+</li>
+"""
+
+
+def netflix_page(with_new_item=False):
+    with open(os.path.join(FIXTURES_DIR, "new_movies_netflix.html"), encoding="utf-8") as f:
+        html = f.read()
+    if with_new_item:
+        html = html.replace('<ul class="item-list">\n', '<ul class="item-list">\n' + NEW_ITEM, 1)
+    return html
+
+
+def test_recrawl_only_processes_new_items(monkeypatch):
+    scraper = FilmVandaagScraper({"NEW_MOVIES_CACHE_TTL": 0})
+    pages = [netflix_page(), netflix_page(with_new_item=True)]
+    monkeypatch.setattr(scraper.http.session, "get", lambda url, *args, **kwargs: FakeResponse(pages.pop(0)))
+
+    skipped = NEW_MOVIES_SKIPPED.value(service="netflix")
+    first = list(scraper.scrape_new_movies(["netflix"], added_days_ago=100000, votes_threshold=0))
+    assert scraper.new_movies_crawl_stats["netflix"] == {"crawls": 1, "new": 5, "skipped": 0, "aborted": 0}
+
+    second = list(scraper.scrape_new_movies(["netflix"], added_days_ago=100000, votes_threshold=0))
+    assert [m.title for m in second] == ["Fresh Arrival"] + [m.title for m in first]
+    assert scraper.new_movies_crawl_stats["netflix"] == {"crawls": 2, "new": 6, "skipped": 4, "aborted": 0}
+    assert NEW_MOVIES_SKIPPED.value(service="netflix") - skipped == 4
+
+
+def test_listeners_get_movies_new_since_previous_crawl(monkeypatch):
+    scraper = FilmVandaagScraper({"NEW_MOVIES_CACHE_TTL": 0})
+    pages = [netflix_page(), netflix_page(), netflix_page(with_new_item=True)]
+    monkeypatch.setattr(scraper.http.session, "get", lambda url, *args, **kwargs: FakeResponse(pages.pop(0)))
+    notified = []
+    scraper.add_new_movies_listener(lambda service, movies: notified.append((service, [m.title for m in movies])))
+
+    for _ in range(3):
+        list(scraper.scrape_new_movies(["netflix"], added_days_ago=100000, votes_threshold=0))
+    assert notified == [("netflix", ["Fresh Arrival"])]
+
+
+def amazon_page(without_oldest=False):
+    with open(os.path.join(FIXTURES_DIR, "new_movies_amazon.html"), encoding="utf-8") as f:
+        html = f.read()
+    if without_oldest:
+        start = html.rindex('<li class="is-movie">')
+        html = html[:start] + html[html.index("</li>", start) + len("</li>\n"):]
+    return html
+
+
+@pytest.mark.parametrize("without_oldest", [False, True])
+def test_recrawl_lists_what_a_fresh_crawl_lists(monkeypatch, without_oldest):
+    def crawl(scraper, *htmls):
+        pages = list(htmls)
+        monkeypatch.setattr(scraper.http.session, "get", lambda url, *args, **kwargs: FakeResponse(pages.pop(0)))
+        for _ in htmls:  # every crawl after the first one expired the previous
+            movies = list(scraper.scrape_new_movies(["amazon"], added_days_ago=100000, votes_threshold=0))
+        return [m.path for m in movies]
+
+    recrawled = crawl(FilmVandaagScraper({"NEW_MOVIES_CACHE_TTL": 0}),
+                      amazon_page(), amazon_page(without_oldest))
+    fresh = crawl(FilmVandaagScraper({"NEW_MOVIES_CACHE_TTL": 0}), amazon_page(without_oldest))
+    assert recrawled == fresh and len(fresh) == 168 - without_oldest
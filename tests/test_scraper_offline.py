@@ -0,0 +1,51 @@
+import pytest
+
+import config
+from scraper import FilmVandaagScraper
+from standin import StandIn
+
+
+@pytest.fixture(scope="module")
+def standin():
+    standin = StandIn().start()
+    yield standin
+    standin.stop()
+
+
+def test_scrape_new_movies_of_all_services(standin):
+    scraper = FilmVandaagScraper({"FILMVANDAAG_HOST": standin.url})
+    movies = list(scraper.scrape_new_movies(config.streaming_services, added_days_ago=100000, votes_threshold=0))
+    assert {m.service for m in movies} == set(config.streaming_services)
+    assert len(movies) == 235
+    assert all(a.date >= b.date for a, b in zip(movies, movies[1:]))
+
+
+def test_search_movies_pages_through_results(standin):
+    standin.search_pages = 6
+    try:
+        scraper = FilmVandaagScraper({"FILMVANDAAG_HOST": standin.url})
+        movies = list(scraper.search_movies(services=config.streaming_services, genres=["actie"], votes_threshold=0))
+    finally:
+        standin.search_pages = 2
+    assert len(movies) == 15
+    assert movies[0].title == "The Deep End"
+
+
+def test_streaming_stops_at_time_threshold(standin):
+    scraper = FilmVandaagScraper({"FILMVANDAAG_HOST": standin.url, "NEW_MOVIES_STREAMING": True,
+                                  "NEW_MOVIES_THRESHOLD_DAYS": 3})
+    movies = list(scraper.scrape_new_movies(["amazon"], added_days_ago=3, votes_threshold=0))
+    assert len(movies) == 24
+    assert scraper.new_movies_crawl_stats["amazon"]["aborted"] == 1
+
+    everything = list(scraper.scrape_new_movies(["amazon"], added_days_ago=100000, votes_threshold=0))
+    assert len(everything) == 168
+
+
+def test_streaming_past_the_cached_listing_reads_the_whole_page(standin):
+    scraper = FilmVandaagScraper({"FILMVANDAAG_HOST": standin.url, "NEW_MOVIES_STREAMING": True,
+                                  "NEW_MOVIES_THRESHOLD_DAYS": 3})
+    recent = list(scraper.scrape_new_movies(["amazon"], added_days_ago=1, votes_threshold=0))
+    assert recent and scraper._new_movies_cache.get_stale("amazon")  # the cached listing has a watermark
+    everything = list(scraper.scrape_new_movies(["amazon"], added_days_ago=100000, votes_threshold=0))
+    assert len(everything) == 168
@@ -2,8 +2,8 @@ import os
 import pprint
 import logging
 
-from src.scraper import FilmVandaagScraper
-import src.config
+from scraper import FilmVandaagScraper
+import config as fv_config
 
 logging.basicConfig(level=logging.DEBUG)
 config = {}
@@ -11,11 +11,11 @@ config = {}
 scraper = FilmVandaagScraper(config)
 
 try:
-    browser_url = scraper.get_search_movies_browser_url(services=src.config.streaming_services,
+    browser_url = scraper.get_search_movies_browser_url(services=fv_config.streaming_services,
                                    genres=["actie", "horror", "documentaire"],
                                    imdb_score=(8, 10),
                                    release_year=(2000, 2020))
-    generator = scraper.search_movies(services=src.config.streaming_services,
+    generator = scraper.search_movies(services=fv_config.streaming_services,
                                    genres=["actie", "horror", "documentaire"],
                                    imdb_score=(8, 10),
                                    release_year=(2000, 2020))
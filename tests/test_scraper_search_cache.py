@@ -0,0 +1,84 @@
+import json
+import os
+
+from scraper import FilmVandaagScraper, search_cache_key
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class FakeJsonResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, page):
+        with open(os.path.join(FIXTURES_DIR, f"search_page_{page}.json"), encoding="utf-8") as f:
+            self.text = f.read()
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return json.loads(self.text)
+
+
+def fake_search_session(calls):
+    def get(url, params=None, **kwargs):
+        calls.append(dict(params))
+        return FakeJsonResponse(params["page"])
+    return get
+
+
+def search(scraper, genres):
+    return list(scraper.search_movies(services=["netflix", "amazon"], genres=genres,
+                                      imdb_score=("8", None), release_year=(2000, 2020), votes_threshold=0))
+
+
+def test_repeat_search_is_served_from_cache(monkeypatch):
+    calls = []
+    scraper = FilmVandaagScraper({"SEARCH_PREFETCH_PAGES": 0})
+    monkeypatch.setattr(scraper.http.session, "get", fake_search_session(calls))
+    first = search(scraper, ["actie", "horror"])
+    assert [m["title"] for m in first] == ["The Deep End", "Silent Halls", "Oceans Apart", "Night Train",
+                                           "Paper Trail"]
+    assert [c["page"] for c in calls] == [0, 1, 2]
+
+    second = search(scraper, ["horror", "actie"])
+    assert second == first
+    assert len(calls) == 3
+    stats = scraper.cache_stats()["search"]
+    assert stats["hits"] == 3 and stats["misses"] == 3
+
+
+def test_search_cache_key_normalizes_order():
+    a = {"genre[]": ["horror", "actie"], "vod[]": ["netflix", "amazon"], "imdb-score[]": ["8", "10"], "page": 1}
+    b = {"page": 1, "vod[]": ["amazon", "netflix"], "imdb-score[]": ["8", "10"], "genre[]": ["actie", "horror"]}
+    assert search_cache_key(a) == search_cache_key(b)
+    assert search_cache_key(a) != search_cache_key(dict(a, page=2))
+
+
+def test_next_page_is_prefetched_while_reading(monkeypatch):
+    calls = []
+    scraper = FilmVandaagScraper({"SEARCH_PREFETCH_PAGES": 1, "PREFETCH_WORKERS": 1})
+    monkeypatch.setattr(scraper.http.session, "get", fake_search_session(calls))
+    generator = scraper.search_movies(services=["netflix"], genres=["actie"], votes_threshold=0)
+    next(generator)
+    scraper._prefetch_pool.submit(lambda: None).result()  # wait for the prefetch worker
+    assert [c["page"] for c in calls] == [0, 1]
+    for _ in range(3):
+        next(generator)
+    assert [c["page"] for c in calls][:2] == [0, 1]
+    assert scraper.cache_stats()["search"]["hits"] >= 1
+    generator.close()
+
+
+def test_closing_generator_cancels_pending_prefetches(monkeypatch):
+    calls = []
+    scraper = FilmVandaagScraper({"SEARCH_PREFETCH_PAGES": 2, "PREFETCH_WORKERS": 1})
+    monkeypatch.setattr(scraper.http.session, "get", fake_search_session(calls))
+    blocker = scraper._prefetch_pool.submit(lambda: __import__("time").sleep(0.2))
+    generator = scraper.search_movies(services=["netflix"], genres=["actie"], votes_threshold=0)
+    next(generator)
+    generator.close()
+    blocker.result()
+    scraper._prefetch_pool.submit(lambda: None).result()
+    assert [c["page"] for c in calls] == [0]
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def run_python(*args):
+    return subprocess.run([sys.executable, *args], cwd=SRC_DIR, capture_output=True, text=True, timeout=60)
+
+
+def test_heavy_dependencies_not_imported_at_startup():
+    proc = run_python("-c", "import sys, filmvandaag; print(' '.join(sorted(sys.modules)))")
+    modules = proc.stdout.split()
+    assert "scraper" in modules
+    for heavy in ("selenium", "bs4", "dateparser", "cProfile"):
+        assert heavy not in modules
+
+
+def test_check_startup_reports_imports():
+    proc = run_python("filmvandaag.py", "--check-startup", "--startup-budget", "60")
+    assert proc.returncode == 0, proc.stderr
+    assert "telegram" in proc.stdout
+    assert "budget 60000ms: OK" in proc.stdout
+    assert run_python("filmvandaag.py", "--check-startup", "--startup-budget", "0").returncode == 1
@@ -0,0 +1,218 @@
+import dataclasses
+import threading
+import time
+import types
+
+import pytest
+from telegram.ext import ConversationHandler, TypeHandler
+from telegram.ext.conversationhandler import _ConversationTimeoutContext
+from telegram.ext.utils.promise import Promise
+
+import bot
+from cache import TTLCache
+from cursor import SearchCursor
+from scraper import FilmVandaagScraper
+from store import MemoryStore, SQLiteStore, ConversationMapping, StorePersistence, open_store
+from subscriptions import Subscription
+from test_bot import make_movies, telegram_call
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def shared_store(request, tmp_path):
+    return MemoryStore() if request.param == "memory" else SQLiteStore(str(tmp_path / "state.db"))
+
+
+def test_store_round_trip(shared_store):
+    shared_store.set("a:1", {"x": [1, 2]})
+    shared_store.set("b:1", 2)
+    assert shared_store.get("a:1") == {"x": [1, 2]}
+    assert shared_store.get("missing", 0) == 0
+    assert shared_store.keys("a:") == ["a:1"]
+    shared_store.delete("a:1")
+    assert shared_store.get("a:1") is None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    SQLiteStore(path).set("k", "v")
+    assert SQLiteStore(path).get("k") == "v"
+    assert open_store("memory").get("k") is None
+    assert open_store(None) is None
+
+
+def test_conversation_mapping_keeps_promises_local(shared_store):
+    conversations = ConversationMapping(shared_store, "nieuw")
+    conversations[(1, 2)] = bot.STREAMINGSERVICE
+    assert ConversationMapping(shared_store, "nieuw")[(1, 2)] == bot.STREAMINGSERVICE
+    running = (bot.STREAMINGSERVICE, Promise(lambda: bot.SHOW_MOVIES, (), {}))
+    conversations[(1, 2)] = running
+    assert conversations[(1, 2)] is running
+    other = ConversationMapping(shared_store, "nieuw")
+    assert other[(1, 2)] == bot.STREAMINGSERVICE and list(other) == [(1, 2)] and len(other) == 1
+    conversations[(1, 2)] = bot.SHOW_MOVIES
+    assert other.get((1, 2)) == bot.SHOW_MOVIES
+    del conversations[(1, 2)]
+    assert (1, 2) not in other and not len(conversations)
+
+
+def test_conversation_past_its_deadline_reads_as_ended(shared_store):
+    now = [0.0]
+    conversations = ConversationMapping(shared_store, "nieuw", timeout=30, clock=lambda: now[0])
+    conversations[(1, 2)] = bot.STREAMINGSERVICE
+    now[0] = 28
+    assert conversations[(1, 2)] == bot.STREAMINGSERVICE and not conversations.end_if_expired((1, 2))
+    now[0] = 31
+    assert (1, 2) not in conversations and conversations.end_if_expired((1, 2))
+    assert not conversations.end_if_expired((1, 2))
+
+
+def test_timeout_leaves_conversations_moved_on_by_another_instance(shared_store):
+    now, timeouts, key = [0.0], [], (7, 7)
+
+    def instance(name):
+        fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:test"}, FilmVandaagScraper({}, store=shared_store),
+                                    state_store=shared_store)
+        handler = fv_bot.new_movie_conv_handler
+        handler.conversations.clock = lambda: now[0]
+        handler.states[ConversationHandler.TIMEOUT] = [TypeHandler(object, lambda u, c: timeouts.append(name))]
+        return fv_bot
+
+    def step(fv_bot, state):  # what handle_update does: store the new state and schedule the timeout job
+        handler = fv_bot.new_movie_conv_handler
+        handler.conversations[key] = state
+        timeout = _ConversationTimeoutContext(key, "update", fv_bot.updater.dispatcher, types.SimpleNamespace())
+        handler.timeout_jobs[key] = types.SimpleNamespace(context=timeout)
+        return handler.timeout_jobs[key]
+
+    first, second = instance("first"), instance("second")
+    first_job = step(first, bot.STREAMINGSERVICE)
+    now[0] = 20
+    second_job = step(second, bot.SHOW_MOVIES)
+    now[0] = 30
+    first.new_movie_conv_handler._trigger_timeout(None, first_job)
+    conversations = first.new_movie_conv_handler.conversations
+    assert timeouts == [] and conversations[key] == bot.SHOW_MOVIES
+    now[0] = 50
+    second.new_movie_conv_handler._trigger_timeout(None, second_job)
+    assert timeouts == ["second"] and key not in conversations and not second.new_movie_conv_handler.timeout_jobs
+
+
+def test_user_data_moves_between_instances(shared_store):
+    first, second = StorePersistence(shared_store), StorePersistence(shared_store)
+    cursor = SearchCursor(params={"genre[]": ["Actie"]}, votes_threshold=100, page=2)
+    cursor._prefetches[3] = object()
+    first.update_user_data(7, {"movies_cursor": cursor, "movies_text": "a"})
+    user_data = {"stale": True}
+    second.refresh_user_data(7, user_data)
+    assert user_data == {"movies_cursor": cursor, "movies_text": "a"}
+    assert user_data["movies_cursor"].page == 2 and not user_data["movies_cursor"]._prefetches
+    user_data["movies_text"] = "b"
+    second.update_user_data(7, user_data)
+    unchanged = {"movies_text": "local"}
+    second.refresh_user_data(7, unchanged)
+    assert unchanged == {"movies_text": "local"}  # this instance wrote the latest version
+    first.refresh_user_data(7, unchanged)
+    assert unchanged["movies_text"] == "b"
+
+
+def test_cache_loads_once_across_instances(shared_store):
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return ["movie"]
+
+    first = TTLCache(maxsize=4, ttl=60, store=shared_store, name="new_movies")
+    second = TTLCache(maxsize=4, ttl=60, store=shared_store, name="new_movies")
+    assert first.get_or_load("netflix", loader) == ["movie"]
+    assert second.get_or_load("netflix", loader) == ["movie"]
+    assert len(loads) == 1 and second.hits == 1
+    assert TTLCache(maxsize=4, ttl=60, store=shared_store, name="search").get("netflix") is None
+
+
+def test_expired_shared_entries_stay_out_of_the_local_cache(shared_store):
+    shared_store.set("new_movies:'netflix'", (time.time() - 1, ["old"]))
+    shared_store.set("new_movies:'disney'", (time.time() + 60, ["live"]))
+    cache = TTLCache(maxsize=1, ttl=60, store=shared_store, name="new_movies")
+    assert cache.get("disney") == ["live"]
+    assert cache.get("netflix") is None and cache.get_stale("netflix") == ["old"]
+    assert "disney" in cache and len(cache) == 1 and cache.evictions == 0
+
+
+def test_slow_store_read_does_not_block_the_cache():
+    class SlowStore(MemoryStore):
+        def get(self, key, default=None):
+            reading.set()
+            release.wait()
+            return super().get(key, default)
+
+    reading, release = threading.Event(), threading.Event()
+    cache = TTLCache(maxsize=4, ttl=60, store=SlowStore(), name="new_movies")
+    cache._entries["disney"] = (time.monotonic() + 60, ["local"])
+    reader = threading.Thread(target=cache.get, args=("netflix",))
+    reader.start()
+    reading.wait()
+    results = []
+    hit = threading.Thread(target=lambda: results.append(cache.get("disney")))
+    hit.start()
+    hit.join(timeout=5)
+    release.set()
+    reader.join()
+    assert results == [["local"]]
+
+
+def test_bot_keeps_conversations_in_store(shared_store):
+    fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:test"}, FilmVandaagScraper({}, store=shared_store),
+                                state_store=shared_store)
+    assert isinstance(fv_bot.new_movie_conv_handler.conversations, ConversationMapping)
+    assert fv_bot.follow_conv_handler.persistent and fv_bot.follow_conv_handler.name == "volg"
+
+
+def test_webhook_mode_starts_listener(monkeypatch):
+    config = {"TG_FV_BOT_TOKEN": "123456:test", "BOT_MODE": "webhook", "WEBHOOK_URL": "https://bot.example/",
+              "WEBHOOK_PATH": "tg", "WEBHOOK_PORT": 8080}
+    fv_bot = bot.FilmVandaagBot(config, FilmVandaagScraper({}))
+    started = {}
+    monkeypatch.setattr(type(fv_bot.updater), "start_webhook", lambda self, **kwargs: started.update(kwargs))
+    monkeypatch.setattr(type(fv_bot.updater), "start_polling",
+                        lambda self, **kwargs: pytest.fail("polling in webhook mode"))
+    try:
+        fv_bot.start()
+    finally:
+        fv_bot.outbox.close(timeout=1)
+        fv_bot.updater.job_queue.stop()
+    assert started == {"listen": "0.0.0.0", "port": 8080, "url_path": "tg", "webhook_url": "https://bot.example/tg"}
+
+
+def test_store_add_only_sets_missing_keys(shared_store):
+    assert shared_store.add("claim", 1)
+    assert not shared_store.add("claim", 2)
+    assert shared_store.get("claim") == 1
+
+
+def test_store_deletes_keys_set_before_a_time(shared_store):
+    shared_store.set("alerted:old", 1)
+    shared_store.set("other:old", 1)
+    cutoff = time.time() + 1
+    assert shared_store.delete_older_than("alerted:", time.time() - 60) == 0
+    assert shared_store.delete_older_than("alerted:", cutoff) == 1
+    assert shared_store.keys() == ["other:old"]
+
+
+def test_one_instance_alerts_each_new_movie(shared_store):
+    def instance():
+        fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:test"}, FilmVandaagScraper({}, store=shared_store),
+                                    state_store=shared_store, subscription_store=shared_store)
+        fv_bot.alerts = []
+        fv_bot.outbox = types.SimpleNamespace(submit=lambda chat_id, func, /, **kwargs: fv_bot.alerts.append(chat_id))
+        return fv_bot
+
+    first, second = instance(), instance()
+    second.subscriptions.add(Subscription(7))  # made on the second instance
+    movie = dataclasses.replace(make_movies(1)[0], service="netflix", services=("netflix",))
+    context = types.SimpleNamespace(bot=types.SimpleNamespace(send_message=telegram_call("send_message")))
+    for fv_bot in (first, second):  # both found the movie in the listing
+        fv_bot.queue_new_movies("netflix", [movie])
+    first.notify_subscribers(context)
+    second.notify_subscribers(context)
+    assert first.alerts == [7] and second.alerts == []
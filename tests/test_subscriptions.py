@@ -0,0 +1,81 @@
+import bot
+from models import Movie
+from scraper import FilmVandaagScraper
+from store import MemoryStore, SQLiteStore
+from subscriptions import Subscription, SubscriptionIndex
+
+
+def make_movie(path, service="netflix", genres=("Actie",), rating=7.0, num_votes=20000):
+    return Movie.create(title=path, release_year="2020", rating=rating, num_votes=num_votes, genres=genres,
+                        director=None, path=path, service=service)
+
+
+def test_match_on_service_genre_and_thresholds():
+    index = SubscriptionIndex()
+    index.add(Subscription(1, services=("netflix",), genres=("actie",), min_rating=6, min_votes=10000))
+    index.add(Subscription(2, genres=("horror",)))
+    index.add(Subscription(3, services=("disney",)))
+    movies = [make_movie("a"), make_movie("b", genres=("Horror", "Actie")), make_movie("c", rating=5.0),
+              make_movie("d", service="disney", genres=("Familie",)), make_movie("e", num_votes=10)]
+    matches = {chat_id: [m.path for m in movies] for chat_id, movies in index.match(movies).items()}
+    assert matches == {1: ["a", "b"], 2: ["b"], 3: ["d"]}
+
+
+def test_movie_on_several_services_matched_once():
+    index = SubscriptionIndex()
+    index.add(Subscription(1))
+    assert [m.service for m in index.match([make_movie("a"), make_movie("a", service="disney")])[1]] == ["netflix"]
+
+
+def test_add_replaces_and_remove_cleans_index():
+    index = SubscriptionIndex()
+    index.add(Subscription(1, services=("netflix",)))
+    index.add(Subscription(1, services=("disney",), genres=("Horror",)))
+    assert len(index) == 1 and index.services() == {"disney"}
+    assert index.match([make_movie("a")]) == {}
+    assert index.remove(1)
+    assert not index.remove(1)
+    assert index.services() == set()
+    assert index.match([make_movie("a", service="disney", genres=("horror",))]) == {}
+
+
+def test_movie_matching_several_pairs_of_a_subscription_matched_once():
+    index = SubscriptionIndex()
+    index.add(Subscription(1, services=("netflix", "disney"), genres=("actie", "horror")))
+    index.add(Subscription(2, min_rating=8))
+    movie = Movie.create(title="a", release_year="2020", rating=7.0, num_votes=20000, genres=("Actie", "Horror"),
+                         director=None, path="a", service="netflix")
+    assert index.match([movie, movie]) == {1: [movie]}
+    assert sorted(s.chat_id for s in index) == [1, 2]
+
+
+def test_subscriptions_survive_a_restart(tmp_path):
+    path = str(tmp_path / "subscriptions.db")
+    index = SubscriptionIndex(SQLiteStore(path))
+    index.add(Subscription(1, services=("netflix",), min_rating=6))
+    index.add(Subscription(2, genres=("horror",)))
+    index.remove(2)
+    restarted = SubscriptionIndex(SQLiteStore(path))
+    assert list(restarted) == [Subscription(1, services=("netflix",), min_rating=6)]
+    assert restarted.services() == {"netflix"}
+    assert list(restarted.match([make_movie("a")])) == [1]
+
+
+def test_refresh_picks_up_subscriptions_of_other_instances():
+    shared = MemoryStore()
+    first, second = SubscriptionIndex(shared), SubscriptionIndex(shared)
+    first.add(Subscription(1))
+    assert len(second) == 0
+    second.refresh()
+    assert second.get(1) == Subscription(1)
+    second.remove(1)
+    first.refresh()
+    assert len(first) == 0
+
+
+def test_bot_watches_the_services_of_stored_subscriptions():
+    shared = MemoryStore()
+    SubscriptionIndex(shared).add(Subscription(1, services=("disney",)))
+    fv_bot = bot.FilmVandaagBot({"TG_FV_BOT_TOKEN": "123456:test"}, FilmVandaagScraper({}), subscription_store=shared)
+    assert fv_bot.subscriptions.get(1) is not None
+    assert fv_bot.scraper.watched_services == {"disney"}
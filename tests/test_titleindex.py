@@ -0,0 +1,88 @@
+from models import Movie
+from scraper import FilmVandaagScraper
+from test_scraper_concurrent import fake_get
+from titleindex import TitleIndex, normalize, trigrams
+
+
+def movie(title, year=2000, director=None, path=None, num_votes=10000, rating=7.0, service=None):
+    return Movie.create(title=title, release_year=str(year), rating=rating, num_votes=num_votes, genres=[],
+                        director=director, path=path or f"/film/{year}-{normalize(title).replace(' ', '-')}",
+                        service=service)
+
+
+def titles(matches):
+    return [m.movie.title for m in matches]
+
+
+def make_index():
+    index = TitleIndex()
+    index.add([movie("The Godfather", 1972, "Francis Ford Coppola", num_votes=2000000),
+               movie("The Godfather Part II", 1974, "Francis Ford Coppola", num_votes=1300000),
+               movie("Amélie", 2001, "Jean-Pierre Jeunet", service="netflix"),
+               movie("Godzilla", 2014, "Gareth Edwards"),
+               movie("Dune", 1984, "David Lynch"),
+               movie("Dune", 2021, "Denis Villeneuve")])
+    return index
+
+
+def test_normalize_and_trigrams():
+    assert normalize("Amélie (2001)") == "amelie 2001"
+    assert trigrams("dune") == ("  d", " du", "dun", "une", "ne ")
+    assert trigrams("dune", prefix=True) == ("  d", " du", "dun", "une")
+
+
+def test_exact_prefix_and_typo_matches():
+    index = make_index()
+    assert titles(index.search("the godfather"))[:2] == ["The Godfather", "The Godfather Part II"]
+    assert titles(index.search("godf"))[:2] == ["The Godfather", "The Godfather Part II"]
+    assert titles(index.search("amelie"))[0] == "Amélie"
+    assert titles(index.search("godzila"))[0] == "Godzilla"
+    assert index.search("zzzzqqq") == []
+
+
+def test_director_and_year():
+    index = make_index()
+    assert titles(index.search("coppola")) == ["The Godfather", "The Godfather Part II"]
+    assert [m.movie.release_year for m in index.search("dune 2021")][:2] == [2021, 1984]
+    assert [m.movie.release_year for m in index.search("dune 1984")][0] == 1984
+
+
+def test_adding_again_updates_rating_and_merges_services():
+    index = make_index()
+    amelie = index.search("amelie")[0].movie
+    assert index.add([movie("Amélie", 2001, "Jean-Pierre Jeunet", path=amelie.path, rating=8.3)],
+                     service="disney") == 0
+    updated = index.search("amelie")[0].movie
+    assert updated.rating == 8.3 and updated.services == ("netflix", "disney")
+    index.add([movie("Amelie from Montmartre", 2001, path=amelie.path)])
+    assert titles(index.search("montmartre")) == ["Amelie from Montmartre"]
+    assert len(index) == 6
+
+
+def test_removed_movies_are_not_found_and_compacted():
+    index = make_index()
+    index.remove(index.search("godzilla")[0].movie.path)
+    assert "Godzilla" not in titles(index.search("godzilla"))
+    for i in range(3000):
+        index.add([movie(f"Filler {i}", path=f"/film/{i}-filler")])
+    for i in range(3000):
+        index.remove(f"/film/{i}-filler")
+    assert len(index._entries) < 3000 and titles(index.search("godfather"))[0] == "The Godfather"
+
+
+def test_scraped_listings_are_indexed(monkeypatch):
+    scraper = FilmVandaagScraper({})
+    monkeypatch.setattr(scraper.http.session, "get", fake_get())
+    listing = list(scraper.scrape_new_movies(["netflix"], added_days_ago=100000, votes_threshold=0))
+    first = listing[0]
+    match = scraper.titles.search(first.title)[0]
+    assert match.movie.path == first.path and match.movie.services == ("netflix",)
+
+
+def test_only_search_results_of_one_service_are_indexed(monkeypatch):
+    scraper = FilmVandaagScraper({})
+    monkeypatch.setattr(scraper.http, "get",
+                        lambda url, params, parse: [movie("Dune", year=2000 + len(params["vod[]"]))])
+    scraper._fetch_search_page({"vod[]": ["netflix", "disney"]})  # the bot's /zoek
+    scraper._fetch_search_page({"vod[]": ["disney"]})
+    assert [(m.movie.release_year, m.movie.services) for m in scraper.titles.search("dune")] == [(2001, ("disney",))]